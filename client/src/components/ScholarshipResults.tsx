@@ -5,8 +5,8 @@ import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { useToast } from "@/hooks/use-toast";
-import { apiRequest } from "@/lib/queryClient";
-import type { ScholarshipMatch, StudentProfile, EssayResult } from "@shared/schema";
+import { apiRequest, waitForJob } from "@/lib/queryClient";
+import type { ScholarshipMatch, StudentProfile, EssayResult, GenerateEssayResponse } from "@shared/schema";
 
 interface ScholarshipResultsProps {
   scholarships: ScholarshipMatch[];
@@ -40,7 +40,8 @@ export function ScholarshipResults({
           studentProfile: profile,
         }
       );
-      const data = await response.json() as EssayResult;
+      const job = await response.json() as GenerateEssayResponse;
+      const data = await waitForJob<EssayResult>(job.id);
       return { result: data, scholarship };
     },
     onSuccess: ({ result, scholarship }) => {
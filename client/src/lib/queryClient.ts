@@ -23,6 +23,20 @@ export async function apiRequest(
   return res;
 }
 
+// Poll an essay job (see POST /api/generate-essay) until it finishes; resolves with its
+// result, or throws with its error
+export async function waitForJob<T>(jobId: string, intervalMs = 1500): Promise<T> {
+  while (true) {
+    const res = await apiRequest("GET", `/api/jobs/${jobId}`);
+    const job = await res.json();
+    if (job.status === "succeeded") return job.result as T;
+    if (job.status === "failed" || job.status === "cancelled") {
+      throw new Error(job.error || `Essay generation ${job.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 type UnauthorizedBehavior = "returnNull" | "throw";
 export const getQueryFn: <T>(options: {
   on401: UnauthorizedBehavior;
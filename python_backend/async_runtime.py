@@ -0,0 +1,71 @@
+import os
+import asyncio
+import threading
+
+import claude_client
+import tracing
+
+# Shared asyncio plumbing for the Python backend. One event loop per thread (so just one
+# in worker mode), so the AsyncAnthropic client's connection pool survives between
+# requests. Threads get their own loop and client, which lets callers like the
+# benchmark harness run synchronous pipelines from a thread pool.
+
+_thread_state = threading.local()
+
+
+def run_async(coro):
+    """Run a coroutine to completion on this thread's event loop."""
+    loop = getattr(_thread_state, "event_loop", None)
+    if loop is None:
+        loop = _thread_state.event_loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
+
+
+def get_async_claude_client():
+    """Return this thread's AsyncAnthropic client, creating it on first use."""
+    client = getattr(_thread_state, "claude_client", None)
+    if client is None:
+        import anthropic
+        # No SDK retries: claude_client retries, so every 429/529 reaches the limiter
+        # and the breaker
+        client = _thread_state.claude_client = anthropic.AsyncAnthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY"), max_retries=0
+        )
+    return client
+
+
+async def create_message(hedge=False, **request):
+    """messages.create on the async client, through the claude_client limiter, breaker and retries.
+
+    hedge=True marks short classification calls that may be hedged when slow.
+    """
+    return await claude_client.resilient_create(get_async_claude_client(), request, hedge=hedge)
+
+
+async def create_parsed(parse, **request):
+    """create_message, returning parse(reply text); a reply that doesn't parse gets one repair retry."""
+    response = await create_message(**request)
+    tracing.record_usage(response)
+    text = response.content[0].text.strip()
+    try:
+        return parse(text)
+    except (ValueError, KeyError, TypeError) as e:
+        tracing.count("repairs")
+        response = await create_message(**claude_client.repair_request(request, text, e))
+        tracing.record_usage(response)
+        return parse(response.content[0].text.strip())
+
+
+def create_message_sync(hedge=False, **request):
+    """create_message for synchronous code, run on this thread's event loop."""
+    return run_async(create_message(hedge=hedge, **request))
+
+
+def cached_system(*texts):
+    """System prompt blocks, each marked as a prompt-cache breakpoint.
+
+    The API caches the request prefix (tools, then system blocks) up to each marked
+    block, so only static text belongs here; per-request content goes in the messages.
+    Prefixes shorter than the model's minimum (1024 tokens for Sonnet) aren't cached.
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}} for text in texts]
@@ -0,0 +1,194 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+
+import embeddings
+import llm_cache
+import scholarship_matcher
+from async_runtime import run_async
+from scholarship_matcher import (
+    build_raw_profile, analyze_profile_async, search_many, llm_rerank_async
+)
+
+# Batch matching for whole cohorts of students.
+#
+#   python3 python_backend/batch_matcher.py < profiles.jsonl > results.jsonl
+#
+# Input is JSONL, one profile per line: either {"id": ..., "studentProfile": {...}} or
+# a bare profile object. Profiles are processed in chunks: Claude analysis with bounded
+# concurrency, one batched embedding call, one multi-query Chroma call, then concurrent
+# reranks. Output is JSONL, streamed as each profile finishes:
+#
+#   {"type": "result", "index": 0, "id": ..., "matches": [...]}   (+ "degraded": true if a stage fell back)
+#   {"type": "error",  "index": 1, "id": ..., "error": "..."}
+#   {"type": "summary", "profiles": 2, "succeeded": 1, "failed": 1, "seconds": ..., "profiles_per_sec": ...}
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_MATCH_CONCURRENCY", "8"))
+CHUNK_SIZE = int(os.environ.get("BATCH_MATCH_CHUNK_SIZE", "32"))
+
+
+def read_profiles(lines):
+    """Yield {"index", "id", "profile"} items, or {"index", "id", "error"} for bad lines."""
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("expected a JSON object")
+            profile = item.get("studentProfile", item)
+            yield {"index": index, "id": item.get("id", index), "profile": profile}
+        except ValueError as e:
+            yield {"index": index, "id": index, "error": f"Invalid profile line: {e}"}
+        index += 1
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _match_chunk(chunk, semaphore, emit):
+    """Run every stage for one chunk of profiles, emitting a line per profile."""
+
+    def fail(item, message):
+        emit({"type": "error", "index": item["index"], "id": item["id"], "error": message})
+
+    # Stages that fell back for each profile, as match_scholarships tracks them. Each
+    # gather() task has its own context, so setting the variable there is per profile.
+    failures = {item["index"]: [] for item in chunk}
+
+    # Stage 1: extraction + enhancement per profile, bounded concurrency
+    async def analyze(item):
+        scholarship_matcher._failures.set(failures[item["index"]])
+        async with semaphore:
+            return await analyze_profile_async(build_raw_profile(item["profile"]))
+
+    analyses = await asyncio.gather(*(analyze(item) for item in chunk), return_exceptions=True)
+
+    analyzed = []
+    for item, analysis in zip(chunk, analyses):
+        if isinstance(analysis, BaseException):
+            fail(item, f"Profile analysis failed: {analysis}")
+        else:
+            analyzed.append((item, *analysis))
+    if not analyzed:
+        return
+
+    # Stage 2: one embedding request for the whole chunk
+    try:
+        vectors = await asyncio.to_thread(
+            embeddings.get_embedding_service().embed_many,
+            [enhanced for _, _, enhanced in analyzed]
+        )
+    except Exception as e:
+        for item, _, _ in analyzed:
+            fail(item, f"Embedding failed: {e}")
+        return
+
+    # Stage 3: one multi-query vector search (per distinct eligibility filter)
+    try:
+        match_lists = await asyncio.to_thread(
+            search_many, vectors,
+            [structured for _, structured, _ in analyzed], 15
+        )
+    except Exception as e:
+        for item, _, _ in analyzed:
+            fail(item, f"Vector search failed: {e}")
+        return
+
+    # Stage 4: rerank concurrently; each result goes out as soon as it is ready
+    async def rerank(item, structured, enhanced, matches):
+        scholarship_matcher._failures.set(failures[item["index"]])
+        try:
+            async with semaphore:
+                ranked = await llm_rerank_async(enhanced, structured, matches, top_k=5)
+            result = {"type": "result", "index": item["index"], "id": item["id"], "matches": ranked}
+            if failures[item["index"]]:
+                result["degraded"] = True
+            emit(result)
+        except Exception as e:
+            fail(item, f"Re-ranking failed: {e}")
+
+    await asyncio.gather(*(
+        rerank(item, structured, enhanced, matches)
+        for (item, structured, enhanced), matches in zip(analyzed, match_lists)
+    ))
+
+
+def match_batch(lines, emit, concurrency=BATCH_CONCURRENCY, chunk_size=CHUNK_SIZE):
+    """Match every profile in a JSONL stream; returns the summary dict (also emitted)."""
+    start = time.time()
+    counts = {"profiles": 0, "succeeded": 0, "failed": 0}
+
+    def record(message):
+        counts["profiles"] += 1
+        counts["succeeded" if message["type"] == "result" else "failed"] += 1
+        emit(message)
+
+    async def run_chunk(chunk):
+        semaphore = asyncio.Semaphore(concurrency)
+        await _match_chunk(chunk, semaphore, record)
+
+    for chunk in _chunks(read_profiles(lines), chunk_size):
+        valid = []
+        for item in chunk:
+            if "error" in item:
+                record({"type": "error", "index": item["index"], "id": item["id"], "error": item["error"]})
+            else:
+                valid.append(item)
+        if valid:
+            run_async(run_chunk(valid))
+
+    seconds = time.time() - start
+    summary = {
+        "type": "summary",
+        **counts,
+        "seconds": round(seconds, 2),
+        "profiles_per_sec": round(counts["profiles"] / seconds, 3) if seconds > 0 else None
+    }
+    emit(summary)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match a JSONL stream of student profiles")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="Maximum concurrent Claude calls")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="Profiles embedded and searched together")
+    parser.add_argument("--bypass-cache", action="store_true")
+    args = parser.parse_args()
+
+    # Every profile needs Claude; fail once instead of once per profile
+    if not os.environ.get("ANTHROPIC_API_KEY"):
+        print("ANTHROPIC_API_KEY environment variable is required", file=sys.stderr)
+        sys.exit(1)
+
+    # Keep stdout for result lines only
+    results_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    def emit(message):
+        results_out.write(json.dumps(message) + "\n")
+        results_out.flush()
+
+    if args.bypass_cache:
+        with llm_cache.bypass():
+            summary = match_batch(sys.stdin, emit, args.concurrency, args.chunk_size)
+    else:
+        summary = match_batch(sys.stdin, emit, args.concurrency, args.chunk_size)
+
+    print(f"Matched {summary['profiles']} profiles in {summary['seconds']}s "
+          f"({summary['profiles_per_sec']} profiles/sec, {summary['failed']} failed)", file=sys.stderr)
@@ -0,0 +1,547 @@
+import sys
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import platform
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline benchmark for the match and essay pipelines.
+#
+#   python3 python_backend/benchmark.py --sizes 200,10000 --concurrency 1,4,16
+#
+# Claude is replaced by a fake client with configurable latency and canned replies,
+# embeddings by the in-process stub backend (plus optional latency), and the corpus by
+# a synthetic Chroma collection of the requested size (built once and kept under
+# --data-dir). Each pipeline is driven from a thread pool at fixed concurrency; the
+# per-stage numbers come from the trace every result carries (see tracing.py).
+# Results are written as JSON so runs can be compared in review.
+#
+# --rankings llm,hybrid,local runs the match pipeline once per ranking mode and reports,
+# next to each non-llm run, its agreement with the llm rankings and the latency saved.
+# The fake reranker keeps vector order, so for real agreement numbers add --live-claude.
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), "benchmark_results.json")
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), ".cache", "benchmark")
+
+DIMENSIONS = 768
+ADD_BATCH_SIZE = 5000
+
+THEMES = [
+    "STEM research", "community service", "leadership", "the arts", "entrepreneurship",
+    "environmental action", "first-generation students", "athletics", "healthcare",
+    "public policy", "indigenous communities", "women in engineering"
+]
+FIELDS = ["Computer Science", "Biology", "Nursing", "History", "Mechanical Engineering",
+          "Economics", "Music", "Political Science", "Environmental Science", "Education"]
+DEGREE_LEVELS = ["High School", "Undergraduate", "Graduate"]
+CITIZENSHIPS = ["Canadian", "American", "Permanent Resident", ""]
+
+
+# --- Fake Anthropic client -------------------------------------------------------
+
+# Minimum cacheable prefix, as for Sonnet; shorter prefixes are never cached
+PROMPT_CACHE_MIN_TOKENS = 1024
+CACHE_READ_COST = 0.1  # cached prefix tokens cost this fraction of uncached ones
+
+_cached_prefixes = set()
+
+
+class FakeLatency:
+    """base + uniform jitter + per-token time (prompt and output), in seconds."""
+
+    def __init__(self, base_ms=500, jitter_ms=200, ms_per_token=2, ms_per_input_token=0.05):
+        self.base = base_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.per_token = ms_per_token / 1000
+        self.per_input_token = ms_per_input_token / 1000
+
+    def sample(self, usage):
+        prompt_tokens = (usage.input_tokens + usage.cache_creation_input_tokens
+                         + usage.cache_read_input_tokens * CACHE_READ_COST)
+        return (self.base + random.uniform(0, self.jitter) + usage.output_tokens * self.per_token
+                + prompt_tokens * self.per_input_token)
+
+
+def _text_of(content):
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+def _prompt_text(request):
+    return _text_of(request.get("system")) + "\n" + _text_of(request["messages"][-1]["content"])
+
+
+def _profile_field(prompt, label):
+    match = re.search(rf"^{label}: (.*)$", prompt, re.M)
+    value = match.group(1).strip() if match else ""
+    return None if value in ("", "N/A") else value
+
+
+def canned_reply(request):
+    """A plausible reply for each of the pipeline's prompts, picked by prompt content."""
+    prompt = _prompt_text(request)
+
+    if "Extract eligibility information" in prompt:
+        gpa = _profile_field(prompt, "GPA")
+        return json.dumps({
+            "gpa": float(gpa) if gpa else None,
+            "degree_level": (_profile_field(prompt, "Degree Level") or "unknown").lower(),
+            "field_of_study": _profile_field(prompt, "Field of Study"),
+            "citizenship": _profile_field(prompt, "Citizenship"),
+            "age": None,
+            "key_activities": ["robotics club captain", "food bank volunteer", "peer tutor"]
+        })
+
+    if "enhanced description optimized for scholarship matching" in prompt:
+        return " ".join(["The student leads community initiatives and research projects."] * 25)
+
+    if "expert scholarship advisor" in prompt:
+        candidate_ids = [int(i) for i in re.findall(r'"id":\s*(\d+)', prompt)]
+        return json.dumps({"rankings": [
+            {"rank": rank, "scholarship_id": candidate_id, "scholarship_name": f"Scholarship {candidate_id}",
+             "match_score": 95 - rank * 5, "reasoning": "Strong alignment with the emphasis areas.",
+             "key_strengths": ["leadership", "service"]}
+            for rank, candidate_id in enumerate(candidate_ids[:5], 1)
+        ]})
+
+    if "matching scholarship descriptions to writing strategies" in prompt:
+        return "[1, 3, 5]"
+
+    if "whether a student can execute" in prompt:
+        return "[1, 3]"
+
+    if "committee reviewer" in prompt:
+        drafts = len(re.findall(r"--- DRAFT \d+", prompt))
+        return json.dumps({"scores": [{"draft": i, "score": 80 + i} for i in range(1, drafts + 1)],
+                           "best_draft": drafts, "reasoning": "Most specific and best structured."})
+
+    if "skilled scholarship essay writer" in prompt:
+        return " ".join(["I learned that leadership means listening before acting."] * 60)
+
+    return "{}"
+
+
+def _fake_response(request):
+    text = canned_reply(request)
+    prompt_tokens = len(json.dumps([request.get("tools"), request.get("system"), request["messages"]])) // 4
+
+    # Mimic prompt caching: the tools + system prefix is cached if it is marked and long enough
+    cached_tokens, cache_hit = 0, False
+    system = request.get("system")
+    if isinstance(system, list) and any("cache_control" in block for block in system):
+        prefix = json.dumps([request.get("tools"), system])
+        if len(prefix) // 4 >= PROMPT_CACHE_MIN_TOKENS:
+            cached_tokens = len(prefix) // 4
+            cache_hit = prefix in _cached_prefixes
+            _cached_prefixes.add(prefix)
+
+    usage = SimpleNamespace(
+        input_tokens=prompt_tokens - cached_tokens,
+        output_tokens=len(text) // 4,
+        cache_read_input_tokens=cached_tokens if cache_hit else 0,
+        cache_creation_input_tokens=0 if cache_hit else cached_tokens
+    )
+    if request.get("tools"):
+        # Tool-use requests get the canned JSON back as the first tool's input
+        block = SimpleNamespace(type="tool_use", id="toolu_benchmark", name=request["tools"][0]["name"],
+                                input=json.loads(text))
+        return SimpleNamespace(content=[block], usage=usage, stop_reason="tool_use")
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)], usage=usage,
+                           stop_reason="end_turn")
+
+
+class FakeMessages:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, **request):
+        response = _fake_response(request)
+        time.sleep(self.latency.sample(response.usage))
+        return response
+
+
+class FakeAsyncMessages:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def create(self, **request):
+        response = _fake_response(request)
+        await asyncio.sleep(self.latency.sample(response.usage))
+        return response
+
+
+class FakeAnthropic:
+    def __init__(self, latency):
+        self.messages = FakeMessages(latency)
+
+
+class FakeAsyncAnthropic:
+    def __init__(self, latency):
+        self.messages = FakeAsyncMessages(latency)
+
+
+# --- Synthetic data --------------------------------------------------------------
+
+def synthetic_scholarship(rng, i):
+    """(name, document, metadata) for one made-up scholarship."""
+    theme = rng.choice(THEMES)
+    field = rng.choice(FIELDS)
+    levels = rng.sample(DEGREE_LEVELS, rng.randint(1, 2)) if rng.random() < 0.6 else []
+    citizenship = rng.choice(CITIZENSHIPS) if rng.random() < 0.4 else ""
+    gpa = rng.choice(["", "", "2.5", "3.0", "3.3", "3.5"])
+    amount = rng.choice([500, 1000, 2500, 5000, 10000])
+    name = f"Synthetic {theme.title()} Award {i:06d}"
+
+    document = (
+        f"{name}\n\nThe {name} supports students in {field} who have shown commitment to {theme}. "
+        f"Applicants should describe a project or experience where they made a measurable difference, "
+        f"the obstacles they faced, and how the award will help them continue. Award amount: ${amount}. "
+        f"Eligibility: {', '.join(levels) or 'all levels of study'}"
+        f"{'; ' + citizenship + ' citizens only' if citizenship else ''}"
+        f"{'; minimum GPA ' + gpa if gpa else ''}."
+    )
+    metadata = {
+        "name": name,
+        "url": f"https://example.org/scholarships/{i}",
+        "minimum_gpa": gpa,
+        "degree_levels": ", ".join(levels),
+        "citizenship": citizenship,
+        "fields_of_study": field,
+        "emphasis_areas": theme,
+        "award_amount": str(amount)
+    }
+    return name, document, metadata
+
+
+def synthetic_profile(rng, i):
+    """A student profile in the shape the client form sends."""
+    return {
+        "name": f"Student {i}",
+        "gpa": f"{rng.uniform(2.4, 4.0):.2f}",
+        "degreeLevel": rng.choice(DEGREE_LEVELS),
+        "fieldOfStudy": rng.choice(FIELDS),
+        "citizenship": rng.choice(CITIZENSHIPS),
+        "age": str(rng.randint(16, 30)),
+        "activities": f"Captain of the {rng.choice(THEMES)} club; volunteer #{i} at the food bank",
+        "backgroundStory": f"Grew up interested in {rng.choice(THEMES)}.",
+        "careerGoals": f"Work in {rng.choice(FIELDS)}.",
+        "challenges": "Balanced part-time work with school."
+    }
+
+
+def build_synthetic_collection(size, seed=0, data_dir=DEFAULT_DATA_DIR):
+    """Open (building on first use) a synthetic `scholarships` collection of `size` rows."""
+    import chromadb
+    import numpy as np
+    import eligibility
+
+    path = os.path.join(data_dir, f"chroma-{size}-{seed}")
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection("scholarships", metadata={"hnsw:space": "cosine"})
+    if collection.count() == size:
+        return client
+
+    print(f"Building synthetic collection of {size} scholarships in {path}", file=sys.stderr)
+    client.delete_collection("scholarships")
+    collection = client.create_collection("scholarships", metadata={"hnsw:space": "cosine"})
+
+    rng = random.Random(seed)
+    vector_rng = np.random.default_rng(seed)
+    for start in range(0, size, ADD_BATCH_SIZE):
+        rows = [synthetic_scholarship(rng, i) for i in range(start, min(start + ADD_BATCH_SIZE, size))]
+        vectors = vector_rng.standard_normal((len(rows), DIMENSIONS)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        collection.add(
+            ids=[name for name, _, _ in rows],
+            documents=[document for _, document, _ in rows],
+            metadatas=[{**metadata, **eligibility.normalize_eligibility(metadata)}
+                       for _, _, metadata in rows],
+            embeddings=vectors.tolist()
+        )
+    return client
+
+
+class _RowsCollection:
+    """Just enough of a Chroma collection (count, paged get) for vector_index.export."""
+
+    def __init__(self, ids, documents, metadatas, vectors):
+        self.ids, self.documents, self.metadatas, self.vectors = ids, documents, metadatas, vectors
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include=None, limit=None, offset=0):
+        end = len(self.ids) if limit is None else offset + limit
+        return {"ids": self.ids[offset:end], "documents": self.documents[offset:end],
+                "metadatas": self.metadatas[offset:end], "embeddings": self.vectors[offset:end]}
+
+
+def build_synthetic_index(size, seed=0, data_dir=DEFAULT_DATA_DIR):
+    """Directory of an exported vector index (see vector_index.py) of `size` synthetic rows.
+
+    Same rows as build_synthetic_collection, without needing chromadb.
+    """
+    import numpy as np
+    import vector_index
+
+    directory = os.path.join(data_dir, f"vector-index-{size}-{seed}")
+    metadata_path = os.path.join(directory, vector_index.METADATA_FILE)
+    if os.path.exists(metadata_path):
+        return directory
+
+    print(f"Building synthetic vector index of {size} scholarships in {directory}", file=sys.stderr)
+    rng = random.Random(seed)
+    rows = [synthetic_scholarship(rng, i) for i in range(size)]
+    vectors = np.random.default_rng(seed).standard_normal((size, DIMENSIONS)).astype(np.float32)
+    collection = _RowsCollection([name for name, _, _ in rows], [document for _, document, _ in rows],
+                                 [metadata for _, _, metadata in rows], vectors)
+    vector_index.export(collection, directory)
+    return directory
+
+
+# --- Harness ---------------------------------------------------------------------
+
+class SlowStubBackend:
+    """The stub embedding backend plus a fixed per-batch delay."""
+
+    def __init__(self, latency_ms):
+        from embeddings import StubEmbeddingBackend
+        self.stub = StubEmbeddingBackend()
+        self.latency = latency_ms / 1000
+
+    def embed_batch(self, texts):
+        time.sleep(self.latency)
+        return self.stub.embed_batch(texts)
+
+    def warm_up(self):
+        pass
+
+
+def install_fakes(latency, embed_latency_ms, llm_cache_enabled=False, fake_claude=True):
+    """Import the pipelines with every network dependency replaced; returns the modules.
+
+    With fake_claude=False the real Claude API is used (ANTHROPIC_API_KEY must be set).
+    """
+    if fake_claude:
+        os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+    os.environ["PIPELINE_TRACING"] = "1"
+    os.environ["EMBEDDING_BACKEND"] = "stub"
+    if not llm_cache_enabled:
+        # The same profiles are sent in every run, so per-profile reuse would skew them too
+        os.environ["LLM_CACHE_DISABLED"] = "1"
+        os.environ["PROFILE_ARTIFACTS_DISABLED"] = "1"
+
+    import async_runtime
+    import embeddings
+    import scholarship_matcher
+    import essay_generator
+
+    if fake_claude:
+        async_client = FakeAsyncAnthropic(latency)
+        async_runtime.get_async_claude_client = lambda: async_client
+        scholarship_matcher._claude_client = FakeAnthropic(latency)
+        essay_generator._claude_client = FakeAnthropic(latency)
+    embeddings._service = embeddings.EmbeddingService(
+        backend=SlowStubBackend(embed_latency_ms),
+        cache=embeddings.EmbeddingCache(db_path=None)
+    )
+    essay_generator._generator = essay_generator.EssayGenerator(
+        os.path.join(os.path.dirname(__file__), "strategy_map.json")
+    )
+    return scholarship_matcher, essay_generator
+
+
+def percentiles(values):
+    """Nearest-rank p50/p95/p99 plus mean, in the input's units, rounded."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(q):
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    return {
+        "p50": round(rank(50), 1),
+        "p95": round(rank(95), 1),
+        "p99": round(rank(99), 1),
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "count": len(ordered)
+    }
+
+
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+def run_load(call, inputs, concurrency):
+    """Run call(input) for every input on `concurrency` threads; returns the summary."""
+    latencies, stages, tokens, errors = [], {}, {}, []
+
+    def timed(item):
+        started = time.perf_counter()
+        result = call(item)
+        return (time.perf_counter() - started) * 1000, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency_ms, result in pool.map(timed, inputs):
+            latencies.append(latency_ms)
+            if "error" in result:
+                errors.append(result["error"])
+            for span in result.get("trace", {}).get("spans", []):
+                stages.setdefault(span["name"], []).append(span["ms"])
+                if "input_tokens" in span:
+                    totals = tokens.setdefault(span["name"], dict.fromkeys(TOKEN_FIELDS + ("requests",), 0))
+                    for field in TOKEN_FIELDS:
+                        totals[field] += span.get(field, 0)
+                    totals["requests"] += 1
+    seconds = time.perf_counter() - started
+
+    return {
+        "requests": len(inputs),
+        "errors": len(errors),
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(inputs) / seconds, 3),
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {name: percentiles(values) for name, values in stages.items()},
+        "stage_tokens_per_request": {
+            name: {field: round(totals[field] / totals["requests"]) for field in TOKEN_FIELDS}
+            for name, totals in tokens.items()
+        },
+        "sample_errors": errors[:3]
+    }
+
+
+def ranking_agreement(reference, ranked, k=5):
+    """How closely rankings agree with the reference ones (same profile keys).
+
+    top1: share of profiles with the same best match; overlap_at_k: mean share of the
+    reference top k that also made the other top k.
+    """
+    shared = [key for key in reference if key in ranked and reference[key]]
+    if not shared:
+        return None
+    top1 = sum(bool(ranked[key]) and ranked[key][0] == reference[key][0] for key in shared)
+    overlap = sum(len(set(reference[key][:k]) & set(ranked[key][:k])) / len(reference[key][:k])
+                  for key in shared)
+    return {"profiles": len(shared), "top1": round(top1 / len(shared), 3),
+            f"overlap_at_{k}": round(overlap / len(shared), 3)}
+
+
+def _latency_saved(reference_run, run):
+    saved = {}
+    for field in ("p50", "p95", "mean"):
+        reference_ms = (reference_run.get("latency_ms") or {}).get(field)
+        run_ms = (run.get("latency_ms") or {}).get(field)
+        if reference_ms is not None and run_ms is not None:
+            saved[field] = round(reference_ms - run_ms, 1)
+    return saved
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the match and essay pipelines")
+    parser.add_argument("--pipelines", default="match,essay")
+    parser.add_argument("--sizes", type=_int_list, default=[200, 10000, 100000],
+                        help="Synthetic collection sizes for the match pipeline")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per run")
+    parser.add_argument("--drafts", type=int, default=1, help="Drafts per essay request")
+    parser.add_argument("--claude-latency-ms", type=float, default=500)
+    parser.add_argument("--claude-jitter-ms", type=float, default=200)
+    parser.add_argument("--claude-ms-per-token", type=float, default=2)
+    parser.add_argument("--claude-ms-per-input-token", type=float, default=0.05)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-cache", action="store_true", help="Leave the LLM response cache on")
+    parser.add_argument("--rankings", default="llm",
+                        help="Match ranking modes to run (llm, hybrid, local); the others are compared with llm")
+    parser.add_argument("--live-claude", action="store_true",
+                        help="Call the real Claude API instead of the fake (needs ANTHROPIC_API_KEY)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    pipelines = [name.strip() for name in args.pipelines.split(",") if name.strip()]
+    latency = FakeLatency(args.claude_latency_ms, args.claude_jitter_ms, args.claude_ms_per_token,
+                          args.claude_ms_per_input_token)
+    matcher, essays = install_fakes(latency, args.embed_latency_ms, args.llm_cache, not args.live_claude)
+    rankings = sorted({name.strip() for name in args.rankings.split(",") if name.strip()},
+                      key=lambda name: name != "llm")
+
+    rng = random.Random(args.seed)
+    profiles = [synthetic_profile(rng, i) for i in range(args.requests)]
+    runs = []
+
+    def record(run):
+        runs.append(run)
+        latency_ms = run["latency_ms"] or {}
+        agreement = run.get("agreement_with_llm")
+        ranking = f" ranking={run['ranking']}" if "ranking" in run else ""
+        top1 = f", top-1 agreement with llm {agreement['top1']}" if agreement else ""
+        print(f"{run['pipeline']:>5} size={run['collection_size']} concurrency={run['concurrency']}{ranking}: "
+              f"{run['throughput_rps']} req/s, p50 {latency_ms.get('p50')}ms, "
+              f"p99 {latency_ms.get('p99')}ms, {run['errors']} errors{top1}", file=sys.stderr)
+
+    if "match" in pipelines:
+        for size in args.sizes:
+            matcher._chroma_client = build_synthetic_collection(size, args.seed, args.data_dir)
+            matcher._collection = None
+            matcher.match_scholarships(profiles[0])  # warm-up, not measured
+            reference_ranked, reference_runs = None, {}
+            for ranking in rankings:
+                ranked = {}
+
+                def match(profile, ranking=ranking, ranked=ranked):
+                    result = matcher.match_scholarships(profile, ranking)
+                    ranked[profile["name"]] = [m["scholarship"] for m in result.get("matches", [])]
+                    return result
+
+                for concurrency in args.concurrency:
+                    run = {"pipeline": "match", "collection_size": size, "concurrency": concurrency,
+                           "ranking": ranking, **run_load(match, profiles, concurrency)}
+                    if ranking == "llm":
+                        reference_runs[concurrency] = run
+                    elif reference_ranked is not None:
+                        run["agreement_with_llm"] = ranking_agreement(reference_ranked, ranked)
+                        run["latency_saved_ms"] = _latency_saved(reference_runs[concurrency], run)
+                    record(run)
+                if ranking == "llm":
+                    reference_ranked = ranked
+
+    if "essay" in pipelines:
+        descriptions = [synthetic_scholarship(rng, i)[1] for i in range(args.requests)]
+        jobs = list(zip(descriptions, profiles))
+
+        def write_essay(job):
+            return essays.generate_essay(job[0], job[1], drafts=args.drafts)
+
+        for concurrency in args.concurrency:
+            run = run_load(write_essay, jobs, concurrency)
+            record({"pipeline": "essay", "collection_size": None, "concurrency": concurrency, **run})
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "data_dir")},
+        "matcher": {"rerank_mode": matcher.RERANK_MODE, "rerank_shards": matcher.RERANK_SHARDS,
+                    "hybrid_keep": matcher.HYBRID_KEEP},
+        "runs": runs
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote benchmark results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
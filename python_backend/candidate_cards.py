@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+# Compact candidate cards for the rerank prompt.
+#
+# Instead of every candidate's full text, the reranker sees one line of JSON per
+# scholarship: its name, a short summary and only the metadata that matters for
+# fit. The summary is the `summary` metadata field when the collection has one
+# (written once by --backfill-summaries, or at ingest), else the description cut
+# down to CARD_DESCRIPTION_CHARS.
+#
+#   python3 python_backend/candidate_cards.py --backfill-summaries
+
+CARD_DESCRIPTION_CHARS = int(os.environ.get("RERANK_CARD_CHARS", "600"))
+CARD_METADATA_FIELDS = (
+    "emphasis_areas", "values_mission", "fields_of_study", "degree_levels",
+    "citizenship", "minimum_gpa", "award_amount"
+)
+SUMMARY_CONCURRENCY = 8
+
+
+def truncate_description(text, limit=CARD_DESCRIPTION_CHARS):
+    """Cut text to about `limit` characters, preferring a sentence (then word) boundary."""
+    text = " ".join((text or "").split())
+    if len(text) <= limit:
+        return text
+
+    cut = text[:limit]
+    sentence_end = cut.rfind(". ")
+    if sentence_end >= limit // 2:
+        return cut[:sentence_end + 1]
+    return cut[:cut.rfind(" ")].rstrip(",;:") + "…"
+
+
+def candidate_card(card_id, match):
+    """The rerank prompt's view of one vector search match."""
+    metadata = match.get("metadata") or {}
+    card = {
+        "id": card_id,
+        "name": match["scholarship"],
+        "summary": metadata.get("summary") or truncate_description(match.get("full_text", ""))
+    }
+    for field in CARD_METADATA_FIELDS:
+        value = metadata.get(field)
+        if value not in (None, ""):
+            card[field] = value
+    return card
+
+
+def format_cards(cards):
+    """One compact JSON object per line."""
+    return "\n".join(json.dumps(card, ensure_ascii=False, separators=(",", ":")) for card in cards)
+
+
+def _summary_prompt(document):
+    return f"""Summarize this scholarship for an advisor deciding which students it fits.
+
+{document}
+
+In at most 80 words, state who it is for, what it rewards or emphasizes, and any hard requirements. Respond with ONLY the summary."""
+
+
+async def summarize_documents_async(documents, concurrency=SUMMARY_CONCURRENCY):
+    """Claude summaries for several descriptions at once; None where a call failed."""
+    from async_runtime import create_message
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(document):
+        async with semaphore:
+            response = await create_message(
+                model="claude-sonnet-4-20250514",
+                max_tokens=200,
+                temperature=0.2,
+                messages=[{"role": "user", "content": _summary_prompt(document)}]
+            )
+            return response.content[0].text.strip()
+
+    summaries = await asyncio.gather(*(summarize(document) for document in documents), return_exceptions=True)
+    for summary in summaries:
+        if isinstance(summary, BaseException):
+            print(f"Summary failed: {summary!r}", file=sys.stderr)
+    return [None if isinstance(summary, BaseException) else summary for summary in summaries]
+
+
+def summarize_documents(documents, concurrency=SUMMARY_CONCURRENCY):
+    """Blocking wrapper around summarize_documents_async."""
+    from async_runtime import run_async
+    return run_async(summarize_documents_async(documents, concurrency))
+
+
+def backfill_summaries(collection, batch_size=100, concurrency=SUMMARY_CONCURRENCY):
+    """Add a `summary` metadata field to every row of the collection that lacks one."""
+    total = collection.count()
+    updated = 0
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=["metadatas", "documents"], limit=batch_size, offset=offset)
+        pending = [(scholarship_id, metadata or {}, document)
+                   for scholarship_id, metadata, document in zip(page["ids"], page["metadatas"], page["documents"])
+                   if not (metadata or {}).get("summary")]
+        if not pending:
+            continue
+
+        summaries = summarize_documents([document for _, _, document in pending], concurrency)
+        ids, metadatas = [], []
+        for (scholarship_id, metadata, _), summary in zip(pending, summaries):
+            if summary:
+                ids.append(scholarship_id)
+                metadatas.append({**metadata, "summary": summary})
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+            updated += len(ids)
+
+    print(f"Added summaries for {updated} of {total} scholarships", file=sys.stderr)
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Candidate card summaries for the scholarships collection")
+    parser.add_argument("--backfill-summaries", action="store_true",
+                        help="Summarize rows that don't have a summary yet")
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.backfill_summaries:
+        from scholarship_matcher import get_scholarships_collection
+        backfill_summaries(get_scholarships_collection(), concurrency=args.concurrency)
+    else:
+        parser.print_help()
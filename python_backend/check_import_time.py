@@ -0,0 +1,64 @@
+import sys
+import os
+import argparse
+import subprocess
+
+# Import-time budget for the scripts the Node server spawns.
+#
+#   python3 python_backend/check_import_time.py [--budget-ms 150]
+#
+# Imports each module in a fresh interpreter under `python -X importtime` (best of a
+# few runs, with no API keys set) and fails if it takes longer than the budget or pulls
+# in any of the heavy client libraries, which should only load on first use.
+
+MODULES = ("scholarship_matcher", "essay_generator", "batch_matcher")
+HEAVY_MODULES = ("anthropic", "chromadb", "numpy", "requests", "httpx", "sentence_transformers")
+BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "150"))
+RUNS = 3
+
+
+def measure(module):
+    """Return (cumulative import ms, set of top-level packages imported) for one fresh import."""
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("ANTHROPIC_API_KEY", "NOMIC_API_KEY")}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        capture_output=True, text=True, check=True
+    )
+
+    total_us = None
+    packages = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module and not name[1:].startswith(" "):
+            total_us = int(cumulative)
+    return total_us / 1000, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the Python backend's import-time budget")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        runs = [measure(module) for _ in range(RUNS)]
+        best_ms = min(ms for ms, _ in runs)
+        heavy = sorted(set(HEAVY_MODULES) & runs[0][1])
+
+        ok = best_ms <= args.budget_ms and not heavy
+        failed |= not ok
+        note = f", imports {', '.join(heavy)}" if heavy else ""
+        print(f"{'ok  ' if ok else 'FAIL'} {module}: {best_ms:.1f}ms (budget {args.budget_ms:.0f}ms){note}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+import tracing
+
+# Resilience layer under every Claude call (async_runtime.create_message and
+# create_message_sync route through resilient_create). Process-wide, shared by all
+# threads and event loops:
+#
+#   AdaptiveLimiter  AIMD concurrency limit: +1/limit per success, halved on 429/529
+#   RateBucket       optional requests/minute and input tokens/minute ceilings
+#   CircuitBreaker   after N consecutive failed calls, fail fast for a cooldown, then
+#                    let one probe call through
+#   Retries          jittered exponential backoff, honouring retry-after
+#   Hedging          opt-in (hedge=True) for short classification calls: once a call
+#                    runs past the p95 latency of its kind, send a duplicate and keep
+#                    whichever answers first
+#
+# repair_request() builds the single JSON repair retry used by llm_cache when a reply
+# doesn't parse.
+
+MAX_CONCURRENCY = int(os.environ.get("CLAUDE_MAX_CONCURRENCY", "16"))
+INITIAL_CONCURRENCY = int(os.environ.get("CLAUDE_INITIAL_CONCURRENCY", "8"))
+REQUESTS_PER_MINUTE = float(os.environ.get("CLAUDE_REQUESTS_PER_MINUTE", "0"))
+INPUT_TOKENS_PER_MINUTE = float(os.environ.get("CLAUDE_INPUT_TOKENS_PER_MINUTE", "0"))
+
+RETRY_ATTEMPTS = int(os.environ.get("CLAUDE_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+
+BREAKER_FAILURES = int(os.environ.get("CLAUDE_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("CLAUDE_BREAKER_COOLDOWN", "30"))
+
+HEDGING_ENABLED = os.environ.get("CLAUDE_HEDGING", "1") != "0"
+HEDGE_PERCENTILE = float(os.environ.get("CLAUDE_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Rough prompt size for the token bucket; the API reports the real count afterwards
+CHARS_PER_TOKEN = 4
+OVERLOAD_STATUSES = (429, 529)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that grows additively on success and halves on overload."""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY, minimum=1):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        # Slots are shared across threads (each with its own event loop), so poll
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def on_overload(self):
+        with self._cond:
+            # One halving per burst of overload errors, not one per failed call
+            now = time.monotonic()
+            if now - self._last_decrease > 1.0:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+
+
+class RateBucket:
+    """Token bucket refilled at `per_minute`; take() returns how long to wait first."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            self.available -= min(amount, self.capacity)
+            return 0.0 if self.available >= 0 else -self.available / self.rate
+
+
+class CircuitBreaker:
+    """Closed -> open after `failures` consecutive failures -> half-open after the cooldown."""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise CircuitOpenError while open; True if this call is the half-open probe.
+
+        The caller must end_probe() once a probe is over, however it ends.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.cooldown or self._probing:
+                raise CircuitOpenError("Claude API is failing; not sending requests for now")
+            self._probing = True
+            return True
+
+    def end_probe(self):
+        """Let another call probe; a probe that was cancelled counts as never sent."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            self._probing = False
+            if self.consecutive >= self.failures or self.opened_at is not None:
+                if self.opened_at is None:
+                    print(f"Opening the Claude circuit breaker for {self.cooldown:.0f}s", file=sys.stderr)
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent call latencies per kind of request, for the hedging threshold."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, kind, q=HEDGE_PERCENTILE):
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+limiter = AdaptiveLimiter()
+request_bucket = RateBucket(REQUESTS_PER_MINUTE)
+token_bucket = RateBucket(INPUT_TOKENS_PER_MINUTE)
+breaker = CircuitBreaker()
+latencies = LatencyTracker()
+
+
+def _retryable_errors():
+    import anthropic
+    return (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError)
+
+
+def _api_error():
+    import anthropic
+    return anthropic.APIError
+
+
+def _record_error(error, probe):
+    """Feed a failed call into the limiter and breaker.
+
+    Retryable errors count against the breaker; other API errors (400, 401) only when
+    they are the probe's answer, since one bad request shouldn't open it.
+    """
+    if isinstance(error, _retryable_errors()):
+        if getattr(error, "status_code", None) in OVERLOAD_STATUSES:
+            limiter.on_overload()
+        breaker.record_failure()
+    elif probe and isinstance(error, _api_error()):
+        breaker.record_failure()
+
+
+def _retry_delay(error, attempt):
+    """Honour retry-after when the API sends one, else jittered exponential backoff."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return min(float(retry_after), RETRY_MAX_SECONDS)
+    except ValueError:
+        pass
+    return random.uniform(0, min(RETRY_BASE_SECONDS * 2 ** attempt, RETRY_MAX_SECONDS))
+
+
+def estimate_input_tokens(request):
+    return len(json.dumps(request.get("system", "")) + json.dumps(request.get("messages", []))) // CHARS_PER_TOKEN
+
+
+def _kind(request):
+    return f"{request.get('model')}:{request.get('max_tokens')}"
+
+
+async def _hedged(send, request):
+    """send() once, and a second time if the first runs past the hedging threshold."""
+    threshold = latencies.percentile(_kind(request))
+    first = asyncio.ensure_future(send())
+    if threshold is None:
+        return await first
+
+    done, _ = await asyncio.wait({first}, timeout=threshold)
+    if done or not limiter.try_acquire():
+        return await first
+
+    tracing.count("hedged")
+    second = asyncio.ensure_future(send())
+    try:
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.exception() or not pending:
+                    return task.result()
+    finally:
+        limiter.release()
+        for task in (first, second):
+            if not task.done():
+                task.cancel()
+
+
+async def resilient_create(client, request, hedge=False):
+    """client.messages.create(**request) behind the limiter, rate buckets, breaker and retries."""
+    probe = breaker.check()
+    try:
+        return await _create_with_retries(client, request, hedge, probe)
+    finally:
+        if probe:
+            breaker.end_probe()
+
+
+async def _create_with_retries(client, request, hedge, probe):
+    wait = max(request_bucket.take(1), token_bucket.take(estimate_input_tokens(request)))
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+    retryable = _retryable_errors()
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        await limiter.acquire_async()
+        started = time.monotonic()
+        try:
+            if hedge and HEDGING_ENABLED:
+                response = await _hedged(lambda: client.messages.create(**request), request)
+            else:
+                response = await client.messages.create(**request)
+        except retryable as e:
+            if getattr(e, "status_code", None) in OVERLOAD_STATUSES:
+                limiter.on_overload()
+            if attempt == RETRY_ATTEMPTS:
+                breaker.record_failure()
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"Claude call failed ({e.__class__.__name__}), retrying in {delay:.1f}s", file=sys.stderr)
+            tracing.count("retries")
+        except _api_error() as e:
+            _record_error(e, probe)
+            raise
+        else:
+            latencies.record(_kind(request), time.monotonic() - started)
+            limiter.on_success()
+            breaker.record_success()
+            return response
+        finally:
+            limiter.release()
+        await asyncio.sleep(delay)
+
+
+def guarded_stream(client, request):
+    """client.messages.stream(**request) for synchronous streaming, holding a limiter slot.
+
+    Use as a context manager. Not retried: tokens may already have reached the user.
+    """
+    probe = breaker.check()
+    try:
+        return _GuardedStream(client.messages.stream(**request), probe)
+    except BaseException:
+        if probe:
+            breaker.end_probe()
+        raise
+
+
+class _GuardedStream:
+    def __init__(self, manager, probe):
+        self._manager = manager
+        self._probe = probe
+
+    def __enter__(self):
+        limiter.acquire()
+        try:
+            return self._manager.__enter__()
+        except BaseException as e:
+            # The request is sent on enter, so most API errors surface here
+            limiter.release()
+            try:
+                if isinstance(e, Exception):
+                    _record_error(e, self._probe)
+            finally:
+                if self._probe:
+                    breaker.end_probe()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._manager.__exit__(exc_type, exc, tb)
+        finally:
+            limiter.release()
+            if exc_type is None:
+                limiter.on_success()
+                breaker.record_success()
+            elif isinstance(exc, Exception):
+                _record_error(exc, self._probe)
+            if self._probe:
+                breaker.end_probe()
+
+
+def repair_request(request, bad_text, error):
+    """The original request plus the bad reply and a request to fix it, for one retry."""
+    messages = list(request["messages"]) + [
+        {"role": "assistant", "content": bad_text},
+        {"role": "user", "content": f"That reply could not be parsed ({error}). "
+                                    "Respond again with ONLY the corrected JSON, no other text."}
+    ]
+    return {**request, "messages": messages, "temperature": 0}
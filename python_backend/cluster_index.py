@@ -0,0 +1,191 @@
+import sys
+import os
+import json
+import hashlib
+import argparse
+
+from async_runtime import run_async, create_parsed
+
+# Precomputed scholarship -> strategy cluster index.
+#
+# The scholarship corpus and the strategy map are both static, so which clusters fit
+# a scholarship can be worked out once, offline, instead of asking Claude on every
+# essay request. Build with:
+#
+#   python3 python_backend/cluster_index.py [--confirm-with-llm]
+#
+# EssayGenerator looks descriptions up by text hash and falls back to the live LLM
+# path for anything the index hasn't seen (or if the strategy map has changed since).
+
+INDEX_PATH = os.environ.get(
+    "CLUSTER_INDEX_PATH",
+    os.path.join(os.path.dirname(__file__), "cluster_index.json")
+)
+
+MAX_CLUSTERS = 4
+# Clusters scoring within this cosine similarity of the best one are kept
+SCORE_MARGIN = 0.05
+LLM_BATCH_SIZE = 10
+
+
+def text_key(text):
+    """Index key for a scholarship description, as sent by the client."""
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
+def strategy_map_fingerprint(strategy_map):
+    """Changes whenever any cluster's content changes, invalidating the index."""
+    canonical = json.dumps(strategy_map, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_index(strategy_map, path=INDEX_PATH):
+    """Return {text_key: [cluster_id, ...]} if a current index exists, else {}."""
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read cluster index: {e}", file=sys.stderr)
+        return {}
+
+    if index.get("strategy_map_fingerprint") != strategy_map_fingerprint(strategy_map):
+        print("Cluster index was built for a different strategy map; ignoring it", file=sys.stderr)
+        return {}
+
+    return index.get("by_text", {})
+
+
+def rank_clusters(scholarship_vectors, cluster_vectors, cluster_ids,
+                  max_clusters=MAX_CLUSTERS, margin=SCORE_MARGIN):
+    """Rank clusters for every scholarship by cosine similarity, all at once.
+
+    Returns one list of cluster IDs per scholarship, best first, keeping those within
+    margin of the top score (at least one, at most max_clusters).
+    """
+    import numpy as np
+
+    s = np.asarray(scholarship_vectors, dtype=np.float32)
+    c = np.asarray(cluster_vectors, dtype=np.float32)
+    s /= np.linalg.norm(s, axis=1, keepdims=True) + 1e-12
+    c /= np.linalg.norm(c, axis=1, keepdims=True) + 1e-12
+
+    scores = s @ c.T
+    order = np.argsort(-scores, axis=1)[:, :max_clusters]
+
+    ranked = []
+    for row, top in zip(scores, order):
+        best = row[top[0]]
+        ranked.append([cluster_ids[j] for j in top if row[j] >= best - margin])
+    return ranked
+
+
+def _parse_confirmation(text):
+    answer = json.loads(text)
+    if not isinstance(answer, dict):
+        raise ValueError("expected a JSON object of scholarship number -> cluster IDs")
+    return {int(key): [int(cid) for cid in ids] for key, ids in answer.items()}
+
+
+def _confirm_with_llm(strategy_map, documents, candidates):
+    """One Claude call per batch of scholarships to confirm/reorder the vector picks."""
+    archetypes = "".join(
+        f"\nCluster ID: {c['cluster_id']}\nName: {c.get('cluster_name', 'N/A')}\n"
+        f"Description Archetype: {c['description_archetype']}\n"
+        for c in strategy_map
+    )
+
+    confirmed = list(candidates)
+    for start in range(0, len(documents), LLM_BATCH_SIZE):
+        batch = range(start, min(start + LLM_BATCH_SIZE, len(documents)))
+        scholarships_text = "".join(
+            f"\n--- Scholarship {i}\n{documents[i][:1500]}\nVector-suggested clusters: {candidates[i]}\n"
+            for i in batch
+        )
+
+        prompt = f"""You are an expert at matching scholarship descriptions to writing strategies.
+
+AVAILABLE STRATEGY CLUSTERS:
+{archetypes}
+
+SCHOLARSHIPS:
+{scholarships_text}
+
+TASK:
+For each scholarship, list the clusters that are semantically similar to it, from most to least relevant (minimum 1, maximum {MAX_CLUSTERS}). The vector-suggested clusters are a starting point; correct them where they are wrong.
+
+Return ONLY a JSON object mapping each scholarship number to its array of cluster IDs:
+
+Example output: {{"{batch.start}": [3, 1], "{batch.start + 1}": [5]}}
+
+Respond with ONLY the JSON object, no additional text."""
+
+        try:
+            answer = run_async(create_parsed(
+                _parse_confirmation,
+                model="claude-sonnet-4-20250514",
+                max_tokens=1000,
+                temperature=0.2,
+                messages=[{"role": "user", "content": prompt}]
+            ))
+            valid_ids = {c['cluster_id'] for c in strategy_map}
+            for i, ids in answer.items():
+                ids = [cid for cid in ids if cid in valid_ids][:MAX_CLUSTERS]
+                if i in batch and ids:
+                    confirmed[i] = ids
+        except Exception as e:
+            print(f"LLM confirmation failed for batch at {start}, keeping vector ranking: {e}",
+                  file=sys.stderr)
+
+    return confirmed
+
+
+def build_index(strategy_map_path, confirm_with_llm=False, path=INDEX_PATH):
+    """Score every scholarship in the collection against every cluster and write the index."""
+    import embeddings
+    from scholarship_matcher import get_scholarships_collection, get_claude_client
+
+    from strategy_mapper import load_strategy_map
+    _, strategy_map = load_strategy_map(strategy_map_path)
+
+    collection = get_scholarships_collection()
+    corpus = collection.get(include=["embeddings", "documents"])
+    documents = corpus["documents"]
+    print(f"Indexing {len(documents)} scholarships against {len(strategy_map)} clusters", file=sys.stderr)
+
+    cluster_ids = [c['cluster_id'] for c in strategy_map]
+    cluster_vectors = embeddings.get_embedding_service().embed_many(
+        [c['description_archetype'] for c in strategy_map]
+    )
+
+    ranked = rank_clusters(corpus["embeddings"], cluster_vectors, cluster_ids)
+
+    if confirm_with_llm:
+        get_claude_client()  # fail fast without an API key
+        ranked = _confirm_with_llm(strategy_map, documents, ranked)
+
+    index = {
+        "strategy_map_fingerprint": strategy_map_fingerprint(strategy_map),
+        "method": "vector+llm" if confirm_with_llm else "vector",
+        "by_text": {text_key(doc): ids for doc, ids in zip(documents, ranked)},
+        "by_id": dict(zip(corpus["ids"], ranked))
+    }
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+
+    print(f"Wrote cluster index to {path}", file=sys.stderr)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the scholarship -> strategy cluster index")
+    parser.add_argument("--strategy-map", default=os.path.join(os.path.dirname(__file__), "strategy_map.json"))
+    parser.add_argument("--confirm-with-llm", action="store_true",
+                        help="Confirm vector rankings with one batched Claude pass")
+    parser.add_argument("--output", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    build_index(args.strategy_map, confirm_with_llm=args.confirm_with_llm, path=args.output)
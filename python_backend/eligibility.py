@@ -0,0 +1,187 @@
+import re
+import sys
+import argparse
+
+# Typed eligibility metadata for the scholarships collection.
+#
+# Scraped listings carry eligibility as free text (minimum_gpa "3.0", degree_levels
+# "Undergraduate, Graduate", ...). normalize_eligibility turns that into fields Chroma
+# can filter on inside the query:
+#
+#   min_gpa               float, 0.0 when there is no requirement
+#   level_high_school     bool  } True when the listing accepts that level
+#   level_undergraduate   bool  } (all True when no levels are listed)
+#   level_graduate        bool  }
+#   citizenship_any       bool, True when no citizenship requirement is listed
+#   citizenship_ca / _us  bool
+#
+# Run `python3 python_backend/eligibility.py --backfill` to add these fields to an
+# existing collection without re-embedding.
+
+DEGREE_LEVELS = ("high school", "undergraduate", "graduate")
+CITIZENSHIP_CODES = ("ca", "us")
+
+_LEVEL_PATTERNS = {
+    "high school": re.compile(r"high[\s-]*school|secondary|grade\s*12", re.I),
+    "undergraduate": re.compile(r"undergrad|under-graduate|bachelor|college|post-?secondary", re.I),
+    "graduate": re.compile(r"\bgraduate\b|\bgrad\b|master|ph\.?d|doctor|post-?graduate", re.I),
+}
+
+_CITIZENSHIP_PATTERNS = {
+    "ca": re.compile(r"canad", re.I),
+    # "US" only in capitals, so the pronoun "us" doesn't count
+    "us": re.compile(r"(?i:united states|america)|\bU\.?S\.?A?\b"),
+}
+
+
+def level_field(level):
+    return "level_" + level.replace(" ", "_")
+
+
+def citizenship_code(text):
+    """Map free-text citizenship to one of CITIZENSHIP_CODES, or None."""
+    if not text:
+        return None
+    for code, pattern in _CITIZENSHIP_PATTERNS.items():
+        if pattern.search(text):
+            return code
+    return None
+
+
+def _parse_gpa(value):
+    if value in (None, ""):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(\.\d+)?", str(value))
+    return float(match.group()) if match else 0.0
+
+
+def normalize_eligibility(metadata):
+    """Return the typed eligibility fields for one scholarship's metadata.
+
+    Already-normalized fields are kept as they are, so this is safe to re-run.
+    """
+    fields = {}
+
+    fields["min_gpa"] = (float(metadata["min_gpa"]) if "min_gpa" in metadata
+                         else _parse_gpa(metadata.get("minimum_gpa")))
+
+    if all(level_field(level) in metadata for level in DEGREE_LEVELS):
+        for level in DEGREE_LEVELS:
+            fields[level_field(level)] = bool(metadata[level_field(level)])
+    else:
+        levels_text = metadata.get("degree_levels") or ""
+        accepted = {level for level, pattern in _LEVEL_PATTERNS.items() if pattern.search(levels_text)}
+        for level in DEGREE_LEVELS:
+            fields[level_field(level)] = not accepted or level in accepted
+
+    if "citizenship_any" in metadata:
+        fields["citizenship_any"] = bool(metadata["citizenship_any"])
+        for code in CITIZENSHIP_CODES:
+            fields[f"citizenship_{code}"] = bool(metadata.get(f"citizenship_{code}", False))
+    else:
+        citizenship_text = metadata.get("citizenship") or ""
+        codes = {code for code, pattern in _CITIZENSHIP_PATTERNS.items() if pattern.search(citizenship_text)}
+        fields["citizenship_any"] = not codes
+        for code in CITIZENSHIP_CODES:
+            fields[f"citizenship_{code}"] = code in codes
+
+    return fields
+
+
+def where_clause(structured_data):
+    """Build a Chroma `where` filter for the student's eligibility, or None."""
+    conditions = []
+
+    gpa = structured_data.get("gpa")
+    if isinstance(gpa, (int, float)):
+        conditions.append({"min_gpa": {"$lte": float(gpa)}})
+
+    level = (structured_data.get("degree_level") or "").lower()
+    if level in DEGREE_LEVELS:
+        conditions.append({level_field(level): True})
+
+    code = citizenship_code(structured_data.get("citizenship"))
+    if code:
+        conditions.append({"$or": [{"citizenship_any": True}, {f"citizenship_{code}": True}]})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def ineligibility_reason(structured_data, metadata, lenient_levels=False):
+    """Python-side equivalent of where_clause: the first failed check, or None.
+
+    With lenient_levels, degree levels are checked as the matcher did before rows had
+    typed fields (see _excluded_by_level_text), which keeps more matches.
+    """
+    fields = normalize_eligibility(metadata)
+
+    gpa = structured_data.get("gpa")
+    if isinstance(gpa, (int, float)) and gpa < fields["min_gpa"]:
+        return "gpa"
+
+    level = (structured_data.get("degree_level") or "").lower()
+    if lenient_levels:
+        if _excluded_by_level_text(level, (metadata.get("degree_levels") or "").lower()):
+            return "degree_level"
+    elif level in DEGREE_LEVELS and not fields[level_field(level)]:
+        return "degree_level"
+
+    code = citizenship_code(structured_data.get("citizenship"))
+    if code and not (fields["citizenship_any"] or fields[f"citizenship_{code}"]):
+        return "citizenship"
+
+    return None
+
+
+def _excluded_by_level_text(level, levels_text):
+    """The substring rule used on untyped rows: only rules out a level the listing
+    doesn't name when the listing is for undergraduates or graduates."""
+    if not levels_text or level in ("", "unknown") or level in levels_text:
+        return False
+    return ("undergraduate" in levels_text and level == "graduate") or \
+        ("graduate" in levels_text and level == "high school")
+
+
+def is_normalized(metadata):
+    return "min_gpa" in metadata and "citizenship_any" in metadata and \
+        all(level_field(level) in metadata for level in DEGREE_LEVELS)
+
+
+def backfill(collection, batch_size=500):
+    """Add typed eligibility fields to every row of the collection that lacks them."""
+    total = collection.count()
+    updated = 0
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        ids, metadatas = [], []
+        for scholarship_id, metadata in zip(page["ids"], page["metadatas"]):
+            metadata = metadata or {}
+            if is_normalized(metadata):
+                continue
+            ids.append(scholarship_id)
+            metadatas.append({**metadata, **normalize_eligibility(metadata)})
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+            updated += len(ids)
+
+    print(f"Normalized eligibility for {updated} of {total} scholarships", file=sys.stderr)
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Typed eligibility metadata for the scholarships collection")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Add typed eligibility fields to rows that don't have them yet")
+    args = parser.parse_args()
+
+    if args.backfill:
+        from scholarship_matcher import get_scholarships_collection
+        backfill(get_scholarships_collection())
+    else:
+        parser.print_help()
@@ -0,0 +1,310 @@
+import sys
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import tracing
+
+# Embedding service used by the matcher: content-hash cache (in-memory LRU plus an
+# optional SQLite store), a pluggable backend, and a micro-batcher that folds
+# concurrent embed() calls into a single backend call with several texts.
+#
+# Backends (EMBEDDING_BACKEND):
+#   nomic - Nomic Atlas API over a pooled HTTP session (default)
+#   local - nomic-embed-text-v1.5 on CPU via sentence-transformers, no network
+#   stub  - deterministic hash vectors, for offline tests and benchmarks
+
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "nomic")
+NOMIC_API_KEY = os.environ.get("NOMIC_API_KEY")
+NOMIC_EMBED_URL = os.environ.get("NOMIC_EMBED_URL", "https://api-atlas.nomic.ai/v1/embedding/text")
+EMBED_MODEL = "nomic-embed-text-v1.5"
+MAX_TEXT_CHARS = 8000
+
+LOCAL_MODEL_NAME = os.environ.get("LOCAL_EMBEDDING_MODEL", "nomic-ai/nomic-embed-text-v1.5")
+LOCAL_BATCH_SIZE = int(os.environ.get("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+# The collection was embedded through the API without a task_type, which the API
+# treats as search_document; the local model needs that prefix spelled out.
+LOCAL_TASK_PREFIX = "search_document: "
+
+CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))
+# Set to a file path to keep embeddings across processes and restarts
+CACHE_DB_PATH = os.environ.get("EMBEDDING_CACHE_DB")
+
+BATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "16"))
+# How long a batch waits for more callers, once several are already queued
+BATCH_WAIT_SECONDS = float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", "10")) / 1000
+
+
+def _cache_key(backend_name, text):
+    return hashlib.sha256(f"{backend_name}:{EMBED_MODEL}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """LRU cache of embeddings keyed by content hash, optionally backed by SQLite."""
+
+    def __init__(self, max_size=CACHE_SIZE, db_path=CACHE_DB_PATH):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row:
+                    vector = json.loads(row[0])
+                    self._remember(key, vector)
+                    return vector
+
+        return None
+
+    def put(self, key, vector):
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, json.dumps(vector))
+                )
+                self._db.commit()
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class EmbeddingBackend:
+    """Interface for embedding backends: turn a list of texts into a list of vectors."""
+
+    def embed_batch(self, texts):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Pay any one-time setup cost (model load, connection) before the first request."""
+        self.embed_batch(["warm up"])
+
+
+class NomicEmbeddingClient(EmbeddingBackend):
+    """Calls the Nomic embedding endpoint over a pooled keep-alive session.
+
+    Point NOMIC_EMBED_URL at stub_embedding_server.py to run without network access.
+    """
+
+    def __init__(self, url=NOMIC_EMBED_URL, api_key=NOMIC_API_KEY):
+        if not api_key:
+            raise ValueError("NOMIC_API_KEY environment variable is required for the nomic embedding backend")
+        self.url = url
+        import requests
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def embed_batch(self, texts):
+        payload = {
+            "texts": texts,
+            "model": EMBED_MODEL
+        }
+        response = self.session.post(self.url, json=payload, timeout=30)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def warm_up(self):
+        """The pooled session is already set up; a real request here would be billed."""
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """Runs nomic-embed-text-v1.5 on CPU. Produces the same 768-dim vectors as the API,
+    so the existing Chroma collection can be queried without re-embedding.
+
+    Requires the optional local-embeddings dependencies (sentence-transformers, einops).
+    """
+
+    def __init__(self, model_name=LOCAL_MODEL_NAME, batch_size=LOCAL_BATCH_SIZE):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=local needs sentence-transformers; "
+                "install with: pip install -e '.[local-embeddings]'"
+            ) from e
+
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device="cpu", trust_remote_code=True)
+
+    def embed_batch(self, texts):
+        vectors = self.model.encode(
+            [LOCAL_TASK_PREFIX + text for text in texts],
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        return vectors.tolist()
+
+
+class StubEmbeddingBackend(EmbeddingBackend):
+    """Deterministic in-process vectors; same output as stub_embedding_server.py."""
+
+    def embed_batch(self, texts):
+        from stub_embedding_server import stub_vector
+        return [stub_vector(text) for text in texts]
+
+
+def create_backend(name=EMBEDDING_BACKEND):
+    """Build the embedding backend selected by name."""
+    if name == "nomic":
+        return NomicEmbeddingClient()
+    if name == "local":
+        return LocalEmbeddingBackend()
+    if name == "stub":
+        return StubEmbeddingBackend()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+
+
+class EmbeddingBatcher:
+    """Groups embed requests from concurrent callers into one backend call.
+
+    A lone caller is sent at once. Callers that arrive while a call is in flight queue
+    up and go out together; if several are queued, the batch waits up to max_wait for
+    more to join.
+    """
+
+    def __init__(self, backend, max_batch=BATCH_MAX_SIZE, max_wait=BATCH_WAIT_SECONDS):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._submissions = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts):
+        """Queue texts from one caller together; returns a future per text."""
+        futures = [Future() for _ in texts]
+        with self._cond:
+            self._submissions += 1
+            self._pending.extend((text, future, self._submissions) for text, future in zip(texts, futures))
+            self._cond.notify()
+        return futures
+
+    def _callers_waiting(self):
+        return self._pending[0][2] != self._pending[-1][2]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                if self._callers_waiting():
+                    deadline = time.monotonic() + self.max_wait
+                    while len(self._pending) < self.max_batch:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+
+            # Identical texts from concurrent callers are only sent once
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.backend.embed_batch(texts)))
+                for text, future, _ in batch:
+                    future.set_result(vectors[text])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+
+
+class EmbeddingService:
+    """Cache-first embedding with request batching."""
+
+    def __init__(self, backend=None, cache=None):
+        self.backend = backend or create_backend()
+        self.cache = cache or EmbeddingCache()
+        self.batcher = EmbeddingBatcher(self.backend)
+
+    def embed(self, text):
+        return self.embed_many([text])[0]
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def embed_many(self, texts):
+        """Embed several texts; only cache misses reach the backend, in one batch."""
+        texts = [text[:MAX_TEXT_CHARS] for text in texts]
+        backend_name = type(self.backend).__name__
+        keys = [_cache_key(backend_name, text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        tracing.annotate(cache_hits=sum(vector is not None for vector in vectors))
+
+        if missing:
+            futures = dict(zip(missing, self.batcher.submit_many(list(missing.values()))))
+            fetched = {key: future.result() for key, future in futures.items()}
+            for key, vector in fetched.items():
+                self.cache.put(key, vector)
+            vectors = [vector if vector is not None else fetched[key]
+                       for key, vector in zip(keys, vectors)]
+
+        return vectors
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """Return the process-wide EmbeddingService."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+    return _service
+
+
+def warm_up():
+    """Load the backend ahead of the first request; failures are logged, not raised."""
+    try:
+        get_embedding_service().warm_up()
+    except Exception as e:
+        print(f"Embedding warm-up failed: {e}", file=sys.stderr)
+
+
+def embed_text(text):
+    """Embed one text, returning None on failure (same contract as embed_text_nomic)."""
+    try:
+        return get_embedding_service().embed(text)
+    except Exception as e:
+        print(f"Error generating embedding: {e}", file=sys.stderr)
+        tracing.annotate(error=repr(e))
+        return None
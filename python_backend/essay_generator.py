@@ -1,81 +1,358 @@
 import sys
 import json
 import os
+import time
 import random
-from anthropic import Anthropic
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_cache
+import cluster_index
+import profile_artifacts
+import strategy_mapper
+import tracing
+import claude_client
+from async_runtime import run_async, create_message, create_message_sync, create_parsed, cached_system
+
+# Created on first use, so importing this module stays cheap
+_claude_client = None
+
+
+def get_claude_client():
+    """Return the process-wide Anthropic client, creating it on first use."""
+    global _claude_client
+    if _claude_client is None:
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable is required")
+        from anthropic import Anthropic
+        _claude_client = Anthropic(api_key=api_key, max_retries=0)  # retried by claude_client
+    return _claude_client
+
+
+# Multi-draft mode: how many drafts run at once, how long to wait for them, and the
+# sampling temperatures used when there are more drafts than valid strategies
+DRAFT_CONCURRENCY = int(os.environ.get("ESSAY_DRAFT_CONCURRENCY", "4"))
+DRAFT_DEADLINE_SECONDS = float(os.environ.get("ESSAY_DRAFT_DEADLINE", "60"))
+REVIEW_TIMEOUT_SECONDS = float(os.environ.get("ESSAY_REVIEW_TIMEOUT", "30"))
+DRAFT_TEMPERATURES = (0.7, 0.9, 1.0)
+# Upper bound on drafts per essay, whatever the request asks for
+MAX_DRAFTS = int(os.environ.get("ESSAY_MAX_DRAFTS", "6"))
+
+# Match-and-draft: how many scholarships get their essay written at once
+FANOUT_CONCURRENCY = int(os.environ.get("ESSAY_FANOUT_CONCURRENCY", "5"))
+
+# How often a long-lived generator checks strategy_map.json for a new version
+STRATEGY_MAP_CHECK_SECONDS = float(os.environ.get("STRATEGY_MAP_CHECK_SECONDS", "5"))
+
+
+def _parse_cluster_ids(text):
+    """A JSON array of cluster IDs, e.g. [3, 1]."""
+    ids = json.loads(text)
+    if not isinstance(ids, list):
+        raise ValueError("expected a JSON array of cluster IDs")
+    return [int(cluster_id) for cluster_id in ids]
+
+
+def _parse_review(text):
+    """The reviewer's JSON, checked to name a best draft."""
+    review = json.loads(text)
+    int(review["best_draft"])
+    return review
+
+
+class LoadedStrategyMap:
+    """One version of the strategy map and everything derived from it.
+
+    Never modified once built: a reload builds a new one and swaps it in with a single
+    assignment, and each request reads the one it started with throughout.
+    """
+
+    def __init__(self, path):
+        self.mtime = os.stat(path).st_mtime_ns
+        self.version, self.clusters = strategy_mapper.load_strategy_map(path)
+        # Shared, prompt-cached system block for the matching, filtering and drafting calls
+        self.prompt = _strategy_map_prompt(self.clusters)
+        # Precomputed scholarship -> cluster rankings (see cluster_index.py)
+        self.cluster_index = cluster_index.load_index(self.clusters)
+
+
+def _strategy_map_prompt(strategy_map):
+    """The whole strategy map as static prompt text."""
+    clusters = "".join(f"""
+Cluster ID: {cluster['cluster_id']}
+Name: {cluster.get('cluster_name', 'N/A')}
+Description Archetype: {cluster['description_archetype']}
+Broad Instructions: {cluster['writing_strategy']['broad_instructions']}
+Structural Template: {cluster['writing_strategy']['structural_template']}
+""" for cluster in strategy_map)
 
-# Get API key from environment variable
-CLAUDE_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
-if not CLAUDE_API_KEY:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is required")
+    return f"""STRATEGY MAP
+Essay-writing strategy clusters derived from successful scholarship applications. Each cluster has an ID, a name, a description archetype (the kind of scholarship it fits) and a writing strategy.
+{clusters}"""
 
-# Initialize Claude client at module level (like the working scholarship matcher)
-claude_client = Anthropic(api_key=CLAUDE_API_KEY)
 
 class EssayGenerator:
     """Generates scholarship essays using the strategy map and student profiles."""
 
     def __init__(self, strategy_map_path="python_backend/strategy_map.json"):
-        # Use the module-level client
-        self.client = claude_client
+        # Use the shared process-wide client
+        self.client = get_claude_client()
         self.model = "claude-sonnet-4-20250514"
 
         # Load the strategy map
         if not os.path.exists(strategy_map_path):
             raise FileNotFoundError(f"Strategy map not found at {strategy_map_path}")
 
-        with open(strategy_map_path, 'r', encoding='utf-8') as f:
-            self.strategy_map = json.load(f)
+        self.strategy_map_path = strategy_map_path
+        # Requests read self.loaded once and pass it down (see LoadedStrategyMap)
+        self.loaded = LoadedStrategyMap(strategy_map_path)
+        self._checked_mtime = self.loaded.mtime
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+
+    def reload_if_changed(self):
+        """Pick up a new strategy map version (at most once per STRATEGY_MAP_CHECK_SECONDS).
+
+        A map that fails to load is reported and the current one is kept. Requests
+        already running keep the map they started with.
+        """
+        with self._reload_lock:
+            if time.monotonic() - self._checked_at < STRATEGY_MAP_CHECK_SECONDS:
+                return False
+            self._checked_at = time.monotonic()
+
+            try:
+                mtime = os.stat(self.strategy_map_path).st_mtime_ns
+            except OSError:
+                return False
+            if mtime == self._checked_mtime:
+                return False
+            self._checked_mtime = mtime  # don't retry the same broken file
+
+            previous = self.loaded.version
+            try:
+                self.loaded = LoadedStrategyMap(self.strategy_map_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Keeping strategy map {previous}; reload failed: {e}", file=sys.stderr)
+                return False
+
+        print(f"Reloaded strategy map: {previous} -> {self.loaded.version}", file=sys.stderr)
+        return True
+
+    def generate_essay(self, target_scholarship_description, student_profile, loaded=None):
+        """Main essay generation workflow (against `loaded`, by default the current map)."""
+        loaded = loaded or self.loaded
+        matching_clusters, selected_strategy = self._select_strategy(
+            loaded, target_scholarship_description, student_profile
+        )
 
-    def generate_essay(self, target_scholarship_description, student_profile):
-        """Main essay generation workflow."""
-        # Step 1: Semantic Matching
-        matching_clusters = self._find_matching_clusters(target_scholarship_description)
+        # Step 4: Generate the Essay
+        essay = self._generate_draft(
+            loaded,
+            target_scholarship_description,
+            student_profile,
+            selected_strategy
+        )
 
+        return self._result(loaded, essay, selected_strategy, matching_clusters)
+
+    def generate_essay_multi(self, target_scholarship_description, student_profile, num_drafts=3, loaded=None):
+        """Write several drafts concurrently and let a reviewer call pick the best.
+
+        One draft per valid strategy (varying temperature if more drafts are asked for
+        than there are strategies). Drafts still running at the deadline are cancelled
+        as long as at least one has finished.
+        """
+        loaded = loaded or self.loaded
+        matching_clusters = self._match_clusters(loaded, target_scholarship_description)
+        with tracing.span("filter_strategies"):
+            valid_strategies = self._capable_strategies(loaded, matching_clusters, student_profile)
+        if not valid_strategies:
+            valid_strategies = matching_clusters[:1]
+
+        # Past every strategy at every temperature, more drafts would only repeat plans
+        num_drafts = min(max(1, num_drafts), MAX_DRAFTS, len(valid_strategies) * len(DRAFT_TEMPERATURES))
+        plans = [(valid_strategies[i % len(valid_strategies)],
+                  DRAFT_TEMPERATURES[(i // len(valid_strategies)) % len(DRAFT_TEMPERATURES)])
+                 for i in range(num_drafts)]
+
+        with tracing.span("drafts"):
+            drafts = run_async(self._write_drafts(loaded, target_scholarship_description, student_profile, plans))
+            tracing.annotate(requested=len(plans), finished=len(drafts))
+        with tracing.span("review"):
+            best, review = run_async(self._review_drafts(target_scholarship_description, drafts))
+
+        result = self._result(loaded, best["essay"], best["strategy"], matching_clusters)
+        result["drafts_considered"] = len(drafts)
+        result["review"] = review
+        return result
+
+    async def _write_drafts(self, loaded, scholarship_description, student_profile, plans):
+        """Run the draft calls on a bounded pool; returns the drafts that finished in time."""
+        semaphore = asyncio.Semaphore(DRAFT_CONCURRENCY)
+
+        async def write(strategy, temperature):
+            async with semaphore:
+                request = self._draft_request(loaded, scholarship_description, student_profile, strategy)
+                request["temperature"] = temperature
+                response = await create_message(**request)
+                tracing.record_usage(response)
+                return {"essay": response.content[0].text.strip(), "strategy": strategy,
+                        "temperature": temperature}
+
+        tasks = [asyncio.ensure_future(write(strategy, temperature)) for strategy, temperature in plans]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=DRAFT_DEADLINE_SECONDS)
+            # Nothing usable by the deadline: take whichever draft succeeds first
+            while pending and all(t.exception() for t in done):
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                done |= finished
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        drafts = []
+        for task in done:
+            if task.exception():
+                print(f"Draft failed: {task.exception()}", file=sys.stderr)
+            else:
+                drafts.append(task.result())
+
+        if not drafts:
+            raise RuntimeError("All essay drafts failed")
+        print(f"{len(drafts)} of {len(plans)} drafts finished", file=sys.stderr)
+        return drafts
+
+    async def _review_drafts(self, scholarship_description, drafts):
+        """Ask Claude to score the drafts; returns (best_draft, review)."""
+        if len(drafts) == 1:
+            return drafts[0], None
+
+        drafts_text = "".join(
+            f"\n--- DRAFT {i} (strategy: {d['strategy'].get('cluster_name', 'N/A')})\n{d['essay']}\n"
+            for i, d in enumerate(drafts, 1)
+        )
+
+        review_prompt = f"""You are an experienced scholarship committee reviewer. Score each draft essay for this scholarship.
+
+SCHOLARSHIP DESCRIPTION:
+{scholarship_description}
+
+DRAFTS:
+{drafts_text}
+
+Score each draft from 0-100 on how likely it is to win: fit with the scholarship's values, authenticity and specificity, structure, and writing quality.
+
+Return ONLY valid JSON in this exact format:
+{{
+  "scores": [{{"draft": <draft number>, "score": <0-100>}}],
+  "best_draft": <draft number>,
+  "reasoning": "<2-3 sentences on why the best draft wins>"
+}}"""
+
+        try:
+            review = await asyncio.wait_for(
+                create_parsed(
+                    _parse_review,
+                    model=self.model,
+                    max_tokens=800,
+                    temperature=0.2,
+                    messages=[{"role": "user", "content": review_prompt}]
+                ),
+                timeout=REVIEW_TIMEOUT_SECONDS
+            )
+            best_index = int(review["best_draft"]) - 1
+            if 0 <= best_index < len(drafts):
+                return drafts[best_index], review
+        except Exception as e:
+            print(f"Review failed, using first finished draft: {e!r}", file=sys.stderr)
+            tracing.annotate(error=repr(e), fallback=True)
+
+        return drafts[0], None
+
+    def generate_essay_events(self, target_scholarship_description, student_profile):
+        """Streaming version of generate_essay.
+
+        Yields stage events as each step finishes and token events while the draft is
+        written, then returns the same result dict as generate_essay.
+        """
+        loaded = self.loaded
+
+        # Step 1: Semantic Matching
+        matching_clusters = self._match_clusters(loaded, target_scholarship_description)
+        yield {"type": "stage", "stage": "clusters_matched",
+               "matching_clusters": self._cluster_names(matching_clusters)}
+
+        # Steps 2-3: Feasibility filter and selection
+        selected_strategy = self._pick_strategy(loaded, matching_clusters, student_profile)
+        yield {"type": "stage", "stage": "strategy_selected", "selected_strategy": selected_strategy}
+
+        # Step 4: Stream the essay as it is written
+        yield {"type": "stage", "stage": "drafting"}
+        chunks = []
+        with tracing.span("draft"), claude_client.guarded_stream(self.client, self._draft_request(
+            loaded, target_scholarship_description, student_profile, selected_strategy
+        )) as stream:
+            for text in stream.text_stream:
+                if not chunks:
+                    tracing.annotate(first_token_ms=tracing.elapsed_ms())
+                chunks.append(text)
+                yield {"type": "token", "text": text}
+            tracing.record_usage(stream.get_final_message())
+
+        return self._result(loaded, "".join(chunks).strip(), selected_strategy, matching_clusters)
+
+    def _select_strategy(self, loaded, target_scholarship_description, student_profile):
+        """Steps 1-3: returns (matching_clusters, selected_strategy)."""
+        matching_clusters = self._match_clusters(loaded, target_scholarship_description)
+        return matching_clusters, self._pick_strategy(loaded, matching_clusters, student_profile)
+
+    def _match_clusters(self, loaded, target_scholarship_description):
+        # Step 1: Semantic Matching (precomputed index first, live LLM call for unseen descriptions)
+        with tracing.span("match_clusters"):
+            indexed = self._lookup_clusters(loaded, target_scholarship_description)
+            tracing.annotate(index_hit=bool(indexed))
+            return indexed or self._find_matching_clusters(loaded, target_scholarship_description)
+
+    def _pick_strategy(self, loaded, matching_clusters, student_profile):
         # Step 2: Student Feasibility Filter
-        valid_strategies = self._filter_by_student_capability(matching_clusters, student_profile)
+        with tracing.span("filter_strategies"):
+            valid_strategies = self._capable_strategies(loaded, matching_clusters, student_profile)
 
         if not valid_strategies:
             # Use top match as fallback
             valid_strategies = matching_clusters[:1]
 
         # Step 3: Random Selection
-        selected_strategy = random.choice(valid_strategies)
+        return random.choice(valid_strategies)
 
-        # Step 4: Generate the Essay
-        essay = self._generate_draft(
-            target_scholarship_description,
-            student_profile,
-            selected_strategy
-        )
+    def _cluster_names(self, clusters):
+        return [c.get('cluster_name', f"Cluster {c['cluster_id']}") for c in clusters]
 
+    def _result(self, loaded, essay, selected_strategy, matching_clusters):
         return {
             "essay": essay,
             "selected_strategy": selected_strategy,
-            "matching_clusters": [c.get('cluster_name', f"Cluster {c['cluster_id']}")
-                                  for c in matching_clusters]
+            "matching_clusters": self._cluster_names(matching_clusters),
+            "strategy_map_version": loaded.version
         }
 
-    def _find_matching_clusters(self, target_description):
-        """Use Claude to identify which strategy clusters match the target scholarship."""
-        archetypes_list = []
-        for cluster in self.strategy_map:
-            archetypes_list.append(f"""
-Cluster ID: {cluster['cluster_id']}
-Name: {cluster.get('cluster_name', 'N/A')}
-Description Archetype: {cluster['description_archetype']}
-""")
-
-        matching_prompt = f"""You are an expert at matching scholarship descriptions to writing strategies.
-
-TARGET SCHOLARSHIP DESCRIPTION:
-{target_description}
+    def _lookup_clusters(self, loaded, target_description):
+        """Return the indexed clusters for a known scholarship description, or []."""
+        cluster_ids = loaded.cluster_index.get(cluster_index.text_key(target_description), [])
+        by_id = {c['cluster_id']: c for c in loaded.clusters}
+        return [by_id[cid] for cid in cluster_ids if cid in by_id]
 
-AVAILABLE STRATEGY CLUSTERS:
-{"".join(archetypes_list)}
+    def _find_matching_clusters(self, loaded, target_description):
+        """Use Claude to identify which strategy clusters match the target scholarship."""
+        instructions = """You are an expert at matching scholarship descriptions to writing strategies.
 
 TASK:
-Identify which clusters are semantically similar to the target scholarship. A scholarship may match multiple clusters (e.g., it could be both "Academic Research" and "Leadership").
+Identify which clusters in the strategy map are semantically similar to the target scholarship. A scholarship may match multiple clusters (e.g., it could be both "Academic Research" and "Leadership").
 
 Rank the matches from most relevant to least relevant. Return ONLY a JSON array of cluster IDs in order of relevance:
 
@@ -85,41 +362,47 @@ Only include clusters that have meaningful overlap with the target scholarship.
 
 Respond with ONLY the JSON array, no additional text."""
 
-        response = self.client.messages.create(
+        # Same scholarship + same strategy map => same answer, so this is cached
+        cluster_ids = llm_cache.cached_create(
+            create_message_sync,
+            _parse_cluster_ids,
             model=self.model,
             max_tokens=500,
+            hedge=True,
             temperature=0.2,
-            messages=[{"role": "user", "content": matching_prompt}]
+            system=cached_system(loaded.prompt, instructions),
+            messages=[{"role": "user", "content": f"TARGET SCHOLARSHIP DESCRIPTION:\n{target_description}"}]
         )
 
-        response_text = response.content[0].text.strip()
-        cluster_ids = json.loads(response_text)
+        return [c for c in loaded.clusters if c['cluster_id'] in cluster_ids]
 
-        return [c for c in self.strategy_map if c['cluster_id'] in cluster_ids]
+    def _capable_strategies(self, loaded, clusters, student_profile):
+        """The clusters the student can execute, from their profile artifact when possible.
 
-    def _filter_by_student_capability(self, clusters, student_profile):
-        """Filter strategies to only those the student can realistically execute."""
-        student_profile_text = json.dumps(student_profile, indent=2)
+        The student is assessed against the whole strategy map once per map version and
+        the result kept with the profile, so later essays for the same student (other
+        scholarships, other drafts) skip the capability call entirely.
+        """
+        artifact_id = profile_artifacts.profile_id(student_profile)
+        capabilities = (profile_artifacts.load(artifact_id) or {}).get("capabilities") or {}
+        capable = capabilities.get(loaded.version)
 
-        filter_prompt = f"""You are evaluating whether a student can execute certain essay writing strategies.
+        if capable is None:
+            capable = [c['cluster_id'] for c in self._filter_by_student_capability(loaded, loaded.clusters,
+                                                                                   student_profile)]
+            profile_artifacts.save(artifact_id, student_profile=student_profile,
+                                   capabilities={**capabilities, loaded.version: capable})
+        else:
+            tracing.annotate(cache_hit=True)
 
-STUDENT PROFILE:
-{student_profile_text}
-
-STRATEGIES TO EVALUATE:
-"""
-
-        for cluster in clusters:
-            filter_prompt += f"""
----
-Strategy {cluster['cluster_id']}: {cluster.get('cluster_name', 'N/A')}
-Requirements: {cluster['writing_strategy']['broad_instructions'][:300]}...
-"""
+        return [c for c in clusters if c['cluster_id'] in capable]
 
-        filter_prompt += """
+    def _filter_by_student_capability(self, loaded, clusters, student_profile):
+        """Filter strategies to only those the student can realistically execute."""
+        instructions = """You are evaluating whether a student can execute certain essay writing strategies from the strategy map.
 
 TASK:
-For each strategy, determine if the student has the background/experiences needed to execute it authentically and effectively.
+For each strategy you are asked about, determine if the student has the background/experiences needed to execute it authentically and effectively.
 
 FILTERING RULES:
 - If a strategy requires "overcoming adversity/hardship" but the student has no hardships listed → REJECT
@@ -128,7 +411,7 @@ FILTERING RULES:
 - If a strategy requires "technical/STEM accomplishments" but the student is humanities-focused → REJECT
 - If the student HAS relevant experiences for the strategy → ACCEPT
 
-Return ONLY a JSON array of cluster IDs that the student CAN execute:
+Return ONLY a JSON array of the cluster IDs, out of those you are asked about, that the student CAN execute:
 
 Example: [1, 3]
 
@@ -136,63 +419,123 @@ If the student can't execute ANY of the strategies well, return an empty array:
 
 Respond with ONLY the JSON array, no additional text."""
 
-        response = self.client.messages.create(
+        student_profile_text = json.dumps(student_profile, indent=2)
+        to_evaluate = ", ".join(
+            f"Strategy {c['cluster_id']} ({c.get('cluster_name', 'N/A')})" for c in clusters
+        )
+
+        valid_cluster_ids = llm_cache.cached_create(
+            create_message_sync,
+            _parse_cluster_ids,
             model=self.model,
             max_tokens=500,
+            hedge=True,
             temperature=0.2,
-            messages=[{"role": "user", "content": filter_prompt}]
-        )
+            system=cached_system(loaded.prompt, instructions),
+            messages=[{"role": "user", "content": f"""STUDENT PROFILE:
+{student_profile_text}
 
-        response_text = response.content[0].text.strip()
-        valid_cluster_ids = json.loads(response_text)
+STRATEGIES TO EVALUATE: {to_evaluate}"""}]
+        )
 
         return [c for c in clusters if c['cluster_id'] in valid_cluster_ids]
 
-    def _generate_draft(self, scholarship_description, student_profile, strategy):
+    def _generate_draft(self, loaded, scholarship_description, student_profile, strategy):
         """Generate the actual essay using Claude."""
-        student_profile_text = json.dumps(student_profile, indent=2)
+        with tracing.span("draft"):
+            response = create_message_sync(
+                **self._draft_request(loaded, scholarship_description, student_profile, strategy)
+            )
+            tracing.record_usage(response)
 
-        generation_prompt = f"""You are a skilled scholarship essay writer. Your task is to write a compelling essay for the following scholarship.
+        return response.content[0].text.strip()
 
-SCHOLARSHIP DESCRIPTION:
+    def _draft_request(self, loaded, scholarship_description, student_profile, strategy):
+        """Claude request parameters for drafting the essay."""
+        instructions = """You are a skilled scholarship essay writer. Your task is to write a compelling essay for a scholarship, following one writing strategy from the strategy map.
+
+REQUIREMENTS:
+1. Write in the first person from the student's perspective
+2. Strictly follow the structural template provided
+3. Make it authentic and personal, drawing from the student's actual experiences
+4. Keep the tone professional yet engaging
+5. Aim for 500-650 words
+6. Include specific, vivid details that bring the story to life
+7. End with a forward-looking conclusion that connects to the scholarship's goals"""
+
+        student_profile_text = json.dumps(student_profile, indent=2)
+
+        generation_prompt = f"""SCHOLARSHIP DESCRIPTION:
 {scholarship_description}
 
 STUDENT PROFILE:
 {student_profile_text}
 
-WRITING STRATEGY TO FOLLOW:
+WRITING STRATEGY TO FOLLOW (Cluster {strategy['cluster_id']}: {strategy.get('cluster_name', 'N/A')}):
 {strategy['writing_strategy']['broad_instructions']}
 
 STRUCTURAL TEMPLATE (YOU MUST FOLLOW THIS STRUCTURE):
 {strategy['writing_strategy']['structural_template']}
 
-REQUIREMENTS:
-1. Write in the first person from the student's perspective
-2. Strictly follow the structural template provided
-3. Make it authentic and personal, drawing from the student's actual experiences
-4. Keep the tone professional yet engaging
-5. Aim for 500-650 words
-6. Include specific, vivid details that bring the story to life
-7. End with a forward-looking conclusion that connects to the scholarship's goals
-
 Write the complete essay now. Do not include a title or any preamble—just the essay text."""
 
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=4000,
-            temperature=0.7,
-            messages=[{"role": "user", "content": generation_prompt}]
-        )
+        return {
+            "model": self.model,
+            "max_tokens": 4000,
+            "temperature": 0.7,
+            "system": cached_system(loaded.prompt, instructions),
+            "messages": [{"role": "user", "content": generation_prompt}]
+        }
+
+
+# Reused across requests when running as a long-lived worker
+_generator = None
+_generator_lock = threading.Lock()
 
-        return response.content[0].text.strip()
 
+def get_generator():
+    """Return the process-wide EssayGenerator, loading the strategy map on first use.
 
-def generate_essay(scholarship_description, student_profile_dict, scholarship_name="Scholarship"):
-    """Main function to generate essay given scholarship description and student profile."""
+    A worker picks up a new strategy_map.json here, between requests.
+    """
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = EssayGenerator()
+            return _generator
+    _generator.reload_if_changed()
+    return _generator
+
+
+def warm_up():
+    """Load the strategy map and the Anthropic client before the first request."""
     try:
-        generator = EssayGenerator()
+        get_generator()
+    except Exception as e:
+        print(f"Warm-up failed: {e}", file=sys.stderr)
+
+
+def generate_essay(scholarship_description, student_profile_dict, scholarship_name="Scholarship", drafts=1):
+    """Main function to generate essay given scholarship description and student profile.
+
+    With drafts > 1, several drafts are written concurrently and a reviewer picks one.
+    Unless PIPELINE_TRACING=0, the result carries a "trace" with per-stage timings.
+    """
+    with tracing.trace() as trace:
+        result = _generate_essay(scholarship_description, student_profile_dict, scholarship_name, drafts)
+        if trace is not None:
+            result["trace"] = trace.to_dict()
+        return result
+
+
+def _generate_essay(scholarship_description, student_profile_dict, scholarship_name, drafts, loaded=None):
+    try:
+        generator = get_generator()
         
-        result = generator.generate_essay(scholarship_description, student_profile_dict)
+        if drafts > 1:
+            result = generator.generate_essay_multi(scholarship_description, student_profile_dict, drafts, loaded)
+        else:
+            result = generator.generate_essay(scholarship_description, student_profile_dict, loaded)
         
         # Add scholarship name to result
         result["scholarship_name"] = scholarship_name
@@ -206,15 +549,116 @@ def generate_essay(scholarship_description, student_profile_dict, scholarship_na
         return {"error": str(e)}
 
 
-if __name__ == "__main__":
-    # Read JSON input from stdin
-    input_data = json.loads(sys.stdin.read())
+def generate_essay_events(scholarship_description, student_profile_dict, scholarship_name="Scholarship"):
+    """Streaming counterpart of generate_essay: yields progress events, returns the result."""
+    generator = get_generator()
+    with tracing.trace() as trace:
+        result = yield from generator.generate_essay_events(scholarship_description, student_profile_dict)
+        result["scholarship_name"] = scholarship_name
+        if trace is not None:
+            result["trace"] = trace.to_dict()
+        return result
+
+
+def generate_essays(scholarships, student_profile_dict, drafts=1, concurrency=FANOUT_CONCURRENCY):
+    """One essay per {"name", "description"} scholarship, written concurrently.
+
+    Backs the match-and-draft endpoint. The student's capability is assessed against
+    the strategy map once up front, so every essay reuses it from the profile artifact.
+    Every essay uses the strategy map version loaded when the request started. Each
+    entry of "essays" is that scholarship's result (or {"error": ...}).
+    """
+    with tracing.trace() as trace:
+        generator = get_generator()
+        loaded = generator.loaded
+        with tracing.span("filter_strategies"):
+            try:
+                generator._capable_strategies(loaded, loaded.clusters, student_profile_dict)
+            except Exception as e:
+                print(f"Capability assessment failed: {e}", file=sys.stderr)
+                tracing.annotate(error=repr(e))
+
+        def write(scholarship):
+            return _generate_essay(scholarship.get("description", ""), student_profile_dict,
+                                   scholarship.get("name") or "Scholarship", drafts, loaded)
+
+        with tracing.span("essays"):
+            # Each thread gets a copy of this context, so its stages land in this trace
+            # and a bypassCache request bypasses the cache in every essay
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+                futures = [pool.submit(contextvars.copy_context().run, write, scholarship)
+                           for scholarship in scholarships]
+                essays = [future.result() for future in futures]
+            tracing.annotate(requested=len(essays), failed=sum("error" in essay for essay in essays))
+
+        result = {"essays": essays, "strategy_map_version": loaded.version}
+        if trace is not None:
+            result["trace"] = trace.to_dict()
+        return result
+
+
+def _bypassing_cache(events):
+    with llm_cache.bypass():
+        return (yield from events)
+
+
+def _draft_count(value):
+    """Requested drafts clamped to 1..MAX_DRAFTS; None if it isn't a number."""
+    try:
+        return min(max(int(value or 1), 1), MAX_DRAFTS)
+    except (TypeError, ValueError):
+        return None
+
+
+def handle_request(input_data):
+    """Process one request payload as sent by server/routes.ts."""
     scholarship_desc = input_data.get("scholarshipDescription", "")
-    student_profile = input_data.get("studentProfile", {})
+    student_profile = input_data.get("studentProfile")
     scholarship_name = input_data.get("scholarshipName", "Scholarship")
-    
-    # Process
-    result = generate_essay(scholarship_desc, student_profile, scholarship_name)
-    
-    # Output JSON to stdout
-    print(json.dumps(result))
+    if not student_profile:
+        # A profileId from an earlier match result stands in for the profile itself
+        student_profile = profile_artifacts.student_profile(input_data.get("profileId"))
+        if student_profile is None:
+            return {"error": "Unknown or expired profileId; send studentProfile instead"}
+    drafts = _draft_count(input_data.get("drafts"))
+    if drafts is None:
+        return {"error": f"drafts must be an integer from 1 to {MAX_DRAFTS}"}
+    if "scholarships" in input_data:
+        if input_data.get("bypassCache"):
+            with llm_cache.bypass():
+                return generate_essays(input_data["scholarships"], student_profile, drafts)
+        return generate_essays(input_data["scholarships"], student_profile, drafts)
+    if input_data.get("stream"):
+        events = generate_essay_events(scholarship_desc, student_profile, scholarship_name)
+        return _bypassing_cache(events) if input_data.get("bypassCache") else events
+    if input_data.get("bypassCache"):
+        with llm_cache.bypass():
+            return generate_essay(scholarship_desc, student_profile, scholarship_name, drafts)
+    return generate_essay(scholarship_desc, student_profile, scholarship_name, drafts)
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        # Long-lived mode: answer NDJSON requests until stdin closes
+        from worker import serve
+        serve(handle_request, warm_up=warm_up)
+    else:
+        # Read JSON input from stdin
+        input_data = json.loads(sys.stdin.read())
+
+        if input_data.get("stream"):
+            # NDJSON events, then {"type": "result", "result": {...}}
+            from worker import drain_events
+            try:
+                result = drain_events(handle_request(input_data),
+                                      lambda event: print(json.dumps(event), flush=True))
+            except Exception as e:
+                print(f"Error in generate_essay: {e}", file=sys.stderr)
+                result = {"error": str(e)}
+            print(json.dumps({"type": "result", "result": result}), flush=True)
+        else:
+            # Process
+            result = handle_request(input_data)
+
+            # Output JSON to stdout
+            print(json.dumps(result))
@@ -0,0 +1,411 @@
+import sys
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+
+# Durable essay generation jobs.
+#
+# The HTTP server no longer waits for an essay: it submits a job and the client polls
+# (or subscribes to) its status. Jobs live in SQLite (WAL), so they survive restarts
+# without an external broker. The server starts one long-lived runner:
+#
+#   python3 python_backend/essay_jobs.py --run
+#
+# It answers NDJSON requests on stdin, like worker.py does:
+#
+#   {"id": 1, "op": "submit", "payload": {...}, "userId": "...", "lane": "interactive"}
+#   {"id": 2, "op": "get" | "cancel", "jobId": "..."}
+#   {"id": 3, "op": "stats"}
+#
+# with {"id": ..., "result": {...}}. Between replies it writes {"type": "job", "job": {...}}
+# whenever a job changes state.
+#
+# ESSAY_JOB_WORKERS threads generate essays. Each takes the next queued job:
+# - the interactive lane comes before batch; a job's lane counts for less the longer
+#   it waits (ESSAY_JOB_AGING_SECONDS), so batch jobs aren't starved
+# - users already at ESSAY_JOB_USER_CONCURRENCY running jobs are skipped
+# Running jobs send heartbeats. A job whose runner died is requeued (up to
+# MAX_ATTEMPTS runs). Finished jobs are deleted after ESSAY_JOB_RETENTION seconds.
+
+JOB_DB_PATH = os.environ.get(
+    "ESSAY_JOB_DB",
+    os.path.join(os.path.dirname(__file__), ".cache", "essay_jobs.sqlite3")
+)
+JOB_WORKERS = int(os.environ.get("ESSAY_JOB_WORKERS", "4"))
+USER_CONCURRENCY = int(os.environ.get("ESSAY_JOB_USER_CONCURRENCY", "2"))
+USER_MAX_PENDING = int(os.environ.get("ESSAY_JOB_USER_MAX_PENDING", "10"))
+MAX_QUEUED = int(os.environ.get("ESSAY_JOB_MAX_QUEUED", "1000"))
+RETENTION_SECONDS = float(os.environ.get("ESSAY_JOB_RETENTION", str(7 * 24 * 3600)))
+AGING_SECONDS = float(os.environ.get("ESSAY_JOB_AGING_SECONDS", "300"))
+
+LANES = {"interactive": 0, "batch": 1}
+MAX_ATTEMPTS = 2
+POLL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60
+PURGE_SECONDS = 300
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_db = None
+_db_lock = threading.Lock()
+_send_lock = threading.Lock()
+_protocol_out = sys.stdout
+
+
+def _connection():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(JOB_DB_PATH) or ".", exist_ok=True)
+        _db = sqlite3.connect(JOB_DB_PATH, timeout=10, check_same_thread=False, isolation_level=None)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            lane INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            heartbeat_at REAL
+        )""")
+        _db.execute("CREATE INDEX IF NOT EXISTS jobs_status_user ON jobs (status, user_id)")
+    return _db
+
+
+def _transaction(work):
+    """Run work(db) in an IMMEDIATE transaction, so claims are atomic across processes."""
+    with _db_lock:
+        db = _connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            value = work(db)
+            db.execute("COMMIT")
+            return value
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+
+_COLUMNS = "id, lane, status, result, error, attempts, created_at, started_at, finished_at"
+
+
+def _job_dict(row, position=None):
+    job_id, lane, status, result, error, attempts, created_at, started_at, finished_at = row
+    job = {
+        "id": job_id,
+        "status": status,
+        "lane": next(name for name, value in LANES.items() if value == lane),
+        "attempts": attempts,
+        "createdAt": created_at,
+        "startedAt": started_at,
+        "finishedAt": finished_at,
+    }
+    if position is not None:
+        job["position"] = position
+    if result is not None:
+        job["result"] = json.loads(result)
+    if error is not None:
+        job["error"] = error
+    return job
+
+
+def _fetch(db, job_id):
+    row = db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    position = None
+    if row[2] == "queued":
+        # Jobs ahead of this one in its lane or a higher one (ignoring aging)
+        position = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (lane < ? OR (lane = ? AND created_at < ?))",
+            (row[1], row[1], row[6])
+        ).fetchone()[0]
+    return _job_dict(row, position)
+
+
+def submit(payload, user_id, lane="interactive"):
+    """Queue an essay job; returns the job, or {"rejected": reason, "status": http_status}."""
+    if lane not in LANES:
+        return {"rejected": f"lane must be one of {', '.join(LANES)}", "status": 400}
+    payload = {key: value for key, value in payload.items() if key != "stream"}
+
+    def work(db):
+        queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= MAX_QUEUED:
+            return {"rejected": "The essay queue is full; try again later", "status": 503}
+        pending = db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN ('queued', 'running')", (user_id,)
+        ).fetchone()[0]
+        if pending >= USER_MAX_PENDING:
+            return {"rejected": f"Too many essays in progress (limit {USER_MAX_PENDING}); "
+                                "wait for some to finish", "status": 429}
+
+        job_id = uuid.uuid4().hex
+        db.execute(
+            "INSERT INTO jobs (id, user_id, lane, status, payload, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, user_id, LANES[lane], json.dumps(payload), time.time())
+        )
+        return _fetch(db, job_id)
+
+    job = _transaction(work)
+    if "id" in job:
+        _announce(job)
+    return job
+
+
+def get(job_id):
+    with _db_lock:
+        return _fetch(_connection(), job_id)
+
+
+def cancel(job_id):
+    """Cancel a queued job. Returns the job (unchanged if it had already started), or None."""
+    def work(db):
+        db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                   (time.time(), job_id))
+        return _fetch(db, job_id)
+
+    job = _transaction(work)
+    if job and job["status"] == "cancelled":
+        _announce(job)
+    return job
+
+
+def stats():
+    """Job counts by status and lane, for the metrics endpoint."""
+    with _db_lock:
+        rows = _connection().execute(
+            "SELECT status, lane, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status, lane"
+        ).fetchall()
+    counts = {status: {lane: 0 for lane in LANES} for status in ("queued", "running")}
+    for status, lane, count in rows:
+        counts[status][next(name for name, value in LANES.items() if value == lane)] = count
+    return counts
+
+
+def claim():
+    """Mark the next runnable job as running and return (job_id, payload), or None."""
+    def work(db):
+        now = time.time()
+        _requeue_stale(db, now)
+        row = db.execute(
+            """SELECT id, payload FROM jobs AS j
+               WHERE status = 'queued'
+                 AND (SELECT COUNT(*) FROM jobs AS r WHERE r.status = 'running' AND r.user_id = j.user_id) < ?
+               ORDER BY lane - (? - created_at) / ?, created_at
+               LIMIT 1""",
+            (USER_CONCURRENCY, now, AGING_SECONDS)
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute(
+            """UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1
+               WHERE id = ?""",
+            (now, now, row[0])
+        )
+        return row[0], json.loads(row[1]), _fetch(db, row[0])
+
+    claimed = _transaction(work)
+    if claimed is None:
+        return None
+    job_id, payload, job = claimed
+    _announce(job)
+    return job_id, payload
+
+
+def _requeue_stale(db, now):
+    """Running jobs whose runner stopped sending heartbeats go back in the queue (or fail)."""
+    db.execute(
+        """UPDATE jobs SET status = 'failed', finished_at = ?, error = 'The essay runner stopped while writing this essay'
+           WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?""",
+        (now, now - STALE_SECONDS, MAX_ATTEMPTS)
+    )
+    db.execute(
+        "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running' AND heartbeat_at < ?",
+        (now - STALE_SECONDS,)
+    )
+
+
+def heartbeat(job_ids):
+    if not job_ids:
+        return
+    _transaction(lambda db: db.executemany(
+        "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+        [(time.time(), job_id) for job_id in job_ids]
+    ))
+
+
+def finish(job_id, result=None, error=None):
+    def work(db):
+        db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+            ("failed" if error else "succeeded", None if error else json.dumps(result), error, time.time(), job_id)
+        )
+        return _fetch(db, job_id)
+
+    job = _transaction(work)
+    if job:
+        _announce(job)
+
+
+def release(job_ids):
+    """Put jobs this runner was working on back in the queue (on shutdown)."""
+    if job_ids:
+        _transaction(lambda db: db.executemany(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, attempts = attempts - 1 "
+            "WHERE id = ? AND status = 'running'",
+            [(job_id,) for job_id in job_ids]
+        ))
+
+
+def purge():
+    """Delete finished jobs past the retention period; returns how many."""
+    return _transaction(lambda db: db.execute(
+        f"DELETE FROM jobs WHERE status IN {FINISHED} AND finished_at < ?",
+        (time.time() - RETENTION_SECONDS,)
+    ).rowcount)
+
+
+# --- Runner ----------------------------------------------------------------------
+
+def _send(message):
+    with _send_lock:
+        _protocol_out.write(json.dumps(message) + "\n")
+        _protocol_out.flush()
+
+
+def _announce(job):
+    _send({"type": "job", "job": job})
+
+
+class Runner:
+    """ESSAY_JOB_WORKERS threads claiming and running jobs, plus heartbeats and purging."""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.running = set()
+        self.running_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"essay-job-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        threading.Thread(target=self._maintain, name="essay-job-maintenance", daemon=True).start()
+
+    def stop(self):
+        """Stop claiming and put unfinished jobs back in the queue for the next runner."""
+        self.stopping.set()
+        with self.running_lock:
+            unfinished = list(self.running)
+        release(unfinished)
+
+    def _work(self):
+        import essay_generator
+
+        while not self.stopping.is_set():
+            try:
+                claimed = claim()
+            except sqlite3.Error as e:
+                print(f"Essay job claim failed: {e}", file=sys.stderr)
+                claimed = None
+            if claimed is None:
+                self.stopping.wait(POLL_SECONDS)
+                continue
+
+            job_id, payload = claimed
+            with self.running_lock:
+                self.running.add(job_id)
+            try:
+                result = essay_generator.handle_request(payload)
+                error = result.get("error") if isinstance(result, dict) else None
+            except Exception as e:
+                traceback.print_exc()
+                result, error = None, str(e)
+            if self.stopping.is_set():
+                return  # released for the next runner; don't race it with a result
+            with self.running_lock:
+                self.running.discard(job_id)
+            finish(job_id, result, error)
+
+    def _maintain(self):
+        last_purge = 0.0
+        while not self.stopping.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.running_lock:
+                    running = list(self.running)
+                heartbeat(running)
+                if time.time() - last_purge > PURGE_SECONDS:
+                    last_purge = time.time()
+                    purged = purge()
+                    if purged:
+                        print(f"Purged {purged} finished essay jobs", file=sys.stderr)
+            except sqlite3.Error as e:
+                print(f"Essay job maintenance failed: {e}", file=sys.stderr)
+
+
+def handle_op(request):
+    op = request.get("op")
+    if op == "submit":
+        return submit(request.get("payload") or {}, str(request.get("userId") or "anonymous"),
+                      request.get("lane") or "interactive")
+    if op == "get":
+        return {"job": get(request.get("jobId"))}
+    if op == "cancel":
+        return {"job": cancel(request.get("jobId"))}
+    if op == "stats":
+        return stats()
+    return {"error": f"Unknown op {op!r}"}
+
+
+def run():
+    """Serve ops on stdin and run jobs until stdin closes."""
+    global _protocol_out
+    # Protocol messages only on stdout; everything else printed goes to stderr
+    _protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    import essay_generator
+    essay_generator.warm_up()
+
+    runner = Runner()
+    runner.start()
+    _send({"type": "ready"})
+
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Essay job runner received invalid JSON: {e}", file=sys.stderr)
+                continue
+            try:
+                result = handle_op(request)
+            except Exception as e:
+                traceback.print_exc()
+                result = {"error": str(e)}
+            _send({"id": request.get("id"), "result": result})
+    finally:
+        runner.stop()
+
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        run()
+    else:
+        print("Usage: python3 python_backend/essay_jobs.py --run", file=sys.stderr)
+        sys.exit(2)
@@ -0,0 +1,301 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+import embeddings
+import eligibility
+import candidate_cards
+import llm_cache
+import tracing
+from async_runtime import run_async, create_message, cached_system
+
+# Incremental ingestion into the `scholarships` collection.
+#
+#   python3 python_backend/ingest.py < scholarships.jsonl
+#   python3 python_backend/ingest.py --input scraped.jsonl --prune
+#
+# Input is JSONL, one scraped scholarship per line:
+#
+#   {"name": "...", "url": "...", "text": "full description", "minimum_gpa": "3.0", ...}
+#
+# `id` defaults to `name`; `description` or `document` are accepted for `text`. Records
+# are read as a stream and processed in chunks. Each record's content hash is stored in
+# its metadata, and rows whose hash hasn't changed are skipped. For the rest, the
+# metadata fields the matcher uses are extracted by Claude (several scholarships per
+# call, calls running concurrently) unless the record already has them, the card
+# summary is written, the texts are embedded in batches, and only those rows are
+# upserted, with the typed eligibility fields. --prune deletes rows that weren't in the
+# input (skipped if any input line couldn't be read). If the in-process vector index
+# has been exported, it is re-exported after a run that changed anything.
+#
+# Output is one summary line on stdout:
+#
+#   {"seen": 200, "unchanged": 190, "upserted": 9, "failed": 1, "pruned": 0, "seconds": ...}
+
+# Fields the matcher and rerank read from metadata; missing ones are extracted
+METADATA_FIELDS = (
+    "minimum_gpa", "degree_levels", "fields_of_study", "citizenship",
+    "emphasis_areas", "values_mission", "award_amount"
+)
+# Bump when the extraction prompt changes, so every row is extracted again
+EXTRACTION_VERSION = "1"
+
+CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", "64"))
+EXTRACT_BATCH_SIZE = int(os.environ.get("INGEST_EXTRACT_BATCH_SIZE", "5"))
+EXTRACT_CONCURRENCY = int(os.environ.get("INGEST_EXTRACT_CONCURRENCY", "8"))
+EXTRACT_TEXT_CHARS = 6000
+
+
+def read_records(lines):
+    """Yield (record, None) for each valid line, or (None, error) for bad ones."""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("expected a JSON object")
+            text = item.get("text") or item.get("description") or item.get("document")
+            scholarship_id = item.get("id") or item.get("name")
+            if not scholarship_id or not text:
+                raise ValueError("a record needs a name (or id) and text")
+            yield {**item, "id": str(scholarship_id), "text": text}, None
+        except ValueError as e:
+            yield None, f"line {number}: {e}"
+
+
+def content_hash(record):
+    """Hash of everything ingest derives a row from."""
+    payload = {key: value for key, value in record.items() if key != "id"}
+    payload["extraction_version"] = EXTRACTION_VERSION
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _metadata_value(value):
+    """Chroma metadata values are scalars; lists are stored comma-separated."""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value if item not in (None, ""))
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return None if value is None else str(value)
+
+
+_EXTRACTION_INSTRUCTIONS = """You extract structured fields from scholarship descriptions for a matching system.
+
+For each scholarship, return:
+- "minimum_gpa": the minimum GPA as a number on a 4.0 scale, or null if none is stated
+- "degree_levels": who may apply, using "high school", "undergraduate" and/or "graduate", comma-separated; null if open to all
+- "fields_of_study": eligible fields of study, comma-separated; null if any field
+- "citizenship": citizenship or residency requirements, e.g. "Canadian citizen or permanent resident"; null if none
+- "emphasis_areas": the qualities and activities the scholarship rewards (e.g. leadership, community service, STEM research), comma-separated
+- "values_mission": one sentence on the sponsor's values or mission
+- "award_amount": the award amount as written, or null
+
+Only use what the description states; use null when it is silent.
+
+Return ONLY valid JSON in this exact format:
+{"scholarships": [{"id": <number from the input>, "minimum_gpa": ..., "degree_levels": ..., "fields_of_study": ..., "citizenship": ..., "emphasis_areas": ..., "values_mission": ..., "award_amount": ...}]}"""
+
+
+def _extraction_prompt(records):
+    parts = [f"SCHOLARSHIP {i}: {record['id']}\n{record['text'][:EXTRACT_TEXT_CHARS]}"
+             for i, record in enumerate(records, 1)]
+    return "\n\n".join(parts) + f"\n\nExtract the fields for all {len(records)} scholarships."
+
+
+def _parse_extraction(response_text):
+    from scholarship_matcher import _parse_json_reply
+    data = _parse_json_reply(response_text)
+    return {int(item["id"]): item for item in data.get("scholarships", []) if "id" in item}
+
+
+async def extract_metadata_async(records, batch_size=EXTRACT_BATCH_SIZE, concurrency=EXTRACT_CONCURRENCY):
+    """Extracted METADATA_FIELDS for each record (None where extraction failed)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def extract(batch):
+        async with semaphore:
+            try:
+                extracted = await llm_cache.cached_create_async(
+                    create_message,
+                    _parse_extraction,
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=300 * len(batch),
+                    temperature=0,
+                    system=cached_system(_EXTRACTION_INSTRUCTIONS),
+                    messages=[{"role": "user", "content": _extraction_prompt(batch)}]
+                )
+            except Exception as e:
+                print(f"Metadata extraction failed for {len(batch)} scholarships: {e!r}", file=sys.stderr)
+                tracing.annotate(error=repr(e))
+                return [None for _ in batch]
+            # A scholarship missing from the reply counts as failed, so it is retried
+            return [{field: extracted[i].get(field) for field in METADATA_FIELDS} if i in extracted else None
+                    for i in range(1, len(batch) + 1)]
+
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    results = await asyncio.gather(*(extract(batch) for batch in batches))
+    return [fields for batch in results for fields in batch]
+
+
+def build_metadata(record, extracted, summary, digest):
+    """Row metadata: scraped fields win over extracted ones, plus the typed eligibility fields.
+
+    If extraction failed the content hash is left empty, so the next run retries the row.
+    """
+    metadata = {"name": record.get("name") or record["id"], "url": record.get("url") or "N/A"}
+    for field in METADATA_FIELDS:
+        value = _metadata_value(record.get(field))
+        if value in (None, ""):
+            value = _metadata_value((extracted or {}).get(field))
+        if value not in (None, ""):
+            metadata[field] = value
+    if summary:
+        metadata["summary"] = summary
+    metadata["content_hash"] = digest if extracted is not None else ""
+    metadata.update(eligibility.normalize_eligibility(metadata))
+    return metadata
+
+
+def _stored_hashes(collection, ids):
+    existing = collection.get(ids=ids, include=["metadatas"])
+    return {scholarship_id: (metadata or {}).get("content_hash")
+            for scholarship_id, metadata in zip(existing["ids"], existing["metadatas"])}
+
+
+async def _ingest_chunk(records, collection, counts, summaries=True):
+    stored = await asyncio.to_thread(_stored_hashes, collection, [record["id"] for record in records])
+    changed = []
+    for record in records:
+        digest = content_hash(record)
+        if stored.get(record["id"]) == digest:
+            counts["unchanged"] += 1
+        else:
+            changed.append((record, digest))
+    if not changed:
+        return
+
+    needs_extraction = [record for record, _ in changed
+                        if any(record.get(field) in (None, "") for field in METADATA_FIELDS)]
+    texts = [record["text"] for record, _ in changed]
+
+    # Extraction, summaries and embeddings don't depend on each other
+    extracted, summary_list, vectors = await asyncio.gather(
+        extract_metadata_async(needs_extraction),
+        (candidate_cards.summarize_documents_async(texts) if summaries
+         else asyncio.sleep(0, result=[None] * len(texts))),
+        asyncio.to_thread(embeddings.get_embedding_service().embed_many, texts),
+        return_exceptions=True
+    )
+    if isinstance(vectors, BaseException):
+        print(f"Embedding failed for {len(changed)} scholarships: {vectors!r}", file=sys.stderr)
+        counts["failed"] += len(changed)
+        return
+    if isinstance(extracted, BaseException):
+        extracted = [None] * len(needs_extraction)
+    extracted_by_id = {record["id"]: fields for record, fields in zip(needs_extraction, extracted)}
+    if isinstance(summary_list, BaseException):
+        summary_list = [None] * len(texts)
+
+    ids, metadatas = [], []
+    for (record, digest), summary in zip(changed, summary_list):
+        ids.append(record["id"])
+        metadatas.append(build_metadata(record, extracted_by_id.get(record["id"], {}), summary, digest))
+
+    try:
+        await asyncio.to_thread(collection.upsert, ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        counts["upserted"] += len(ids)
+    except Exception as e:
+        print(f"Upsert failed for {len(ids)} scholarships: {e!r}", file=sys.stderr)
+        counts["failed"] += len(ids)
+
+
+def _prune(collection, keep_ids, batch_size=5000):
+    stale = []
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=[], limit=batch_size, offset=offset)
+        stale.extend(scholarship_id for scholarship_id in page["ids"] if scholarship_id not in keep_ids)
+    for i in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[i:i + batch_size])
+    return len(stale)
+
+
+def get_or_create_collection():
+    """The scholarships collection, created (cosine distance) if it doesn't exist yet."""
+    from scholarship_matcher import get_chroma_client
+    return get_chroma_client().get_or_create_collection("scholarships", metadata={"hnsw:space": "cosine"})
+
+
+def ingest(lines, collection=None, chunk_size=CHUNK_SIZE, prune=False, summaries=True):
+    """Ingest a JSONL stream of scholarships; returns the summary counts."""
+    start = time.time()
+    collection = collection or get_or_create_collection()
+    counts = {"seen": 0, "unchanged": 0, "upserted": 0, "failed": 0, "pruned": 0}
+    seen_ids = set()
+    unreadable = 0
+
+    chunk = []
+    for record, error in read_records(lines):
+        if error:
+            print(f"Skipping {error}", file=sys.stderr)
+            counts["failed"] += 1
+            unreadable += 1
+            continue
+        if record["id"] in seen_ids:
+            print(f"Skipping duplicate id {record['id']!r}", file=sys.stderr)
+            continue
+        seen_ids.add(record["id"])
+        counts["seen"] += 1
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            run_async(_ingest_chunk(chunk, collection, counts, summaries))
+            chunk = []
+            print(f"Ingested {counts['seen']} scholarships so far", file=sys.stderr)
+    if chunk:
+        run_async(_ingest_chunk(chunk, collection, counts, summaries))
+
+    if prune and unreadable:
+        # Those lines' ids are unknown, so pruning could delete the rows they meant to keep
+        print(f"Not pruning: {unreadable} input lines could not be read", file=sys.stderr)
+    elif prune:
+        counts["pruned"] = _prune(collection, seen_ids)
+
+    if counts["upserted"] or counts["pruned"]:
+        _refresh_vector_index(collection)
+
+    counts["seconds"] = round(time.time() - start, 2)
+    return counts
+
+
+def _refresh_vector_index(collection):
+    """Re-export the in-process vector index if one has been exported before."""
+    import vector_index
+    if os.path.exists(os.path.join(vector_index.INDEX_DIR, vector_index.METADATA_FILE)):
+        vector_index.export(collection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally ingest scraped scholarships into Chroma")
+    parser.add_argument("--input", help="JSONL file to read (default: stdin)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--prune", action="store_true", help="Delete rows that aren't in the input")
+    parser.add_argument("--no-summaries", action="store_true", help="Don't write card summaries")
+    args = parser.parse_args()
+
+    try:
+        if args.input:
+            with open(args.input, 'r', encoding='utf-8') as f:
+                summary = ingest(f, chunk_size=args.chunk_size, prune=args.prune, summaries=not args.no_summaries)
+        else:
+            summary = ingest(sys.stdin, chunk_size=args.chunk_size, prune=args.prune,
+                             summaries=not args.no_summaries)
+        print(json.dumps(summary))
+    except Exception as e:
+        print(json.dumps({"error": f"Ingestion failed: {e}"}))
+        sys.exit(1)
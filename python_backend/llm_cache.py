@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import tracing
+import claude_client
+
+# Disk-backed cache of Claude response texts for the classification-style calls whose
+# answers only depend on their prompt (profile extraction, cluster matching, capability
+# filtering). Keyed on a hash of the full request (model, temperature, prompt, ...), so
+# any prompt change is a new key. SQLite in WAL mode lets every worker process share it.
+
+CACHE_DB_PATH = os.environ.get(
+    "LLM_CACHE_DB",
+    os.path.join(os.path.dirname(__file__), ".cache", "llm_cache.sqlite3")
+)
+CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+CACHE_DISABLED = os.environ.get("LLM_CACHE_DISABLED") == "1"
+
+stats = {"hits": 0, "misses": 0}
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+_db = None
+_db_lock = threading.Lock()
+
+
+@contextmanager
+def bypass():
+    """Skip cache reads (fresh answers are still stored) for calls made inside this block."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def bypassed():
+    """True inside a bypass() block."""
+    return _bypass.get()
+
+
+def _connection():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(CACHE_DB_PATH) or ".", exist_ok=True)
+        _db = sqlite3.connect(CACHE_DB_PATH, timeout=10, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )""")
+        _db.commit()
+    return _db
+
+
+def make_key(request):
+    """Hash of everything that determines the answer: model, sampling params, prompt."""
+    # hedge only changes how the call is sent, not the answer
+    canonical = json.dumps({k: v for k, v in request.items() if k != "hedge"}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    if CACHE_DISABLED or _bypass.get():
+        return None
+
+    try:
+        with _db_lock:
+            db = _connection()
+            now = time.time()
+            row = db.execute(
+                "SELECT text FROM responses WHERE key = ? AND created_at > ?",
+                (key, now - CACHE_TTL_SECONDS)
+            ).fetchone()
+            if row:
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                db.commit()
+    except sqlite3.Error as e:
+        print(f"LLM cache read failed: {e}", file=sys.stderr)
+        return None
+
+    if row:
+        stats["hits"] += 1
+        return row[0]
+    stats["misses"] += 1
+    return None
+
+
+def put(key, text):
+    if CACHE_DISABLED:
+        return
+
+    try:
+        with _db_lock:
+            db = _connection()
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, text, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, now, now)
+            )
+            # Drop expired rows, then the least recently used ones past the size bound
+            db.execute("DELETE FROM responses WHERE created_at <= ?", (now - CACHE_TTL_SECONDS,))
+            db.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (CACHE_MAX_ENTRIES,)
+            )
+            db.commit()
+    except sqlite3.Error as e:
+        print(f"LLM cache write failed: {e}", file=sys.stderr)
+
+
+def cached_create(create, parse, **request):
+    """Call create(**request) unless a cached answer exists; return parse(text).
+
+    A reply that doesn't parse gets one repair retry. Only answers that parse are
+    stored, so a malformed reply is never replayed.
+    """
+    key = make_key(request)
+    text = get(key)
+    tracing.annotate(cache_hit=text is not None)
+    if text is not None:
+        return parse(text)
+
+    response = create(**request)
+    tracing.record_usage(response)
+    text = response.content[0].text.strip()
+    try:
+        result = parse(text)
+    except (ValueError, KeyError, TypeError) as e:
+        # One repair retry: show the model its reply and the parse error
+        tracing.count("repairs")
+        response = create(**claude_client.repair_request(request, text, e))
+        tracing.record_usage(response)
+        text = response.content[0].text.strip()
+        result = parse(text)
+    put(key, text)
+    return result
+
+
+async def cached_create_async(create, parse, **request):
+    """Async variant of cached_create for AsyncAnthropic clients."""
+    key = make_key(request)
+    text = get(key)
+    tracing.annotate(cache_hit=text is not None)
+    if text is not None:
+        return parse(text)
+
+    response = await create(**request)
+    tracing.record_usage(response)
+    text = response.content[0].text.strip()
+    try:
+        result = parse(text)
+    except (ValueError, KeyError, TypeError) as e:
+        # One repair retry: show the model its reply and the parse error
+        tracing.count("repairs")
+        response = await create(**claude_client.repair_request(request, text, e))
+        tracing.record_usage(response)
+        text = response.content[0].text.strip()
+        result = parse(text)
+    put(key, text)
+    return result
@@ -0,0 +1,125 @@
+import re
+
+import eligibility
+
+# Deterministic local scoring of vector search candidates, without calling Claude.
+#
+# Each candidate's score is a weighted sum of three parts, each in [0, 1]:
+#
+#   distance     vector similarity, min-max scaled across the candidates, so clear
+#                separations in distance carry through and near-ties don't
+#   keywords     terms the student's key_activities share with the scholarship's
+#                emphasis_areas and values_mission (saturating at KEYWORD_SATURATION)
+#   eligibility  how comfortably the student clears the requirements: GPA margin over
+#                the minimum, and whether the scholarship targets their field and level
+#                (0.5 where the scholarship or the student doesn't say)
+#
+# The matcher uses it to trim candidates before the LLM rerank ("hybrid") or instead
+# of it ("local"); see MATCH_RANKING in scholarship_matcher.py.
+
+WEIGHTS = {"distance": 0.5, "keywords": 0.3, "eligibility": 0.2}
+KEYWORD_SATURATION = 3
+# GPA points over the minimum that count as a full margin
+GPA_MARGIN_SCALE = 1.0
+
+_STOPWORDS = frozenset("""
+    and the for with from that this who are was were have has their them they our your its into
+    about over under than then also more most such all any each other through while where when
+    student students scholarship scholarships award awards program
+""".split())
+
+
+def terms(text):
+    """Lowercase content words of text, with a plural "s" dropped."""
+    words = re.findall(r"[a-z]+", (text or "").lower())
+    return {word[:-1] if len(word) > 4 and word.endswith("s") and not word.endswith("ss") else word
+            for word in words if len(word) > 2 and word not in _STOPWORDS}
+
+
+def _neutral_or(condition, value):
+    """value where condition holds, 0.5 elsewhere."""
+    import numpy as np
+    return np.where(condition, value, 0.5)
+
+
+def score_candidates(structured_data, matches):
+    """Per-candidate scores: a dict of numpy arrays "distance", "keywords", "eligibility", "score"."""
+    import numpy as np
+
+    metadatas = [match.get("metadata") or {} for match in matches]
+
+    similarity = 1 - np.array([match["distance"] for match in matches], dtype=np.float64)
+    spread = similarity.max() - similarity.min()
+    distance = (similarity - similarity.min()) / spread if spread > 1e-9 else np.ones_like(similarity)
+
+    # Candidates x student terms incidence matrix
+    student_terms = sorted(terms(" ".join(structured_data.get("key_activities") or [])))
+    emphasis = [terms(f"{m.get('emphasis_areas') or ''} {m.get('values_mission') or ''}") for m in metadatas]
+    shared = np.array([[term in candidate for term in student_terms] for candidate in emphasis],
+                      dtype=np.float64).reshape(len(matches), len(student_terms))
+    keywords = np.minimum(shared.sum(axis=1) / KEYWORD_SATURATION, 1.0)
+
+    fields = [eligibility.normalize_eligibility(m) for m in metadatas]
+    gpa = structured_data.get("gpa")
+    min_gpa = np.array([f["min_gpa"] for f in fields], dtype=np.float64)
+    gpa_margin = _neutral_or(
+        (min_gpa > 0) & isinstance(gpa, (int, float)),
+        np.clip(((gpa if isinstance(gpa, (int, float)) else 0.0) - min_gpa) / GPA_MARGIN_SCALE, 0, 1)
+    )
+
+    student_field = terms(structured_data.get("field_of_study"))
+    field_terms = [terms(m.get("fields_of_study")) for m in metadatas]
+    field_fit = _neutral_or(
+        np.array([bool(t) and bool(student_field) for t in field_terms]),
+        np.array([1.0 if t & student_field else 0.0 for t in field_terms])
+    )
+
+    level = (structured_data.get("degree_level") or "").lower()
+    levels_listed = np.array([not all(f[eligibility.level_field(l)] for l in eligibility.DEGREE_LEVELS)
+                              for f in fields])
+    level_fit = _neutral_or(
+        levels_listed & (level in eligibility.DEGREE_LEVELS),
+        np.array([1.0 if level in eligibility.DEGREE_LEVELS and f[eligibility.level_field(level)] else 0.0
+                  for f in fields])
+    )
+    eligibility_fit = (gpa_margin + field_fit + level_fit) / 3
+
+    score = (WEIGHTS["distance"] * distance + WEIGHTS["keywords"] * keywords
+             + WEIGHTS["eligibility"] * eligibility_fit)
+    return {"distance": distance, "keywords": keywords, "eligibility": eligibility_fit, "score": score,
+            "shared_terms": [[t for t, hit in zip(student_terms, row) if hit] for row in shared]}
+
+
+def _order(scores):
+    """Candidate indices, best local score first (vector order on ties)."""
+    import numpy as np
+    return list(np.argsort(-scores["score"], kind="stable"))
+
+
+def prerank(structured_data, matches, keep):
+    """The `keep` best candidates by local score, best first."""
+    if len(matches) <= keep:
+        return matches
+    scores = score_candidates(structured_data, matches)
+    return [matches[i] for i in _order(scores)[:keep]]
+
+
+def local_ranking(structured_data, matches, top_k=5):
+    """The top_k candidates ranked locally, with rank, match_score and reasoning like the LLM rerank."""
+    if not matches:
+        return []
+
+    scores = score_candidates(structured_data, matches)
+    ranked = []
+    for position, i in enumerate(_order(scores)[:top_k], 1):
+        match = matches[i].copy()
+        match["rank"] = position
+        match["match_score"] = int(round(scores["score"][i] * 100))
+        shared = scores["shared_terms"][i]
+        match["reasoning"] = (
+            f"Ranked locally: {'close' if scores['distance'][i] >= 0.5 else 'weaker'} semantic match"
+            + (f", emphasis on {', '.join(shared)} matches your activities" if shared else "")
+            + f", eligibility fit {scores['eligibility'][i]:.0%}."
+        )
+        ranked.append(match)
+    return ranked
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+import llm_cache
+
+# Per-profile analysis shared between the matcher and essay workers.
+#
+# The matcher stores what it derives from a student profile: the structured
+# eligibility data, the enhanced (weighted) profile text and its embedding. The essay
+# generator adds the strategy clusters the student can execute, once per strategy map
+# version. Artifacts are keyed by a hash of the profile (the "profileId" returned with
+# match results), so later essay requests for the same student reuse them instead of
+# analysing the profile again. SQLite in WAL mode, shared by every worker process;
+# entries expire after PROFILE_ARTIFACT_TTL seconds (one session, by default a day).
+
+ARTIFACT_DB_PATH = os.environ.get(
+    "PROFILE_ARTIFACT_DB",
+    os.path.join(os.path.dirname(__file__), ".cache", "profile_artifacts.sqlite3")
+)
+ARTIFACT_TTL_SECONDS = float(os.environ.get("PROFILE_ARTIFACT_TTL", str(24 * 3600)))
+ARTIFACTS_DISABLED = os.environ.get("PROFILE_ARTIFACTS_DISABLED") == "1"
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def _connection():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(ARTIFACT_DB_PATH) or ".", exist_ok=True)
+        _db = sqlite3.connect(ARTIFACT_DB_PATH, timeout=10, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+            profile_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )""")
+        _db.commit()
+    return _db
+
+
+def profile_id(student_profile):
+    """Stable ID for a student profile form: the same answers give the same ID."""
+    canonical = json.dumps(student_profile, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def load(artifact_id):
+    """The stored artifact dict, or None if there is none (or it expired, or caching is bypassed)."""
+    if llm_cache.bypassed():
+        return None
+    return _read(artifact_id)
+
+
+def student_profile(artifact_id):
+    """The profile form an artifact was made from (even when caching is bypassed), or None."""
+    return (_read(artifact_id) or {}).get("student_profile")
+
+
+def _read(artifact_id):
+    if ARTIFACTS_DISABLED or not artifact_id:
+        return None
+
+    try:
+        with _db_lock:
+            row = _connection().execute(
+                "SELECT data FROM artifacts WHERE profile_id = ? AND updated_at > ?",
+                (artifact_id, time.time() - ARTIFACT_TTL_SECONDS)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Profile artifact read failed: {e}", file=sys.stderr)
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def save(artifact_id, **fields):
+    """Merge fields into the artifact (creating it), refreshing its expiry.
+
+    The read and the write share one IMMEDIATE transaction, so a worker process saving
+    other fields of the same artifact at the same time can't overwrite these.
+    """
+    if ARTIFACTS_DISABLED or not artifact_id:
+        return
+
+    try:
+        with _db_lock:
+            db = _connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = db.execute(
+                    "SELECT data FROM artifacts WHERE profile_id = ? AND updated_at > ?",
+                    (artifact_id, now - ARTIFACT_TTL_SECONDS)
+                ).fetchone()
+                artifact = json.loads(row[0]) if row else {"profile_id": artifact_id, "created_at": now}
+                artifact.update(fields)
+                db.execute(
+                    "INSERT OR REPLACE INTO artifacts (profile_id, data, updated_at) VALUES (?, ?, ?)",
+                    (artifact_id, json.dumps(artifact), now)
+                )
+                db.execute("DELETE FROM artifacts WHERE updated_at <= ?", (now - ARTIFACT_TTL_SECONDS,))
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+    except sqlite3.Error as e:
+        print(f"Profile artifact write failed: {e}", file=sys.stderr)
@@ -1,55 +1,125 @@
 import sys
 import json
-import requests
-import chromadb
-import anthropic
+import asyncio
+import time
 import os
-
-# Get API keys from environment variables
-NOMIC_API_KEY = os.environ.get("NOMIC_API_KEY")
-CLAUDE_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
-
-if not NOMIC_API_KEY:
-    raise ValueError("NOMIC_API_KEY environment variable is required")
-if not CLAUDE_API_KEY:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is required")
-
-# Initialize Claude
-claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
+import contextvars
+
+import embeddings
+import eligibility
+import candidate_cards
+import llm_cache
+import prerank
+import profile_artifacts
+import tracing
+from async_runtime import run_async, create_message, create_message_sync, create_parsed, cached_system
+
+# chromadb and anthropic are imported on first use rather than here, so spawning the
+# script (or restarting a worker) doesn't pay for them before it has a request.
+# (NOMIC_API_KEY is only needed by the nomic embedding backend; see embeddings.py)
+
+# Per-stage timeouts (seconds) for the concurrent profile analysis
+EXTRACT_TIMEOUT_SECONDS = float(os.environ.get("MATCH_EXTRACT_TIMEOUT", "30"))
+ENHANCE_TIMEOUT_SECONDS = float(os.environ.get("MATCH_ENHANCE_TIMEOUT", "60"))
+
+# Rerank prompt layout: "cards" sends compact candidate cards (see candidate_cards.py)
+# and takes the rankings back as a tool call; "full" is the original full-text prompt
+RERANK_MODE = os.environ.get("MATCH_RERANK_MODE", "cards")
+# Cards mode only: split the candidates across this many concurrent rerank calls
+RERANK_SHARDS = int(os.environ.get("MATCH_RERANK_SHARDS", "1"))
+
+# Final ranking: "llm" reranks every candidate with Claude; "hybrid" has the local
+# scorer (prerank.py) keep the best HYBRID_KEEP for Claude; "local" skips Claude.
+# Requests can override it with "ranking".
+RANKING_MODES = ("llm", "hybrid", "local")
+RANKING_MODE = os.environ.get("MATCH_RANKING", "llm")
+HYBRID_KEEP = int(os.environ.get("MATCH_HYBRID_KEEP", "6"))
+
+# Vector search backend: "chroma" queries the Chroma collection; "numpy" searches the
+# exported in-process index (see vector_index.py); "service" asks the host's shared
+# vector service (see vector_service.py)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
 
 # Initialize ChromaDB - path relative to project root
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "attached_assets", "chroma_scholarship_db")
 
-def embed_text_nomic(text):
-    """Generates an embedding for a given text using Nomic Embed API."""
-    if len(text) > 8000:
-        text = text[:8000]
-
+# Stages that failed during the current match_scholarships call. A result with any is
+# marked "degraded" so the server doesn't cache it, whether or not tracing is on.
+_failures = contextvars.ContextVar("match_failures", default=None)
+
+# Reused across requests when running as a long-lived worker
+_claude_client = None
+_chroma_client = None
+_collection = None
+
+
+def _record_failure(error, fallback=True):
+    """Note a failed stage on its span and on the current request."""
+    if fallback:
+        tracing.annotate(error=repr(error), fallback=True)
+    else:
+        tracing.annotate(error=repr(error))
+    failures = _failures.get()
+    if failures is not None:
+        failures.append(repr(error))
+
+
+def get_claude_client():
+    """Return the process-wide Anthropic client, creating it on first use."""
+    global _claude_client
+    if _claude_client is None:
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable is required")
+        import anthropic
+        _claude_client = anthropic.Anthropic(api_key=api_key, max_retries=0)  # retried by claude_client
+    return _claude_client
+
+
+def get_chroma_client():
+    """Return the process-wide ChromaDB client, opening it on first use."""
+    global _chroma_client
+    if _chroma_client is None:
+        import chromadb
+        _chroma_client = chromadb.PersistentClient(path=DB_PATH)
+    return _chroma_client
+
+
+def get_scholarships_collection():
+    """Return the process-wide handle on the scholarships collection."""
+    global _collection
+    if _collection is None:
+        _collection = get_chroma_client().get_collection("scholarships")
+    return _collection
+
+
+def warm_up():
+    """Open the clients and the embedding backend before the first request."""
     try:
-        url = "https://api-atlas.nomic.ai/v1/embedding/text"
-        headers = {
-            "Authorization": f"Bearer {NOMIC_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "texts": [text],
-            "model": "nomic-embed-text-v1.5"
-        }
-
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-
-        return data['embeddings'][0]
-
+        get_claude_client()
+        if VECTOR_BACKEND == "numpy":
+            import vector_index
+            vector_index.get_index()
+        elif VECTOR_BACKEND == "service":
+            import vector_service
+            vector_service.get_client().ping()
+        else:
+            get_scholarships_collection()
     except Exception as e:
-        print(f"Error generating embedding: {e}", file=sys.stderr)
-        return None
+        print(f"Warm-up failed: {e}", file=sys.stderr)
+    embeddings.warm_up()
 
+def embed_text_nomic(text):
+    """Generates an embedding for a given text using Nomic Embed API.
+
+    Goes through the shared embedding service, so repeated profiles are served from
+    cache and concurrent calls share one HTTP request.
+    """
+    return embeddings.embed_text(text)
 
-def extract_profile_structure(raw_profile):
-    """Extract structured data from profile for eligibility filtering."""
-    prompt = f"""Extract eligibility information from this student profile.
+
+def _profile_structure_prompt(raw_profile):
+    return f"""Extract eligibility information from this student profile.
 
 {raw_profile}
 
@@ -67,37 +137,47 @@ Be conservative - only extract what is explicitly stated. Use null if uncertain.
 For key_activities, list their 3-5 most significant activities/involvements.
 """
 
+
+def _parse_profile_structure(raw_text):
+    if raw_text.startswith("```"):
+        raw_text = raw_text.split("```")[1]
+        if raw_text.startswith("json"):
+            raw_text = raw_text[4:]
+
+    return json.loads(raw_text.strip())
+
+
+def _empty_profile_structure():
+    return {
+        "gpa": None,
+        "degree_level": "unknown",
+        "field_of_study": None,
+        "citizenship": None,
+        "age": None,
+        "key_activities": []
+    }
+
+
+def extract_profile_structure(raw_profile):
+    """Extract structured data from profile for eligibility filtering."""
     try:
-        response = claude_client.messages.create(
+        return llm_cache.cached_create(
+            create_message_sync,
+            _parse_profile_structure,
             model="claude-sonnet-4-20250514",
             max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
+            hedge=True,
+            messages=[{"role": "user", "content": _profile_structure_prompt(raw_profile)}]
         )
 
-        raw_text = response.content[0].text.strip()
-        if raw_text.startswith("```"):
-            raw_text = raw_text.split("```")[1]
-            if raw_text.startswith("json"):
-                raw_text = raw_text[4:]
-        
-        structured_data = json.loads(raw_text.strip())
-        return structured_data
-
     except Exception as e:
         print(f"Failed to extract structure: {e}", file=sys.stderr)
-        return {
-            "gpa": None,
-            "degree_level": "unknown",
-            "field_of_study": None,
-            "citizenship": None,
-            "age": None,
-            "key_activities": []
-        }
+        _record_failure(e)
+        return _empty_profile_structure()
 
 
-def enhance_and_weight_profile(student_profile, structured_data):
-    """Enhance profile AND apply true weighting by repeating key sections."""
-    prompt = f"""Analyze this student profile and create an enhanced description optimized for scholarship matching.
+def _enhance_prompt(student_profile):
+    return f"""Analyze this student profile and create an enhanced description optimized for scholarship matching.
 
 CRITICAL RULES:
 1. ONLY elaborate on details EXPLICITLY mentioned - do not invent anything
@@ -120,111 +200,280 @@ Create a comprehensive description emphasizing (in priority order):
 Write 2-3 paragraphs that showcase what makes them special. Stay truthful to the original profile.
 """
 
+
+def weight_profile(enhanced, structured_data):
+    """Apply TRUE weighting by repeating key activities after the enhanced description."""
+    weighted_profile = enhanced + "\n\n"
+
+    if structured_data.get("key_activities"):
+        activities_text = "Core strengths and activities: " + " | ".join(structured_data["key_activities"])
+        weighted_profile += activities_text + "\n"
+        weighted_profile += activities_text + "\n"  # Repeat for semantic weight
+
+    return weighted_profile
+
+
+def enhance_and_weight_profile(student_profile, structured_data):
+    """Enhance profile AND apply true weighting by repeating key sections."""
     try:
-        response = claude_client.messages.create(
+        response = create_message_sync(
             model="claude-sonnet-4-20250514",
             max_tokens=1200,
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": _enhance_prompt(student_profile)}]
         )
+        tracing.record_usage(response)
         
         enhanced = response.content[0].text.strip()
-        
-        # Apply TRUE weighting by repeating key activities
-        weighted_profile = enhanced + "\n\n"
-        
-        if structured_data.get("key_activities"):
-            activities_text = "Core strengths and activities: " + " | ".join(structured_data["key_activities"])
-            weighted_profile += activities_text + "\n"
-            weighted_profile += activities_text + "\n"  # Repeat for semantic weight
-        
-        return weighted_profile
+        return weight_profile(enhanced, structured_data)
         
     except Exception as e:
         print(f"Enhancement failed, using original: {e}", file=sys.stderr)
+        _record_failure(e)
         return student_profile + "\n\n" + student_profile
 
 
-def vector_search(enhanced_profile, structured_data, chroma_client, top_k=5, distance_threshold=1.0):
-    """Find top matching scholarships with distance filtering AND metadata filtering."""
-    try:
-        scholarships_collection = chroma_client.get_collection("scholarships")
-    except Exception as e:
-        print(f"Error loading scholarships collection: {e}", file=sys.stderr)
-        return []
-    
-    student_vector = embed_text_nomic(enhanced_profile)
+async def _extract_profile_structure_async(raw_profile):
+    with tracing.span("extract_profile_structure"):
+        try:
+            return await asyncio.wait_for(
+                llm_cache.cached_create_async(
+                    create_message,
+                    _parse_profile_structure,
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=500,
+                    hedge=True,
+                    messages=[{"role": "user", "content": _profile_structure_prompt(raw_profile)}]
+                ),
+                timeout=EXTRACT_TIMEOUT_SECONDS
+            )
+
+        except Exception as e:
+            # asyncio.TimeoutError lands here too; wait_for has already cancelled the call
+            print(f"Failed to extract structure: {e!r}", file=sys.stderr)
+            _record_failure(e)
+            return _empty_profile_structure()
+
+
+async def _enhance_profile_async(student_profile):
+    """Returns the enhanced description, or None if the call failed or timed out."""
+    with tracing.span("enhance_profile"):
+        try:
+            response = await asyncio.wait_for(
+                create_message(
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=1200,
+                    messages=[{"role": "user", "content": _enhance_prompt(student_profile)}]
+                ),
+                timeout=ENHANCE_TIMEOUT_SECONDS
+            )
+            tracing.record_usage(response)
+            return response.content[0].text.strip()
+
+        except Exception as e:
+            print(f"Enhancement failed, using original: {e!r}", file=sys.stderr)
+            _record_failure(e)
+            return None
+
+
+async def analyze_profile_async(raw_profile):
+    """Run extraction and enhancement concurrently; returns (structured_data, enhanced_profile).
+
+    The enhancement prompt doesn't depend on the extracted structure - only the final
+    weighting step does - so both Claude calls are in flight at the same time.
+    """
+    structured_data, enhanced = await asyncio.gather(
+        _extract_profile_structure_async(raw_profile),
+        _enhance_profile_async(raw_profile)
+    )
+
+    if enhanced is None:
+        return structured_data, raw_profile + "\n\n" + raw_profile
+
+    return structured_data, weight_profile(enhanced, structured_data)
+
+
+# Whether each collection's rows carry the typed fields from
+# eligibility.normalize_eligibility: {name: (typed, checked_at)}. A typed collection
+# stays typed; an untyped one is sampled again after TYPED_RECHECK_SECONDS, so a
+# backfill is picked up without a restart.
+_typed_collections = {}
+TYPED_RECHECK_SECONDS = 60
+
+
+def _has_typed_eligibility(collection):
+    """Whether the collection has been normalized, sampling one row at most once a minute."""
+    typed, checked_at = _typed_collections.get(collection.name, (False, None))
+    if typed or (checked_at is not None and time.monotonic() - checked_at < TYPED_RECHECK_SECONDS):
+        return typed
+    sample = collection.get(limit=1, include=["metadatas"])
+    typed = bool(sample["metadatas"]) and eligibility.is_normalized(sample["metadatas"][0] or {})
+    _typed_collections[collection.name] = (typed, time.monotonic())
+    return typed
+
+
+def vector_search(enhanced_profile, structured_data, chroma_client=None, top_k=5, distance_threshold=1.0,
+                  student_vector=None):
+    """Find top matching scholarships with distance filtering AND metadata filtering.
+
+    Searches the VECTOR_BACKEND index unless a specific chroma_client is given. Pass
+    student_vector to skip embedding enhanced_profile.
+    """
+    if student_vector is None:
+        with tracing.span("embed"):
+            student_vector = embed_text_nomic(enhanced_profile)
     
     if student_vector is None:
         print("Failed to generate embedding", file=sys.stderr)
         return []
     
+    with tracing.span("index_query"):
+        try:
+            if chroma_client:
+                return search_by_vectors(chroma_client.get_collection("scholarships"), [student_vector],
+                                         [structured_data], top_k=top_k, distance_threshold=distance_threshold)[0]
+            return search_many([student_vector], [structured_data],
+                               top_k=top_k, distance_threshold=distance_threshold)[0]
+        except Exception as e:
+            print(f"Error in vector search: {e}", file=sys.stderr)
+            _record_failure(e, fallback=False)
+            return []
+
+
+def search_many(vectors, structured_list, top_k=5, distance_threshold=1.0):
+    """Vector search for several students against the configured VECTOR_BACKEND."""
+    if VECTOR_BACKEND == "numpy":
+        import vector_index
+        return vector_index.get_index().search(vectors, structured_list, top_k, distance_threshold)
+    if VECTOR_BACKEND == "service":
+        import vector_service
+        return vector_service.get_client().search(vectors, structured_list, top_k, distance_threshold)
+    return search_by_vectors(get_scholarships_collection(), vectors, structured_list, top_k, distance_threshold)
+
+
+def search_by_vectors(scholarships_collection, vectors, structured_list, top_k=5, distance_threshold=1.0):
+    """Vector search for several students at once; returns one match list per student.
+
+    Students with the same eligibility filter share a single multi-query call.
+    """
     collection_count = scholarships_collection.count()
+    if collection_count == 0:
+        return [[] for _ in vectors]
     
-    try:
-        # Get more results initially to allow for filtering
-        results = scholarships_collection.query(
-            query_embeddings=[student_vector],
-            n_results=min(top_k * 3, collection_count)
-        )
-        
-        matches = []
-        filtered_out = {"gpa": 0, "degree_level": 0, "distance": 0}
+    # Eligibility goes into the query itself when the collection has typed
+    # eligibility fields; otherwise fall back to post-filtering in Python
+    typed = _has_typed_eligibility(scholarships_collection)
+    groups = {}
+    for i, structured_data in enumerate(structured_list):
+        where = eligibility.where_clause(structured_data) if typed else None
+        groups.setdefault(json.dumps(where, sort_keys=True), (where, []))[1].append(i)
+    
+    all_matches = [[] for _ in vectors]
+    all_filtered = [{} for _ in vectors]
+    queries = 0
+    for where, members in groups.values():
+        n_results = min(top_k if where else top_k * 3, collection_count)
         
-        if results["ids"] and len(results["ids"]) > 0:
-            for i, scholarship_id in enumerate(results["ids"][0]):
-                distance = results["distances"][0][i]
-                metadata = results["metadatas"][0][i]
-                full_text = results["documents"][0][i] if results["documents"] else ""
-                
-                # Filter by distance threshold
-                if distance > distance_threshold:
-                    filtered_out["distance"] += 1
-                    continue
-                
-                # Filter by GPA if both student and scholarship have GPA data
-                if structured_data.get("gpa") and metadata.get("minimum_gpa"):
-                    try:
-                        min_gpa = float(metadata["minimum_gpa"])
-                        if structured_data["gpa"] < min_gpa:
-                            filtered_out["gpa"] += 1
-                            continue
-                    except (ValueError, TypeError):
-                        pass
+        while members:
+            query_args = {"query_embeddings": [vectors[i] for i in members], "n_results": n_results}
+            if where:
+                query_args["where"] = where
+            results = scholarships_collection.query(**query_args)
+            queries += 1
+            
+            need_more = []
+            for row, i in enumerate(members):
+                matches, filtered_out, returned = _collect_matches(
+                    results, row, structured_list[i], distance_threshold, typed
+                )
+                all_matches[i] = matches
+                all_filtered[i] = filtered_out
                 
-                # Filter by degree level if specified
-                student_level = structured_data.get("degree_level", "").lower()
-                scholarship_levels = metadata.get("degree_levels", "").lower()
-                
-                if scholarship_levels and student_level != "unknown":
-                    if scholarship_levels and student_level not in scholarship_levels:
-                        if ("undergraduate" in scholarship_levels and student_level == "graduate") or \
-                           ("graduate" in scholarship_levels and student_level == "high school"):
-                            filtered_out["degree_level"] += 1
-                            continue
-                
-                matches.append({
-                    "scholarship": scholarship_id,
-                    "distance": distance,
-                    "url": metadata.get("url", "N/A"),
-                    "full_text": full_text,
-                    "metadata": metadata
-                })
+                # Results come back nearest first, so stop once we have enough, once rows
+                # start failing the distance cutoff (the rest are farther), or once the
+                # collection has nothing more to give
+                if not (len(matches) >= top_k or filtered_out["distance"] or
+                        returned < n_results or n_results >= collection_count):
+                    need_more.append(i)
+            
+            members = need_more
+            n_results = min(n_results * 2, collection_count)
+    
+    filtered_totals = {}
+    for filtered_out in all_filtered:
+        for reason, count in filtered_out.items():
+            filtered_totals[reason] = filtered_totals.get(reason, 0) + count
+    tracing.annotate(backend="chroma", queries=queries, where_filter=typed, filtered_out=filtered_totals)
+    
+    # Sort by distance and take top k
+    return [sorted(matches, key=lambda x: x['distance'])[:top_k] for matches in all_matches]
+
+
+def _collect_matches(results, row, structured_data, distance_threshold, typed=True):
+    """Turn one query row into matches; returns (matches, filtered_out, rows_returned)."""
+    matches = []
+    filtered_out = {"gpa": 0, "degree_level": 0, "citizenship": 0, "distance": 0}
+    returned = len(results["ids"][row]) if results["ids"] else 0
+    
+    for i in range(returned):
+        scholarship_id = results["ids"][row][i]
+        distance = results["distances"][row][i]
+        metadata = results["metadatas"][row][i] or {}
+        full_text = results["documents"][row][i] if results["documents"] else ""
         
-        # Sort by distance and take top k
-        matches = sorted(matches, key=lambda x: x['distance'])[:top_k]
+        # Filter by distance threshold
+        if distance > distance_threshold:
+            filtered_out["distance"] += 1
+            continue
         
-        return matches
+        # Already enforced by `where` on typed rows; needed when post-filtering, where
+        # degree levels get the free-text rule the matcher has always used there
+        reason = eligibility.ineligibility_reason(structured_data, metadata, lenient_levels=not typed)
+        if reason:
+            filtered_out[reason] += 1
+            continue
         
-    except Exception as e:
-        print(f"Error in vector search: {e}", file=sys.stderr)
-        return []
+        matches.append({
+            "scholarship": scholarship_id,
+            "distance": distance,
+            "url": metadata.get("url", "N/A"),
+            "full_text": full_text,
+            "metadata": metadata
+        })
+    
+    return matches, filtered_out, returned
 
 
-def llm_rerank(enhanced_profile, structured_data, matches, top_k=5):
-    """Use Claude to intelligently re-rank scholarships with full context."""
-    if not matches:
-        return []
-    
+# Static rerank instructions, sent as prompt-cached system blocks; the student and the
+# candidates go in the user message
+_RERANK_PRIORITIES = """You are an expert scholarship advisor. Analyze how well each scholarship matches the student.
+
+CRITICAL PRIORITIES (in order):
+1. **Activity and emphasis alignment** - Do the student's activities match what the scholarship emphasizes?
+2. **Values and mission fit** - Do the student's demonstrated values align with scholarship mission?
+3. **Leadership and impact** - Does the student's impact match what the scholarship rewards?
+4. **Eligibility match** - Degree level, field of study, citizenship
+5. **Academic requirements** - GPA (least important unless scholarship is primarily academic)"""
+
+_RERANK_JSON_FORMAT = """Return ONLY valid JSON in this exact format:
+{
+  "rankings": [
+    {
+      "rank": 1,
+      "scholarship_id": <id number from the scholarship list>,
+      "scholarship_name": "<exact name>",
+      "match_score": <0-100>,
+      "reasoning": "<2-3 sentences explaining fit, focusing on activity/emphasis alignment>",
+      "key_strengths": ["strength1", "strength2"]
+    }
+  ]
+}
+
+IMPORTANT: Return ONLY the JSON, no additional text."""
+
+_RERANK_CARDS_FORMAT = """Scholarships are given one per line as compact JSON cards. Submit your rankings, best first, with the submit_rankings tool, keeping each reasoning to 2-3 sentences on activity/emphasis alignment."""
+
+
+def _rerank_prompt(enhanced_profile, structured_data, matches, top_k):
     # Format scholarships with FULL text AND metadata
     scholarship_details = []
     for i, match in enumerate(matches, 1):
@@ -243,16 +492,7 @@ def llm_rerank(enhanced_profile, structured_data, matches, top_k=5):
             "award_amount": meta.get("award_amount")
         })
     
-    prompt = f"""You are an expert scholarship advisor. Analyze how well each scholarship matches this student.
-
-CRITICAL PRIORITIES (in order):
-1. **Activity and emphasis alignment** - Do the student's activities match what the scholarship emphasizes?
-2. **Values and mission fit** - Do the student's demonstrated values align with scholarship mission?
-3. **Leadership and impact** - Does the student's impact match what the scholarship rewards?
-4. **Eligibility match** - Degree level, field of study, citizenship
-5. **Academic requirements** - GPA (least important unless scholarship is primarily academic)
-
-STUDENT PROFILE:
+    return f"""STUDENT PROFILE:
 {enhanced_profile}
 
 STUDENT DATA:
@@ -264,70 +504,200 @@ STUDENT DATA:
 SCHOLARSHIPS TO EVALUATE:
 {json.dumps(scholarship_details, indent=2)}
 
-Rank the top {top_k} scholarships from best to worst match.
+Rank the top {top_k} scholarships from best to worst match."""
 
-Return ONLY valid JSON in this exact format:
-{{
-  "rankings": [
-    {{
-      "rank": 1,
-      "scholarship_id": <id number from above>,
-      "scholarship_name": "<exact name>",
-      "match_score": <0-100>,
-      "reasoning": "<2-3 sentences explaining fit, focusing on activity/emphasis alignment>",
-      "key_strengths": ["strength1", "strength2"]
-    }}
-  ]
-}}
 
-IMPORTANT: Return ONLY the JSON, no additional text."""
+def _parse_json_reply(response_text):
+    """Parse a JSON reply, tolerating a surrounding ``` code fence."""
+    if response_text.startswith("```"):
+        response_text = response_text.split("```")[1]
+        if response_text.startswith("json"):
+            response_text = response_text[4:]
+    
+    return json.loads(response_text.strip())
+
+
+def _apply_rankings(rankings_data, matches, top_k):
+    # Map rankings back to original matches
+    ranked_matches = []
+    for ranking in rankings_data.get("rankings", []):
+        scholarship_id = ranking["scholarship_id"] - 1
+        if 0 <= scholarship_id < len(matches):
+            match = matches[scholarship_id].copy()
+            match["rank"] = ranking["rank"]
+            match["match_score"] = ranking["match_score"]
+            match["reasoning"] = ranking["reasoning"]
+            ranked_matches.append(match)
+    
+    return ranked_matches[:top_k]
+
+
+RANKINGS_TOOL = {
+    "name": "submit_rankings",
+    "description": "Submit the best-matching scholarships for the student, best match first.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "rankings": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "scholarship_id": {"type": "integer", "description": "id from the scholarship card"},
+                        "match_score": {"type": "integer", "minimum": 0, "maximum": 100},
+                        "reasoning": {"type": "string"},
+                        "key_strengths": {"type": "array", "items": {"type": "string"}}
+                    },
+                    "required": ["scholarship_id", "match_score", "reasoning"]
+                }
+            }
+        },
+        "required": ["rankings"]
+    }
+}
+
+
+def _profile_for_prompt(enhanced_profile):
+    """The profile without the repeats weight_profile adds for the embedding's sake."""
+    paragraphs = []
+    for paragraph in enhanced_profile.strip().split("\n\n"):
+        lines = []
+        for line in paragraph.splitlines():
+            if not lines or line != lines[-1]:
+                lines.append(line)
+        paragraph = "\n".join(lines).strip()
+        if paragraph and paragraph not in paragraphs:
+            paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs)
+
+
+def _cards_prompt(profile_text, structured_data, cards, top_k):
+    return f"""STUDENT PROFILE:
+{profile_text}
+
+STUDENT DATA: GPA {structured_data.get('gpa', 'not specified')}; degree level {structured_data.get('degree_level', 'unknown')}; field of study {structured_data.get('field_of_study', 'not specified')}; key activities: {', '.join(structured_data.get('key_activities', []))}
+
+SCHOLARSHIPS:
+{candidate_cards.format_cards(cards)}
+
+Call submit_rankings with the best {top_k} scholarships."""
+
+
+def _tool_input(response, name):
+    for block in response.content:
+        if getattr(block, "type", None) == "tool_use" and block.name == name:
+            return block.input
+    raise ValueError(f"Reply has no {name} tool call")
+
+
+async def _rank_shard(profile_text, structured_data, cards, top_k):
+    top_k = min(top_k, len(cards))
+    response = await create_message(
+        model="claude-sonnet-4-20250514",
+        max_tokens=300 + 200 * top_k,
+        temperature=0.3,
+        tools=[RANKINGS_TOOL],
+        tool_choice={"type": "tool", "name": RANKINGS_TOOL["name"]},
+        system=cached_system(_RERANK_PRIORITIES, _RERANK_CARDS_FORMAT),
+        messages=[{"role": "user", "content": _cards_prompt(profile_text, structured_data, cards, top_k)}]
+    )
+    tracing.record_usage(response)
+    return _tool_input(response, RANKINGS_TOOL["name"])["rankings"]
+
+
+def _merge_rankings(shard_rankings, matches):
+    """Merge per-shard rankings by score (nearest first on ties), one entry per scholarship."""
+    def order(ranking):
+        index = ranking.get("scholarship_id", 0) - 1
+        distance = matches[index]["distance"] if 0 <= index < len(matches) else float("inf")
+        return -ranking.get("match_score", 0), distance
+
+    merged, seen = [], set()
+    for ranking in sorted((r for rankings in shard_rankings for r in rankings), key=order):
+        if ranking.get("scholarship_id") not in seen:
+            seen.add(ranking.get("scholarship_id"))
+            merged.append(ranking)
+    return merged
+
+
+async def _rerank_cards(enhanced_profile, structured_data, matches, top_k):
+    """Card-mode rerank: compact prompt, tool-call rankings, optionally sharded."""
+    cards = [candidate_cards.candidate_card(i, match) for i, match in enumerate(matches, 1)]
+    profile_text = _profile_for_prompt(enhanced_profile)
+
+    # Interleave so every shard gets a mix of near and far candidates
+    shard_count = max(1, min(RERANK_SHARDS, len(cards) // top_k))
+    shards = [cards[i::shard_count] for i in range(shard_count)]
+    tracing.annotate(mode="cards", shards=shard_count)
+
+    replies = await asyncio.gather(
+        *(_rank_shard(profile_text, structured_data, shard, top_k) for shard in shards),
+        return_exceptions=True
+    )
+    shard_rankings = []
+    for reply in replies:
+        if isinstance(reply, BaseException):
+            print(f"Re-ranking shard failed: {reply!r}", file=sys.stderr)
+            _record_failure(reply, fallback=False)
+        else:
+            shard_rankings.append(reply)
+    if not shard_rankings:
+        raise RuntimeError("Every rerank call failed")
+
+    rankings = shard_rankings[0] if shard_count == 1 else _merge_rankings(shard_rankings, matches)
+    for position, ranking in enumerate(rankings, 1):
+        ranking["rank"] = position
+    return _apply_rankings({"rankings": rankings}, matches, top_k)
+
+
+def llm_rerank(enhanced_profile, structured_data, matches, top_k=5, ranking=None):
+    """Use Claude to intelligently re-rank scholarships with full context."""
+    if not matches:
+        return []
+    
+    return run_async(llm_rerank_async(enhanced_profile, structured_data, matches, top_k, ranking))
+
 
+async def llm_rerank_async(enhanced_profile, structured_data, matches, top_k=5, ranking=None):
+    """Async llm_rerank; batch matching awaits it directly.
+
+    ranking picks one of RANKING_MODES (default RANKING_MODE). If Claude fails, the
+    local ranking is returned instead.
+    """
+    if not matches:
+        return []
+    
+    ranking = ranking or RANKING_MODE
+    tracing.annotate(ranking=ranking)
+    if ranking == "local":
+        return prerank.local_ranking(structured_data, matches, top_k)
+    if ranking == "hybrid":
+        matches = prerank.prerank(structured_data, matches, max(top_k, HYBRID_KEEP))
+        tracing.annotate(candidates=len(matches))
+    
     try:
-        response = claude_client.messages.create(
+        if RERANK_MODE == "cards":
+            return await _rerank_cards(enhanced_profile, structured_data, matches, top_k)
+        
+        rankings_data = await create_parsed(
+            _parse_json_reply,
             model="claude-sonnet-4-20250514",
             max_tokens=2000,
             temperature=0.3,
-            messages=[{"role": "user", "content": prompt}]
+            system=cached_system(_RERANK_PRIORITIES, _RERANK_JSON_FORMAT),
+            messages=[{"role": "user", "content": _rerank_prompt(enhanced_profile, structured_data, matches, top_k)}]
         )
-
-        response_text = response.content[0].text.strip()
-        if response_text.startswith("```"):
-            response_text = response_text.split("```")[1]
-            if response_text.startswith("json"):
-                response_text = response_text[4:]
-        
-        rankings_data = json.loads(response_text.strip())
-        
-        # Map rankings back to original matches
-        ranked_matches = []
-        for ranking in rankings_data.get("rankings", []):
-            scholarship_id = ranking["scholarship_id"] - 1
-            if 0 <= scholarship_id < len(matches):
-                match = matches[scholarship_id].copy()
-                match["rank"] = ranking["rank"]
-                match["match_score"] = ranking["match_score"]
-                match["reasoning"] = ranking["reasoning"]
-                ranked_matches.append(match)
-        
-        return ranked_matches[:top_k]
-        
+        return _apply_rankings(rankings_data, matches, top_k)
+    
     except Exception as e:
-        print(f"Re-ranking failed, returning original matches: {e}", file=sys.stderr)
-        # Return original matches with default scores
-        for i, match in enumerate(matches[:top_k], 1):
-            match["rank"] = i
-            match["match_score"] = int((1 - match["distance"]) * 100)
-        return matches[:top_k]
+        print(f"Re-ranking failed, ranking locally: {e!r}", file=sys.stderr)
+        _record_failure(e)
+        return prerank.local_ranking(structured_data, matches, top_k)
 
 
-def match_scholarships(student_profile_dict):
-    """Main function to match scholarships given a student profile."""
-    try:
-        # Initialize ChromaDB
-        chroma_client = chromadb.PersistentClient(path=DB_PATH)
-        
-        # Build raw profile text
-        raw_profile = f"""
+def build_raw_profile(student_profile_dict):
+    """Flatten the profile form into the text the Claude prompts work from."""
+    return f"""
 Name: {student_profile_dict.get('name', 'N/A')}
 GPA: {student_profile_dict.get('gpa', 'N/A')}
 Degree Level: {student_profile_dict.get('degreeLevel', 'N/A')}
@@ -347,23 +717,74 @@ Career Goals:
 Challenges Overcome:
 {student_profile_dict.get('challenges', 'N/A')}
 """
+
+
+def match_scholarships(student_profile_dict, ranking=None):
+    """Main function to match scholarships given a student profile.
+
+    ranking overrides RANKING_MODE for this request. Unless PIPELINE_TRACING=0, the
+    result carries a "trace" with per-stage timings. "degraded" is set if any stage
+    failed or fell back.
+    """
+    failures = []
+    token = _failures.set(failures)
+    try:
+        with tracing.trace() as trace:
+            result = _match_scholarships(student_profile_dict, ranking)
+            if failures:
+                result["degraded"] = True
+            if trace is not None:
+                result["trace"] = trace.to_dict()
+            return result
+    finally:
+        _failures.reset(token)
+
+
+def _match_scholarships(student_profile_dict, ranking=None):
+    try:
+        # Fail fast on a missing API key instead of falling back at every stage
+        get_claude_client()
         
-        # Extract structured data
-        structured_data = extract_profile_structure(raw_profile)
+        # Reuse this profile's analysis from earlier in the session (see profile_artifacts.py)
+        profile_id = profile_artifacts.profile_id(student_profile_dict)
+        artifact = profile_artifacts.load(profile_id) or {}
+        analysis_stored = "enhanced_profile" in artifact
         
-        # Enhance and weight profile
-        enhanced_profile = enhance_and_weight_profile(raw_profile, structured_data)
+        with tracing.span("analyze_profile"):
+            if analysis_stored:
+                structured_data, enhanced_profile = artifact["structured_data"], artifact["enhanced_profile"]
+                tracing.annotate(cache_hit=True)
+            else:
+                # Build raw profile text, then extract structured data and enhance the profile concurrently
+                raw_profile = build_raw_profile(student_profile_dict)
+                failed_before = len(_failures.get())
+                structured_data, enhanced_profile = run_async(analyze_profile_async(raw_profile))
+                tracing.annotate(cache_hit=False)
+                # An analysis that fell back isn't kept as an artifact
+                if len(_failures.get()) == failed_before:
+                    profile_artifacts.save(profile_id, student_profile=student_profile_dict,
+                                           structured_data=structured_data, enhanced_profile=enhanced_profile)
+                    analysis_stored = True
         
         # Vector search
-        matches = vector_search(enhanced_profile, structured_data, chroma_client, top_k=15)
+        with tracing.span("vector_search"):
+            student_vector = artifact.get("embedding")
+            if student_vector is None:
+                with tracing.span("embed"):
+                    student_vector = embed_text_nomic(enhanced_profile)
+                if student_vector is not None and analysis_stored:
+                    profile_artifacts.save(profile_id, embedding=student_vector)
+            matches = vector_search(enhanced_profile, structured_data, top_k=15, student_vector=student_vector) \
+                if student_vector is not None else []
         
         if not matches:
-            return {"matches": []}
+            return {"matches": [], "profileId": profile_id}
         
         # LLM re-ranking
-        ranked_matches = llm_rerank(enhanced_profile, structured_data, matches, top_k=5)
+        with tracing.span("llm_rerank"):
+            ranked_matches = llm_rerank(enhanced_profile, structured_data, matches, top_k=5, ranking=ranking)
         
-        return {"matches": ranked_matches}
+        return {"matches": ranked_matches, "profileId": profile_id}
         
     except Exception as e:
         print(f"Error in match_scholarships: {e}", file=sys.stderr)
@@ -372,13 +793,29 @@ Challenges Overcome:
         return {"error": str(e)}
 
 
-if __name__ == "__main__":
-    # Read JSON input from stdin
-    input_data = json.loads(sys.stdin.read())
+def handle_request(input_data):
+    """Process one request payload as sent by server/routes.ts."""
     student_profile = input_data.get("studentProfile", {})
-    
-    # Process
-    result = match_scholarships(student_profile)
-    
-    # Output JSON to stdout
-    print(json.dumps(result))
+    ranking = input_data.get("ranking")
+    if ranking is not None and ranking not in RANKING_MODES:
+        return {"error": f"ranking must be one of {', '.join(RANKING_MODES)}"}
+    if input_data.get("bypassCache"):
+        with llm_cache.bypass():
+            return match_scholarships(student_profile, ranking)
+    return match_scholarships(student_profile, ranking)
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        # Long-lived mode: answer NDJSON requests until stdin closes
+        from worker import serve
+        serve(handle_request, warm_up=warm_up)
+    else:
+        # Read JSON input from stdin
+        input_data = json.loads(sys.stdin.read())
+
+        # Process
+        result = handle_request(input_data)
+
+        # Output JSON to stdout
+        print(json.dumps(result))
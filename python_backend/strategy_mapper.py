@@ -0,0 +1,338 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+# Phase A: mine the strategy map from winning essays.
+#
+#   python3 python_backend/strategy_mapper.py --essays winners.jsonl [--clusters 7]
+#
+# Input is JSONL, one winning essay per line:
+#
+#   {"essay": "...", "scholarship_description": "...", "scholarship_name": "..."}
+#
+# Essays are embedded in batches through the embedding service and grouped with
+# spherical k-means (k-means++ seeding, every assignment step one matrix product).
+# Each cluster is then summarized by Claude into a cluster_name, description_archetype
+# and writing_strategy, with the calls running concurrently. Progress is checkpointed
+# under python_backend/.cache/strategy_mapper, keyed by the input and settings, so a
+# rerun after a crash reuses the embeddings, the clustering and every cluster already
+# summarized.
+#
+# The result is written as a versioned map: a copy under python_backend/strategy_maps/
+# and, atomically, to strategy_map.json, which running essay workers reload on their
+# next request (see EssayGenerator.reload_if_changed). --dry-run writes only the copy.
+
+STRATEGY_MAP_PATH = os.path.join(os.path.dirname(__file__), "strategy_map.json")
+HISTORY_DIR = os.path.join(os.path.dirname(__file__), "strategy_maps")
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), ".cache", "strategy_mapper")
+
+DEFAULT_CLUSTERS = 7
+SUMMARY_CONCURRENCY = int(os.environ.get("STRATEGY_MAPPER_CONCURRENCY", "4"))
+# Essays nearest each centroid that go into its summary prompt
+SAMPLE_ESSAYS = 6
+SAMPLE_ESSAY_CHARS = 2500
+SAMPLE_DESCRIPTION_CHARS = 800
+EMBED_BATCH_SIZE = 64
+KMEANS_ITERATIONS = 100
+
+
+def load_strategy_map(path=STRATEGY_MAP_PATH):
+    """Return (version, clusters) for a strategy map file.
+
+    Maps written by this module are {"version": ..., "clusters": [...]}; a bare list
+    of clusters (the original format) is versioned by its content fingerprint.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    clusters = data["clusters"] if isinstance(data, dict) else data
+    for cluster in clusters:
+        missing = {"cluster_id", "description_archetype", "writing_strategy"} - set(cluster)
+        if missing:
+            raise ValueError(f"Strategy map cluster is missing {', '.join(sorted(missing))}")
+    if isinstance(data, dict) and data.get("version"):
+        return data["version"], clusters
+
+    import cluster_index
+    return cluster_index.strategy_map_fingerprint(clusters)[:12], clusters
+
+
+def read_essays(lines):
+    """Yield winning essay records, skipping (and reporting) unusable lines."""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict) or not item.get("essay"):
+                raise ValueError("expected an object with an essay")
+            yield item
+        except ValueError as e:
+            print(f"Skipping line {number}: {e}", file=sys.stderr)
+
+
+def kmeans(vectors, k, seed=0, iterations=KMEANS_ITERATIONS):
+    """Spherical k-means over L2-normalized rows; returns (labels, centroids)."""
+    import numpy as np
+
+    x = np.asarray(vectors, dtype=np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    k = min(k, len(x))
+    rng = np.random.default_rng(seed)
+
+    # k-means++ seeding, on cosine distance
+    centroids = np.empty((k, x.shape[1]), dtype=np.float32)
+    centroids[0] = x[rng.integers(len(x))]
+    nearest = 1.0 - x @ centroids[0]
+    for i in range(1, k):
+        weights = np.clip(nearest, 0, None) ** 2
+        total = weights.sum()
+        choice = rng.choice(len(x), p=weights / total) if total > 0 else rng.integers(len(x))
+        centroids[i] = x[choice]
+        nearest = np.minimum(nearest, 1.0 - x @ centroids[i])
+
+    labels = None
+    for _ in range(iterations):
+        similarity = x @ centroids.T
+        new_labels = similarity.argmax(axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        counts = np.bincount(labels, minlength=k)
+        # Re-seed empty clusters with the points farthest from their centroids
+        farthest = similarity.max(axis=1).argsort()
+        for empty, far in zip(np.flatnonzero(counts == 0), farthest):
+            sums[labels[far]] -= x[far]
+            sums[empty] = x[far]
+            labels[far] = empty
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+
+    return labels, centroids
+
+
+def run_key(essays, k, seed):
+    """Identifies a mining run: the input, the settings and the embedding backend."""
+    import embeddings
+    digest = hashlib.sha256()
+    digest.update(f"{k}:{seed}:{embeddings.EMBEDDING_BACKEND}:{embeddings.EMBED_MODEL}".encode("utf-8"))
+    for essay in essays:
+        digest.update(json.dumps(essay, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class Checkpoint:
+    """Embeddings (.npy) plus clustering and finished summaries (.json) for one run."""
+
+    def __init__(self, key, directory=CHECKPOINT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, f"{key}.npy")
+        self.state_path = os.path.join(directory, f"{key}.json")
+        self.state = {"labels": None, "clusters": {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def load_vectors(self):
+        import numpy as np
+        return np.load(self.vectors_path) if os.path.exists(self.vectors_path) else None
+
+    def save_vectors(self, vectors):
+        import numpy as np
+        with open(self.vectors_path + ".tmp", 'wb') as f:
+            np.save(f, vectors)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+
+    def save(self):
+        with open(self.state_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+
+def embed_essays(essays, checkpoint):
+    import numpy as np
+    import embeddings
+
+    vectors = checkpoint.load_vectors()
+    if vectors is not None:
+        print(f"Reusing checkpointed embeddings for {len(vectors)} essays", file=sys.stderr)
+        return vectors
+
+    service = embeddings.get_embedding_service()
+    rows = []
+    for start in range(0, len(essays), EMBED_BATCH_SIZE):
+        batch = essays[start:start + EMBED_BATCH_SIZE]
+        rows.extend(service.embed_many([essay["essay"] for essay in batch]))
+        print(f"Embedded {min(start + EMBED_BATCH_SIZE, len(essays))} of {len(essays)} essays", file=sys.stderr)
+    vectors = np.asarray(rows, dtype=np.float32)
+    checkpoint.save_vectors(vectors)
+    return vectors
+
+
+_SUMMARY_INSTRUCTIONS = """You are an expert scholarship essay coach building a strategy map from winning essays.
+
+You will see a group of winning essays that were clustered together, each with the scholarship it won. Work out the shared writing strategy and the kind of scholarship it fits.
+
+Return ONLY valid JSON in this exact format:
+{
+  "cluster_name": "<short descriptive name for the strategy>",
+  "description_archetype": "<what types of scholarships this strategy fits: their themes, prompts, sponsors and keywords>",
+  "writing_strategy": {
+    "broad_instructions": "<how to write an essay in this style: focus, tone, what to emphasize>",
+    "structural_template": "Para 1: ...\\nPara 2: ...\\nPara 3: ...\\nPara 4: ..."
+  }
+}
+
+Describe the strategy in general terms; do not copy names or details from the essays."""
+
+
+def _summary_prompt(samples):
+    parts = []
+    for i, essay in enumerate(samples, 1):
+        description = (essay.get("scholarship_description") or "")[:SAMPLE_DESCRIPTION_CHARS]
+        parts.append(f"""WINNING ESSAY {i} ({essay.get('scholarship_name') or 'Scholarship'})
+Scholarship description: {description or 'Not provided'}
+Essay:
+{essay['essay'][:SAMPLE_ESSAY_CHARS]}""")
+    return "\n\n".join(parts) + f"\n\nSummarize the shared strategy of these {len(samples)} essays."
+
+
+def _parse_summary(response_text):
+    from scholarship_matcher import _parse_json_reply
+    summary = _parse_json_reply(response_text)
+    strategy = summary.get("writing_strategy") or {}
+    if not (summary.get("description_archetype") and strategy.get("broad_instructions")
+            and strategy.get("structural_template")):
+        raise ValueError("cluster summary is missing fields")
+    return summary
+
+
+async def summarize_clusters(samples_by_cluster, checkpoint, concurrency=SUMMARY_CONCURRENCY):
+    """Summarize every cluster not already in the checkpoint, saving each as it finishes."""
+    import llm_cache
+    from async_runtime import create_message, cached_system
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(cluster, samples):
+        async with semaphore:
+            summary = await llm_cache.cached_create_async(
+                create_message,
+                _parse_summary,
+                model="claude-sonnet-4-20250514",
+                max_tokens=1500,
+                temperature=0.3,
+                system=cached_system(_SUMMARY_INSTRUCTIONS),
+                messages=[{"role": "user", "content": _summary_prompt(samples)}]
+            )
+        checkpoint.state["clusters"][str(cluster)] = summary
+        checkpoint.save()
+        print(f"Summarized cluster {cluster}: {summary.get('cluster_name')}", file=sys.stderr)
+
+    pending = {cluster: samples for cluster, samples in samples_by_cluster.items()
+               if str(cluster) not in checkpoint.state["clusters"]}
+    if len(pending) < len(samples_by_cluster):
+        print(f"Reusing {len(samples_by_cluster) - len(pending)} checkpointed cluster summaries", file=sys.stderr)
+
+    results = await asyncio.gather(*(summarize(cluster, samples) for cluster, samples in pending.items()),
+                                   return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        raise RuntimeError(f"{len(failures)} cluster summaries failed (first: {failures[0]!r}); "
+                           f"rerun to retry them")
+
+
+def build_strategy_map(essays, k=DEFAULT_CLUSTERS, seed=0, concurrency=SUMMARY_CONCURRENCY):
+    """Run Phase A end to end; returns the versioned strategy map dict."""
+    import numpy as np
+    from async_runtime import run_async
+
+    key = run_key(essays, k, seed)
+    checkpoint = Checkpoint(key)
+    vectors = embed_essays(essays, checkpoint)
+
+    if checkpoint.state["labels"] is None:
+        labels, _ = kmeans(vectors, k, seed)
+        checkpoint.state["labels"] = labels.tolist()
+        checkpoint.save()
+    labels = np.asarray(checkpoint.state["labels"])
+
+    # Clusters numbered from 1, largest first; samples are the essays nearest the centroid
+    x = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    sizes = np.bincount(labels)
+    samples_by_cluster = {}
+    for label in np.argsort(-sizes):
+        members = np.flatnonzero(labels == label)
+        if len(members) == 0:
+            continue
+        centroid = x[members].mean(axis=0)
+        nearest = members[np.argsort(-(x[members] @ centroid))[:SAMPLE_ESSAYS]]
+        samples_by_cluster[int(label)] = [essays[i] for i in nearest]
+
+    run_async(summarize_clusters(samples_by_cluster, checkpoint, concurrency))
+
+    clusters = []
+    for cluster_id, label in enumerate(samples_by_cluster, 1):
+        summary = checkpoint.state["clusters"][str(label)]
+        clusters.append({
+            "cluster_id": cluster_id,
+            "cluster_name": summary.get("cluster_name") or f"Cluster {cluster_id}",
+            "description_archetype": summary["description_archetype"],
+            "writing_strategy": {
+                "broad_instructions": summary["writing_strategy"]["broad_instructions"],
+                "structural_template": summary["writing_strategy"]["structural_template"]
+            },
+            "essay_count": int(sizes[label])
+        })
+
+    import cluster_index
+    created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    return {
+        "version": f"{created_at[:10].replace('-', '')}-{cluster_index.strategy_map_fingerprint(clusters)[:8]}",
+        "created_at": created_at,
+        "method": f"kmeans(k={len(clusters)}, seed={seed})",
+        "essays": len(essays),
+        "clusters": clusters
+    }
+
+
+def save_strategy_map(strategy_map, path=STRATEGY_MAP_PATH, history_dir=HISTORY_DIR, activate=True):
+    """Keep a copy per version and (atomically) make it the live strategy map."""
+    os.makedirs(history_dir, exist_ok=True)
+    copy_path = os.path.join(history_dir, f"strategy_map-{strategy_map['version']}.json")
+    with open(copy_path, 'w', encoding='utf-8') as f:
+        json.dump(strategy_map, f, indent=2)
+    print(f"Wrote strategy map version {strategy_map['version']} to {copy_path}", file=sys.stderr)
+
+    if activate:
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(strategy_map, f, indent=2)
+        os.replace(path + ".tmp", path)
+        print(f"Activated it as {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the essay strategy map from winning essays")
+    parser.add_argument("--essays", required=True, help="JSONL file of winning essays")
+    parser.add_argument("--clusters", type=int, default=DEFAULT_CLUSTERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_CONCURRENCY)
+    parser.add_argument("--output", default=STRATEGY_MAP_PATH, help="Live strategy map to replace")
+    parser.add_argument("--dry-run", action="store_true", help="Only write the versioned copy")
+    args = parser.parse_args()
+
+    with open(args.essays, 'r', encoding='utf-8') as f:
+        essays = list(read_essays(f))
+    if len(essays) < args.clusters:
+        print(f"Need at least {args.clusters} essays, got {len(essays)}", file=sys.stderr)
+        sys.exit(1)
+
+    strategy_map = build_strategy_map(essays, args.clusters, args.seed, args.concurrency)
+    save_strategy_map(strategy_map, args.output, activate=not args.dry_run)
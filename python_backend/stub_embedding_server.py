@@ -0,0 +1,64 @@
+import sys
+import json
+import hashlib
+import argparse
+import math
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Offline stand-in for the Nomic embedding API. Returns deterministic unit vectors
+# derived from a hash of each text, in the same response shape as the real service.
+#
+#   python3 python_backend/stub_embedding_server.py --port 8765
+#   export NOMIC_EMBED_URL=http://127.0.0.1:8765/v1/embedding/text
+
+DIMENSIONS = 768
+
+
+def stub_vector(text, dimensions=DIMENSIONS):
+    """Deterministic pseudo-embedding: same text, same vector."""
+    values = []
+    counter = 0
+    while len(values) < dimensions:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    values = values[:dimensions]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length))
+            texts = payload["texts"]
+        except (ValueError, KeyError) as e:
+            self.send_error(400, f"Invalid request: {e}")
+            return
+
+        body = json.dumps({
+            "embeddings": [stub_vector(text) for text in texts],
+            "usage": {"prompt_tokens": sum(len(text.split()) for text in texts)},
+            "model": payload.get("model")
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(format % args, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Nomic embedding server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StubEmbeddingHandler)
+    print(f"Stub embedding server on http://{args.host}:{args.port}/v1/embedding/text", file=sys.stderr)
+    server.serve_forever()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The backend modules import each other as top-level siblings, as when run as scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep tests away from the shared cache databases
+os.environ.setdefault("LLM_CACHE_DISABLED", "1")
+os.environ.setdefault("PROFILE_ARTIFACTS_DISABLED", "1")
@@ -0,0 +1,35 @@
+import json
+
+import batch_matcher
+import scholarship_matcher
+
+
+class _Embedder:
+    def embed_many(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+
+def test_fallbacks_are_marked_degraded_per_profile(monkeypatch):
+    async def analyze(raw_profile):
+        if "flaky" in raw_profile:
+            scholarship_matcher._record_failure(RuntimeError("analysis timed out"))
+        return {}, raw_profile
+
+    async def rerank(enhanced, structured, matches, top_k=5):
+        return matches
+
+    monkeypatch.setattr(batch_matcher, "analyze_profile_async", analyze)
+    monkeypatch.setattr(batch_matcher, "llm_rerank_async", rerank)
+    monkeypatch.setattr(batch_matcher, "build_raw_profile", lambda profile: profile["name"])
+    monkeypatch.setattr(batch_matcher.embeddings, "get_embedding_service", _Embedder)
+    monkeypatch.setattr(batch_matcher, "search_many", lambda vectors, structured, top_k: [[] for _ in vectors])
+
+    lines = [json.dumps({"id": name, "studentProfile": {"name": name}}) for name in ("steady", "flaky", "also steady")]
+    lines.append("not json")
+    emitted = []
+    summary = batch_matcher.match_batch(lines, emitted.append)
+
+    results = {message["id"]: message for message in emitted if message["type"] == "result"}
+    assert results["flaky"].get("degraded") is True
+    assert "degraded" not in results["steady"] and "degraded" not in results["also steady"]
+    assert (summary["succeeded"], summary["failed"]) == (3, 1)
@@ -0,0 +1,107 @@
+import pytest
+
+import claude_client
+from claude_client import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, RateBucket
+
+
+def test_limiter_grows_additively_and_caps_at_maximum():
+    limiter = AdaptiveLimiter(initial=2, maximum=3)
+    limiter.on_success()
+    assert limiter.limit == pytest.approx(2.5)
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.limit == 3
+
+
+def test_limiter_halves_once_per_burst_of_overloads(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(claude_client.time, "monotonic", lambda: now[0])
+    limiter = AdaptiveLimiter(initial=8, maximum=16)
+
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.limit == 4
+
+    now[0] += 2
+    limiter.on_overload()
+    assert limiter.limit == 2
+
+    now[0] += 2
+    limiter.on_overload()
+    now[0] += 2
+    limiter.on_overload()
+    assert limiter.limit == 1
+
+
+def test_limiter_admits_up_to_the_limit():
+    limiter = AdaptiveLimiter(initial=2, maximum=4)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def test_rate_bucket_waits_for_refill(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(claude_client.time, "monotonic", lambda: now[0])
+    bucket = RateBucket(per_minute=60)
+
+    assert bucket.take(60) == 0.0
+    assert bucket.take(30) == pytest.approx(30.0)
+    now[0] += 40
+    assert bucket.take(0) == 0.0
+
+
+def test_rate_bucket_disabled():
+    assert RateBucket(per_minute=0).take(1_000_000) == 0.0
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(claude_client.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failures=3, cooldown=30)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.check() is False
+
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_breaker_allows_one_probe_after_cooldown(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(claude_client.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failures=1, cooldown=30)
+    breaker.record_failure()
+
+    now[0] += 31
+    assert breaker.check() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    # A failed probe re-opens the breaker for another cooldown
+    breaker.record_failure()
+    now[0] += 1
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    now[0] += 31
+    assert breaker.check() is True
+    breaker.record_success()
+    assert breaker.check() is False
+
+
+def test_breaker_cancelled_probe_frees_the_slot(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(claude_client.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failures=1, cooldown=30)
+    breaker.record_failure()
+    now[0] += 31
+
+    assert breaker.check() is True
+    breaker.end_probe()
+    assert breaker.check() is True
@@ -0,0 +1,72 @@
+import eligibility
+
+
+def test_normalize_parses_free_text():
+    fields = eligibility.normalize_eligibility({
+        "minimum_gpa": "3.0 or higher",
+        "degree_levels": "Undergraduate, Master's",
+        "citizenship": "Canadian citizens or permanent residents"
+    })
+    assert fields["min_gpa"] == 3.0
+    assert (fields["level_high_school"], fields["level_undergraduate"], fields["level_graduate"]) == \
+        (False, True, True)
+    assert fields["citizenship_ca"] and not fields["citizenship_us"] and not fields["citizenship_any"]
+
+
+def test_normalize_without_requirements_accepts_everyone():
+    fields = eligibility.normalize_eligibility({})
+    assert fields["min_gpa"] == 0.0
+    assert all(fields[eligibility.level_field(level)] for level in eligibility.DEGREE_LEVELS)
+    assert fields["citizenship_any"]
+
+
+def test_normalize_is_idempotent():
+    fields = eligibility.normalize_eligibility({"minimum_gpa": "3.5", "degree_levels": "graduate",
+                                                "citizenship": "United States"})
+    assert eligibility.normalize_eligibility(fields) == fields
+
+
+def test_pronoun_us_is_not_a_citizenship():
+    assert eligibility.citizenship_code("open to all of us") is None
+    assert eligibility.citizenship_code("U.S. citizen") == "us"
+
+
+def test_ineligibility_reason_checks_in_order():
+    metadata = {"minimum_gpa": "3.5", "degree_levels": "Graduate", "citizenship": "Canadian"}
+    student = {"gpa": 3.9, "degree_level": "Graduate", "citizenship": "Canadian"}
+    assert eligibility.ineligibility_reason(student, metadata) is None
+    assert eligibility.ineligibility_reason({**student, "gpa": 3.2}, metadata) == "gpa"
+    assert eligibility.ineligibility_reason({**student, "degree_level": "Undergraduate"}, metadata) == "degree_level"
+    assert eligibility.ineligibility_reason({**student, "citizenship": "American"}, metadata) == "citizenship"
+
+
+def test_ineligibility_reason_ignores_unknown_student_fields():
+    metadata = {"minimum_gpa": "3.5", "degree_levels": "Graduate", "citizenship": "Canadian"}
+    assert eligibility.ineligibility_reason({"gpa": None, "degree_level": "", "citizenship": None}, metadata) is None
+
+
+def test_where_clause_matches_python_check():
+    student = {"gpa": 3.4, "degree_level": "undergraduate", "citizenship": "Canadian"}
+    assert eligibility.where_clause(student) == {"$and": [
+        {"min_gpa": {"$lte": 3.4}},
+        {"level_undergraduate": True},
+        {"$or": [{"citizenship_any": True}, {"citizenship_ca": True}]}
+    ]}
+    assert eligibility.where_clause({}) is None
+
+
+def test_lenient_levels_keep_the_untyped_baseline():
+    graduate_only = {"degree_levels": "Graduate"}
+    undergrad_only = {"degree_levels": "Undergraduate"}
+    # Strict: any level the listing doesn't accept is out
+    assert eligibility.ineligibility_reason({"degree_level": "undergraduate"}, graduate_only) == "degree_level"
+    assert eligibility.ineligibility_reason({"degree_level": "graduate"}, undergrad_only) == "degree_level"
+    # Lenient: only high school students are ruled out of (under)graduate listings
+    assert eligibility.ineligibility_reason({"degree_level": "undergraduate"}, graduate_only,
+                                            lenient_levels=True) is None
+    assert eligibility.ineligibility_reason({"degree_level": "graduate"}, undergrad_only,
+                                            lenient_levels=True) is None
+    assert eligibility.ineligibility_reason({"degree_level": "high school"}, graduate_only,
+                                            lenient_levels=True) == "degree_level"
+    assert eligibility.ineligibility_reason({"degree_level": "high school"}, {"degree_levels": "High school"},
+                                            lenient_levels=True) is None
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from embeddings import EmbeddingBatcher, EmbeddingService, StubEmbeddingBackend
+
+
+class RecordingBackend(StubEmbeddingBackend):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.started = threading.Event()
+
+    def embed_batch(self, texts):
+        self.calls.append(list(texts))
+        self.started.set()
+        time.sleep(self.delay)
+        return super().embed_batch(texts)
+
+
+def test_lone_request_is_not_held_back():
+    backend = RecordingBackend()
+    batcher = EmbeddingBatcher(backend, max_wait=5.0)
+    start = time.monotonic()
+    batcher.submit("hello").result(timeout=2)
+    assert time.monotonic() - start < 1.0
+
+
+def test_one_callers_texts_go_in_one_call():
+    backend = RecordingBackend()
+    batcher = EmbeddingBatcher(backend, max_wait=5.0)
+    futures = batcher.submit_many(["a", "b", "c"])
+    assert [len(future.result(timeout=2)) for future in futures] == [768] * 3
+    assert backend.calls == [["a", "b", "c"]]
+
+
+def test_callers_queued_behind_a_call_are_batched():
+    backend = RecordingBackend(delay=0.2)
+    batcher = EmbeddingBatcher(backend, max_wait=0.01)
+    first = batcher.submit("first")
+    backend.started.wait(timeout=2)
+    queued = [batcher.submit(f"text {i}") for i in range(5)]
+    queued.append(batcher.submit("text 0"))
+
+    first.result(timeout=2)
+    assert queued[0].result(timeout=2) == queued[-1].result(timeout=2)
+    assert backend.calls == [["first"], [f"text {i}" for i in range(5)]]
+
+
+def test_service_caches_and_deduplicates():
+    backend = RecordingBackend()
+    service = EmbeddingService(backend=backend)
+    vectors = service.embed_many(["x", "y", "x"])
+    assert vectors[0] == vectors[2]
+    assert service.embed("y") == vectors[1]
+    assert backend.calls == [["x", "y"]]
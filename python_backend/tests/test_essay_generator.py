@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+import essay_generator
+
+
+def write_map(path, version, cluster_name):
+    cluster = {"cluster_id": 1, "cluster_name": cluster_name, "description_archetype": "Any",
+               "writing_strategy": {"broad_instructions": "Be specific.", "structural_template": "Hook, body, close."}}
+    path.write_text(json.dumps({"version": version, "clusters": [cluster]}))
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(essay_generator, "_claude_client", None)
+    monkeypatch.setattr(essay_generator, "STRATEGY_MAP_CHECK_SECONDS", 0)
+    path = tmp_path / "strategy_map.json"
+    write_map(path, "v1", "First")
+    return essay_generator.EssayGenerator(str(path)), path
+
+
+def test_reload_swaps_the_whole_map(generator):
+    generator, path = generator
+    before = generator.loaded
+    write_map(path, "v2", "Second")
+    os.utime(path, ns=(before.mtime + 10**9, before.mtime + 10**9))
+
+    assert generator.reload_if_changed()
+    after = generator.loaded
+    assert after is not before
+    assert (after.version, after.clusters[0]["cluster_name"]) == ("v2", "Second")
+    assert "Second" in after.prompt and "Second" not in before.prompt
+    # A request holding the old map still sees it whole
+    assert (before.version, before.clusters[0]["cluster_name"]) == ("v1", "First")
+
+
+def test_broken_map_keeps_the_current_one(generator):
+    generator, path = generator
+    before = generator.loaded
+    path.write_text("{not json")
+    os.utime(path, ns=(before.mtime + 10**9, before.mtime + 10**9))
+
+    assert not generator.reload_if_changed()
+    assert generator.loaded is before
+    # The same broken file isn't retried
+    assert not generator.reload_if_changed()
+
+
+def test_unchanged_map_is_not_reloaded(generator):
+    generator, _ = generator
+    before = generator.loaded
+    assert not generator.reload_if_changed()
+    assert generator.loaded is before
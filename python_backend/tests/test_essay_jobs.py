@@ -0,0 +1,146 @@
+import io
+
+import pytest
+
+import essay_jobs
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(essay_jobs, "JOB_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(essay_jobs, "_db", None)
+    monkeypatch.setattr(essay_jobs, "_protocol_out", io.StringIO())
+    monkeypatch.setattr(essay_jobs, "USER_CONCURRENCY", 1)
+    monkeypatch.setattr(essay_jobs, "USER_MAX_PENDING", 3)
+    yield essay_jobs
+    if essay_jobs._db is not None:
+        essay_jobs._db.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(essay_jobs.time, "time", lambda: now[0])
+    return now
+
+
+def test_submit_and_claim(jobs, clock):
+    job = jobs.submit({"scholarship_name": "A", "stream": True}, "alice")
+    assert job["status"] == "queued" and job["position"] == 0
+
+    job_id, payload = jobs.claim()
+    assert job_id == job["id"]
+    assert payload == {"scholarship_name": "A"}
+    assert jobs.get(job_id)["status"] == "running"
+    assert jobs.claim() is None
+
+
+def test_interactive_lane_first_until_batch_ages(jobs, clock):
+    batch = jobs.submit({}, "alice", lane="batch")
+    clock[0] += 1
+    interactive = jobs.submit({}, "bob")
+    assert jobs.claim()[0] == interactive["id"]
+    assert jobs.claim()[0] == batch["id"]
+    jobs.finish(batch["id"], result={})
+    jobs.finish(interactive["id"], result={})
+
+    # A batch job that waited longer than the aging period beats a fresh interactive one
+    old_batch = jobs.submit({}, "carol", lane="batch")
+    clock[0] += jobs.AGING_SECONDS * 2
+    jobs.submit({}, "dave")
+    assert jobs.claim()[0] == old_batch["id"]
+
+
+def test_unknown_lane_is_rejected(jobs):
+    assert jobs.submit({}, "alice", lane="urgent")["status"] == 400
+
+
+def test_user_concurrency_skips_busy_users(jobs, clock):
+    first = jobs.submit({}, "alice")
+    second = jobs.submit({}, "alice")
+    other = jobs.submit({}, "bob")
+
+    assert jobs.claim()[0] == first["id"]
+    assert jobs.claim()[0] == other["id"]
+    assert jobs.claim() is None
+
+    jobs.finish(first["id"], result={"essay": "..."})
+    assert jobs.claim()[0] == second["id"]
+
+
+def test_user_pending_limit(jobs):
+    for _ in range(jobs.USER_MAX_PENDING):
+        assert "id" in jobs.submit({}, "alice")
+    assert jobs.submit({}, "alice")["status"] == 429
+    assert "id" in jobs.submit({}, "bob")
+
+
+def test_queue_limit(jobs, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_QUEUED", 1)
+    jobs.submit({}, "alice")
+    assert jobs.submit({}, "bob")["status"] == 503
+
+
+def test_stale_job_is_requeued_then_failed(jobs, clock):
+    job = jobs.submit({}, "alice")
+    jobs.claim()
+
+    clock[0] += jobs.STALE_SECONDS + 1
+    assert jobs.claim()[0] == job["id"]
+    assert jobs.get(job["id"])["attempts"] == 2
+
+    clock[0] += jobs.STALE_SECONDS + 1
+    assert jobs.claim() is None
+    failed = jobs.get(job["id"])
+    assert failed["status"] == "failed" and "stopped" in failed["error"]
+
+
+def test_heartbeat_keeps_job_running(jobs, clock):
+    job = jobs.submit({}, "alice")
+    jobs.claim()
+    clock[0] += jobs.STALE_SECONDS - 1
+    jobs.heartbeat([job["id"]])
+    clock[0] += jobs.STALE_SECONDS - 1
+    assert jobs.claim() is None
+    assert jobs.get(job["id"])["status"] == "running"
+
+
+def test_release_does_not_count_an_attempt(jobs):
+    job = jobs.submit({}, "alice")
+    jobs.claim()
+    jobs.release([job["id"]])
+    released = jobs.get(job["id"])
+    assert released["status"] == "queued" and released["attempts"] == 0
+
+
+def test_cancel_only_queued_jobs(jobs):
+    running = jobs.submit({}, "alice")
+    queued = jobs.submit({}, "bob", lane="batch")
+    jobs.claim()
+
+    assert jobs.cancel(queued["id"])["status"] == "cancelled"
+    assert jobs.cancel(running["id"])["status"] == "running"
+    assert jobs.cancel("missing") is None
+
+
+def test_finish_records_result_or_error(jobs):
+    ok = jobs.submit({}, "alice")
+    bad = jobs.submit({}, "bob")
+    jobs.claim()
+    jobs.claim()
+    jobs.finish(ok["id"], result={"essay": "text"})
+    jobs.finish(bad["id"], error="boom")
+
+    assert jobs.get(ok["id"])["result"] == {"essay": "text"}
+    assert jobs.get(bad["id"])["status"] == "failed"
+    assert jobs.stats()["running"] == {"interactive": 0, "batch": 0}
+
+
+def test_purge_removes_old_finished_jobs(jobs, clock):
+    job = jobs.submit({}, "alice")
+    jobs.claim()
+    jobs.finish(job["id"], result={})
+    assert jobs.purge() == 0
+    clock[0] += jobs.RETENTION_SECONDS + 1
+    assert jobs.purge() == 1
+    assert jobs.get(job["id"]) is None
@@ -0,0 +1,13 @@
+import pytest
+
+import check_import_time
+
+
+@pytest.mark.parametrize("module", check_import_time.MODULES)
+def test_import_within_budget_and_without_heavy_modules(module):
+    runs = [check_import_time.measure(module) for _ in range(check_import_time.RUNS)]
+    best_ms = min(ms for ms, _ in runs)
+    heavy = sorted(set(check_import_time.HEAVY_MODULES) & runs[0][1])
+
+    assert not heavy, f"{module} imports {', '.join(heavy)} at import time"
+    assert best_ms <= check_import_time.BUDGET_MS, f"{module} took {best_ms:.1f}ms"
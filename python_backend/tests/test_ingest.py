@@ -0,0 +1,72 @@
+import asyncio
+
+import ingest
+
+
+RECORD = {"id": "1", "name": "Future Engineers", "url": "https://example.org", "text": "For engineering students."}
+
+
+def test_content_hash_ignores_id_and_tracks_content():
+    digest = ingest.content_hash(RECORD)
+    assert ingest.content_hash({**RECORD, "id": "2"}) == digest
+    assert ingest.content_hash({**RECORD, "text": "For nursing students."}) != digest
+
+
+def test_content_hash_includes_extraction_version(monkeypatch):
+    digest = ingest.content_hash(RECORD)
+    monkeypatch.setattr(ingest, "EXTRACTION_VERSION", ingest.EXTRACTION_VERSION + "-next")
+    assert ingest.content_hash(RECORD) != digest
+
+
+def test_build_metadata_prefers_scraped_fields():
+    record = {**RECORD, "minimum_gpa": "3.5", "fields_of_study": ["Engineering", "Physics"]}
+    extracted = {"minimum_gpa": 3.0, "citizenship": "Canadian citizen", "award_amount": None}
+    metadata = ingest.build_metadata(record, extracted, "Summary.", "abc")
+
+    assert metadata["name"] == "Future Engineers"
+    assert metadata["minimum_gpa"] == "3.5"
+    assert metadata["fields_of_study"] == "Engineering, Physics"
+    assert metadata["citizenship"] == "Canadian citizen"
+    assert "award_amount" not in metadata
+    assert metadata["summary"] == "Summary."
+    assert metadata["content_hash"] == "abc"
+    # Typed eligibility fields are derived from the merged values
+    assert metadata["min_gpa"] == 3.5
+    assert metadata["citizenship_ca"] and not metadata["citizenship_any"]
+
+
+def test_build_metadata_leaves_hash_empty_when_extraction_failed():
+    metadata = ingest.build_metadata({"id": "7", "text": "..."}, None, None, "abc")
+    assert metadata["name"] == "7" and metadata["url"] == "N/A"
+    assert metadata["content_hash"] == ""
+    assert "summary" not in metadata
+
+
+def test_read_records_reports_bad_lines():
+    lines = [
+        '{"name": "A", "text": "About A"}',
+        "",
+        "not json",
+        '["a list"]',
+        '{"name": "B"}',
+        '{"id": 5, "description": "About five"}',
+    ]
+    results = list(ingest.read_records(lines))
+
+    assert results[0] == ({"name": "A", "text": "About A", "id": "A"}, None)
+    assert [error.split(":")[0] for record, error in results[1:4]] == ["line 3", "line 4", "line 5"]
+    assert results[4][0]["id"] == "5" and results[4][0]["text"] == "About five"
+
+
+def test_scholarships_missing_from_the_extraction_reply_count_as_failed(monkeypatch):
+    async def reply(create, parse, **request):
+        return {1: {"id": 1, "minimum_gpa": 3.0}, 3: {"id": 3, "citizenship": "Canadian"}}
+
+    monkeypatch.setattr(ingest.llm_cache, "cached_create_async", reply)
+    records = [{"id": str(i), "text": f"Scholarship {i}"} for i in range(1, 4)]
+    extracted = asyncio.run(ingest.extract_metadata_async(records, batch_size=3))
+
+    assert extracted[0]["minimum_gpa"] == 3.0
+    assert extracted[1] is None
+    assert extracted[2]["citizenship"] == "Canadian"
+    assert ingest.build_metadata(records[1], extracted[1], None, "abc")["content_hash"] == ""
@@ -0,0 +1,55 @@
+import prerank
+
+
+STUDENT = {
+    "gpa": 3.8,
+    "degree_level": "undergraduate",
+    "field_of_study": "Computer Science",
+    "key_activities": ["robotics club leadership", "community tutoring"],
+}
+
+
+def candidate(name, distance, **metadata):
+    return {"id": name, "distance": distance, "metadata": {"name": name, **metadata}}
+
+
+def test_local_ranking_prefers_fit_over_small_distance_gaps():
+    matches = [
+        candidate("Generic", 0.30, emphasis_areas="arts", degree_levels="graduate"),
+        candidate("Tech Leaders", 0.31, emphasis_areas="leadership, robotics", fields_of_study="computer science",
+                  degree_levels="undergraduate", minimum_gpa=3.0),
+        candidate("Far", 0.90),
+    ]
+    ranked = prerank.local_ranking(STUDENT, matches, top_k=2)
+
+    assert [match["id"] for match in ranked] == ["Tech Leaders", "Generic"]
+    assert [match["rank"] for match in ranked] == [1, 2]
+    assert all(0 <= match["match_score"] <= 100 for match in ranked)
+    assert ranked[0]["reasoning"].startswith("Ranked locally: close semantic match")
+    assert "leadership" in ranked[0]["reasoning"] and "robotic" in ranked[0]["reasoning"]
+
+
+def test_local_ranking_copies_matches():
+    matches = [candidate("A", 0.2), candidate("B", 0.4)]
+    ranked = prerank.local_ranking(STUDENT, matches)
+    assert "rank" not in matches[0]
+    assert ranked[0]["metadata"] is matches[0]["metadata"]
+
+
+def test_local_ranking_keeps_vector_order_on_ties():
+    matches = [candidate(name, 0.5) for name in "ABC"]
+    assert [match["id"] for match in prerank.local_ranking({}, matches)] == ["A", "B", "C"]
+
+
+def test_local_ranking_empty():
+    assert prerank.local_ranking(STUDENT, []) == []
+
+
+def test_prerank_keeps_best_candidates():
+    matches = [candidate("A", 0.1), candidate("B", 0.5), candidate("C", 0.9)]
+    assert prerank.prerank(STUDENT, matches, keep=5) is matches
+    assert [match["id"] for match in prerank.prerank(STUDENT, matches, keep=2)] == ["A", "B"]
+
+
+def test_terms_drops_stopwords_and_plurals():
+    assert prerank.terms("Scholarships for Leaders and the class") == {"leader", "class"}
@@ -0,0 +1,47 @@
+import multiprocessing
+
+import pytest
+
+import profile_artifacts
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_artifacts, "ARTIFACT_DB_PATH", str(tmp_path / "artifacts.sqlite3"))
+    monkeypatch.setattr(profile_artifacts, "ARTIFACTS_DISABLED", False)
+    monkeypatch.setattr(profile_artifacts, "_db", None)
+    yield profile_artifacts
+    if profile_artifacts._db is not None:
+        profile_artifacts._db.close()
+
+
+def _save_fields(prefix, count):
+    profile_artifacts._db = None
+    for i in range(count):
+        profile_artifacts.save("profile", **{f"{prefix}{i}": i})
+
+
+def test_save_merges_fields(artifacts):
+    artifacts.save("profile", structured_data={"gpa": 3.9})
+    artifacts.save("profile", embedding=[0.1, 0.2])
+    stored = artifacts.load("profile")
+    assert stored["structured_data"] == {"gpa": 3.9}
+    assert stored["embedding"] == [0.1, 0.2]
+
+
+def test_concurrent_processes_keep_each_others_fields(artifacts):
+    context = multiprocessing.get_context("fork")
+    writers = [context.Process(target=_save_fields, args=(prefix, 30)) for prefix in ("a", "b", "c")]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    stored = artifacts.load("profile")
+    assert all(stored.get(f"{prefix}{i}") == i for prefix in "abc" for i in range(30))
+
+
+def test_expired_artifacts_are_not_loaded(artifacts, monkeypatch):
+    artifacts.save("profile", enhanced_profile="text")
+    monkeypatch.setattr(artifacts, "ARTIFACT_TTL_SECONDS", -1)
+    assert artifacts.load("profile") is None
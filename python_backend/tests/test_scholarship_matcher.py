@@ -0,0 +1,50 @@
+import scholarship_matcher
+
+
+class SampledCollection:
+    name = "scholarships"
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.samples = 0
+
+    def get(self, limit, include):
+        self.samples += 1
+        return {"metadatas": [self.metadata]}
+
+
+def test_typed_check_is_cached_for_untyped_collections(monkeypatch):
+    monkeypatch.setattr(scholarship_matcher, "_typed_collections", {})
+    now = [1000.0]
+    monkeypatch.setattr(scholarship_matcher.time, "monotonic", lambda: now[0])
+    collection = SampledCollection({"degree_levels": "Graduate"})
+
+    assert not scholarship_matcher._has_typed_eligibility(collection)
+    assert not scholarship_matcher._has_typed_eligibility(collection)
+    assert collection.samples == 1
+
+    # A backfill is noticed on the next check after the recheck interval
+    collection.metadata = {"min_gpa": 0.0, "citizenship_any": True, "level_high_school": True,
+                           "level_undergraduate": True, "level_graduate": True}
+    now[0] += scholarship_matcher.TYPED_RECHECK_SECONDS + 1
+    assert scholarship_matcher._has_typed_eligibility(collection)
+    now[0] += scholarship_matcher.TYPED_RECHECK_SECONDS + 1
+    assert scholarship_matcher._has_typed_eligibility(collection)
+    assert collection.samples == 2
+
+
+def test_untyped_rows_are_post_filtered_leniently():
+    results = {
+        "ids": [["grad", "far"]],
+        "distances": [[0.2, 1.5]],
+        "metadatas": [[{"degree_levels": "Graduate"}, {}]],
+        "documents": [["Graduate award", "Far away"]],
+    }
+    student = {"degree_level": "undergraduate"}
+
+    matches, filtered_out, returned = scholarship_matcher._collect_matches(results, 0, student, 1.0, typed=False)
+    assert [match["scholarship"] for match in matches] == ["grad"]
+    assert filtered_out["distance"] == 1 and returned == 2
+
+    matches, filtered_out, _ = scholarship_matcher._collect_matches(results, 0, student, 1.0, typed=True)
+    assert matches == [] and filtered_out["degree_level"] == 1
@@ -0,0 +1,48 @@
+import numpy as np
+
+from strategy_mapper import kmeans
+
+
+def blobs(rng, centers, per_cluster=20, noise=0.05):
+    points = [center + noise * rng.standard_normal((per_cluster, len(center))) for center in centers]
+    return np.vstack(points)
+
+
+def test_kmeans_recovers_separated_directions():
+    rng = np.random.default_rng(1)
+    centers = np.eye(3, 8) * 5
+    labels, centroids = kmeans(blobs(rng, centers), k=3)
+
+    groups = labels.reshape(3, 20)
+    assert all(len(set(group)) == 1 for group in groups)
+    assert len({group[0] for group in groups}) == 3
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+
+
+def test_kmeans_is_deterministic_for_a_seed():
+    vectors = np.random.default_rng(2).standard_normal((50, 6))
+    first, _ = kmeans(vectors, k=4, seed=7)
+    second, _ = kmeans(vectors, k=4, seed=7)
+    np.testing.assert_array_equal(first, second)
+
+
+def test_kmeans_caps_k_at_the_number_of_points():
+    vectors = np.random.default_rng(3).standard_normal((3, 4))
+    labels, centroids = kmeans(vectors, k=10)
+    assert centroids.shape == (3, 4)
+    assert sorted(labels) == [0, 1, 2]
+
+
+def test_kmeans_leaves_no_cluster_empty():
+    # Many duplicates of one direction and a few outliers
+    rng = np.random.default_rng(4)
+    vectors = np.vstack([np.tile(np.eye(1, 5), (30, 1)), rng.standard_normal((4, 5))])
+    labels, _ = kmeans(vectors, k=4)
+    assert set(labels) == {0, 1, 2, 3}
+
+
+def test_kmeans_does_not_modify_its_input():
+    vectors = np.random.default_rng(5).standard_normal((10, 3))
+    original = vectors.copy()
+    kmeans(vectors, k=2)
+    np.testing.assert_array_equal(vectors, original)
@@ -0,0 +1,107 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Per-request stage timings for the match and essay pipelines.
+#
+#   with tracing.trace() as t:
+#       with tracing.span("embed"):
+#           ...
+#           tracing.annotate(cache_hits=1)
+#   result["trace"] = t.to_dict()
+#
+# Spans nest; annotate() and record_usage() attach to the innermost open span, so
+# helpers like llm_cache don't need to know which stage called them. Works across
+# asyncio tasks (each task gets its own copy of the context). With PIPELINE_TRACING=0
+# every call here is a no-op apart from one ContextVar lookup.
+
+TRACING_ENABLED = os.environ.get("PIPELINE_TRACING", "1") != "0"
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": self.spans
+        }
+
+
+@contextmanager
+def trace():
+    """Collect spans for everything run inside this block; yields the Trace (or None)."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Time a pipeline stage."""
+    current = _current_trace.get()
+    if current is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    record = {"name": name if parent is None else f"{parent['name']}.{name}"}
+    current.spans.append(record)
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        _current_span.reset(token)
+
+
+def annotate(**fields):
+    """Attach fields (cache hits, counts, errors) to the innermost open span."""
+    record = _current_span.get()
+    if record is not None:
+        record.update(fields)
+
+
+def count(field, n=1):
+    """Add n to a counter field (retries, hedges) on the innermost open span."""
+    record = _current_span.get()
+    if record is not None:
+        record[field] = record.get(field, 0) + n
+
+
+def record_usage(response):
+    """Add an Anthropic response's token usage to the innermost open span."""
+    record = _current_span.get()
+    usage = getattr(response, "usage", None)
+    if record is None or usage is None:
+        return
+
+    for field in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+        value = getattr(usage, field, None)
+        if value:
+            record[field] = record.get(field, 0) + value
+
+
+def elapsed_ms():
+    """Milliseconds since the current trace started, or None outside a trace."""
+    current = _current_trace.get()
+    if current is None:
+        return None
+    return round((time.perf_counter() - current.started) * 1000, 1)
@@ -0,0 +1,358 @@
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+
+import eligibility
+import tracing
+
+# In-process vector index over the scholarships collection.
+#
+# `--export` dumps the Chroma collection into VECTOR_INDEX_DIR:
+#
+#   vectors.npy     float32 matrix, one L2-normalized row per scholarship (memory-mapped)
+#   metadata.json   ids, documents and one column per metadata field, including the
+#                   typed eligibility fields from eligibility.normalize_eligibility
+#   hnsw.bin        HNSW graph, only for corpora of at least HNSW_THRESHOLD rows
+#
+# With VECTOR_BACKEND=numpy the matcher searches this instead of Chroma: exact
+# dot-product top-k with vectorized eligibility masks, or the HNSW graph (over-fetching
+# and masking) past HNSW_THRESHOLD rows. Distances are cosine distances, as in Chroma.
+# Re-export after changing the collection.
+#
+#   python3 python_backend/vector_index.py --export
+#   python3 python_backend/vector_index.py --benchmark
+
+INDEX_DIR = os.environ.get(
+    "VECTOR_INDEX_DIR",
+    os.path.join(os.path.dirname(__file__), "vector_index")
+)
+HNSW_THRESHOLD = int(os.environ.get("VECTOR_INDEX_HNSW_THRESHOLD", "50000"))
+HNSW_EF = int(os.environ.get("VECTOR_INDEX_HNSW_EF", "128"))
+# Past this fraction of the corpus, a masked HNSW query switches to the exact scan
+HNSW_MAX_FETCH_FRACTION = 0.1
+EXPORT_PAGE_SIZE = 5000
+
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.json"
+HNSW_FILE = "hnsw.bin"
+
+
+class VectorIndex:
+    """Memory-mapped vectors plus columnar metadata, searchable like search_by_vectors."""
+
+    def __init__(self, directory=INDEX_DIR, hnsw_threshold=HNSW_THRESHOLD):
+        import numpy as np
+
+        self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, METADATA_FILE), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+        self.ids = metadata["ids"]
+        self.documents = metadata["documents"]
+        self.columns = metadata["columns"]
+
+        # Typed arrays for the eligibility masks
+        self.min_gpa = np.array(self.columns["min_gpa"], dtype=np.float32)
+        self.flags = {
+            name: np.array(self.columns[name], dtype=bool)
+            for name in self.columns
+            if name.startswith("level_") or name.startswith("citizenship_")
+        }
+
+        self.hnsw = None
+        if len(self.ids) >= hnsw_threshold:
+            self.hnsw = _load_hnsw(directory, self.vectors)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def eligibility_mask(self, structured_data):
+        """Boolean row mask equivalent to eligibility.where_clause, or None for no filter."""
+        mask = None
+
+        def require(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        gpa = structured_data.get("gpa")
+        if isinstance(gpa, (int, float)):
+            require(self.min_gpa <= float(gpa))
+
+        level = (structured_data.get("degree_level") or "").lower()
+        if level in eligibility.DEGREE_LEVELS:
+            require(self.flags[eligibility.level_field(level)])
+
+        code = eligibility.citizenship_code(structured_data.get("citizenship"))
+        if code:
+            require(self.flags["citizenship_any"] | self.flags[f"citizenship_{code}"])
+
+        return mask
+
+    def search(self, vectors, structured_list, top_k=5, distance_threshold=1.0):
+        """One match list per query vector, nearest first, in the matcher's match format."""
+        import numpy as np
+
+        if not len(self):
+            return [[] for _ in vectors]
+        queries = np.array(vectors, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+        scores = None if self.hnsw is not None else queries @ self.vectors.T
+
+        all_matches = []
+        too_far = 0
+        for i, structured_data in enumerate(structured_list):
+            mask = self.eligibility_mask(structured_data)
+            if self.hnsw is not None:
+                rows, distances = self._hnsw_top_k(queries[i], mask, top_k)
+            else:
+                rows, distances = _exact_top_k(scores[i], mask, top_k)
+
+            matches = []
+            for row, distance in zip(rows, distances):
+                if distance > distance_threshold:
+                    too_far += 1
+                    continue
+                matches.append(self._match(int(row), float(distance)))
+            all_matches.append(matches)
+
+        tracing.annotate(backend="hnsw" if self.hnsw is not None else "exact",
+                         filtered_out={"distance": too_far})
+        return all_matches
+
+    def _hnsw_top_k(self, query, mask, top_k):
+        k = min(top_k if mask is None else top_k * 4, len(self))
+        while True:
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            rows, distances = labels[0], distances[0]
+            if mask is not None:
+                keep = mask[rows]
+                rows, distances = rows[keep], distances[keep]
+            if len(rows) >= top_k or k >= len(self):
+                return rows[:top_k], distances[:top_k]
+            if k * 4 > len(self) * HNSW_MAX_FETCH_FRACTION:
+                # A selective filter: scanning is cheaper than fetching most of the graph
+                return _exact_top_k(self.vectors @ query, mask, top_k)
+            k = min(k * 4, len(self))
+
+    def _match(self, row, distance):
+        metadata = {name: column[row] for name, column in self.columns.items() if column[row] is not None}
+        return {
+            "scholarship": self.ids[row],
+            "distance": distance,
+            "url": metadata.get("url", "N/A"),
+            "full_text": self.documents[row],
+            "metadata": metadata
+        }
+
+
+def _exact_top_k(scores, mask, top_k):
+    """(rows, cosine distances) of the top_k highest scores among the masked rows."""
+    import numpy as np
+
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+        top_k = min(top_k, int(mask.sum()))
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    rows = np.argpartition(-scores, top_k - 1)[:top_k]
+    rows = rows[np.argsort(-scores[rows])]
+    return rows, 1.0 - scores[rows]
+
+
+def _build_hnsw(vectors):
+    import hnswlib
+    import numpy as np
+
+    index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+    index.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+    index.add_items(np.asarray(vectors), np.arange(len(vectors)))
+    return index
+
+
+def _load_hnsw(directory, vectors):
+    """The saved HNSW graph (or one built now); None if hnswlib isn't installed."""
+    try:
+        import hnswlib
+    except ImportError:
+        print("hnswlib is not installed; using exact search", file=sys.stderr)
+        return None
+
+    path = os.path.join(directory, HNSW_FILE)
+    if os.path.exists(path):
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.load_index(path, max_elements=len(vectors))
+    else:
+        print(f"No {HNSW_FILE} in {directory}; building the HNSW graph in memory", file=sys.stderr)
+        index = _build_hnsw(vectors)
+    index.set_ef(max(HNSW_EF, 1))
+    return index
+
+
+_index = None
+
+
+def get_index():
+    """Return the process-wide VectorIndex, loading it on first use."""
+    global _index
+    if _index is None:
+        _index = VectorIndex()
+    return _index
+
+
+def export(collection, directory=INDEX_DIR, hnsw_threshold=HNSW_THRESHOLD):
+    """Write the collection's vectors and metadata to `directory`; returns the row count."""
+    import numpy as np
+
+    ids, documents, metadatas, vectors = [], [], [], []
+    total = collection.count()
+    for offset in range(0, total, EXPORT_PAGE_SIZE):
+        page = collection.get(include=["embeddings", "metadatas", "documents"],
+                              limit=EXPORT_PAGE_SIZE, offset=offset)
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend({**(m or {}), **eligibility.normalize_eligibility(m or {})} for m in page["metadatas"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+
+    # The typed eligibility columns are always written, so an empty export still loads
+    fields = sorted({name for metadata in metadatas for name in metadata} |
+                    set(eligibility.normalize_eligibility({})))
+    columns = {name: [metadata.get(name) for metadata in metadatas] for name in fields}
+
+    os.makedirs(directory, exist_ok=True)
+    # Write to temporary names first so a running worker never maps a half-written file
+    vectors_tmp = os.path.join(directory, VECTORS_FILE + ".tmp")
+    with open(vectors_tmp, 'wb') as f:
+        np.save(f, matrix)
+    metadata_tmp = os.path.join(directory, METADATA_FILE + ".tmp")
+    with open(metadata_tmp, 'w', encoding='utf-8') as f:
+        json.dump({"ids": ids, "documents": documents, "columns": columns,
+                   "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}, f)
+    os.replace(vectors_tmp, os.path.join(directory, VECTORS_FILE))
+    os.replace(metadata_tmp, os.path.join(directory, METADATA_FILE))
+
+    hnsw_path = os.path.join(directory, HNSW_FILE)
+    if len(ids) >= hnsw_threshold:
+        _build_hnsw(matrix).save_index(hnsw_path)
+    elif os.path.exists(hnsw_path):
+        os.remove(hnsw_path)
+
+    print(f"Exported {len(ids)} scholarships to {directory}", file=sys.stderr)
+    return len(ids)
+
+
+# --- Benchmark ---------------------------------------------------------------------
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _random_queries(count, dimensions, seed=0):
+    import random
+    import numpy as np
+
+    rng = random.Random(seed)
+    vectors = np.random.default_rng(seed).standard_normal((count, dimensions)).astype(np.float32)
+    profiles = [{
+        "gpa": round(rng.uniform(2.4, 4.0), 2),
+        "degree_level": rng.choice(list(eligibility.DEGREE_LEVELS)),
+        "citizenship": rng.choice(["Canadian", "American", None])
+    } for _ in range(count)]
+    return vectors.tolist(), profiles
+
+
+def measure(backend, queries, chroma_path=None, directory=INDEX_DIR, top_k=15):
+    """Load one backend in this process and time single queries against it."""
+    from benchmark import percentiles
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    if backend == "numpy":
+        index = VectorIndex(directory)
+        dimensions = index.vectors.shape[1]
+
+        def search(vector, profile):
+            return index.search([vector], [profile], top_k)[0]
+    else:
+        import scholarship_matcher
+        if chroma_path:
+            scholarship_matcher.DB_PATH = chroma_path
+        collection = scholarship_matcher.get_scholarships_collection()
+        dimensions = len(collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+
+        def search(vector, profile):
+            return scholarship_matcher.search_by_vectors(collection, [vector], [profile], top_k)[0]
+    load_ms = (time.perf_counter() - started) * 1000
+
+    vectors, profiles = _random_queries(queries, dimensions)
+    search(vectors[0], profiles[0])  # warm-up
+    latencies = []
+    for vector, profile in zip(vectors, profiles):
+        started = time.perf_counter()
+        search(vector, profile)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return {"backend": backend, "load_ms": round(load_ms, 1), "latency_ms": percentiles(latencies),
+            "rss_mb": round(_rss_mb(), 1), "rss_added_mb": round(_rss_mb() - rss_before, 1)}
+
+
+def run_benchmark(queries, chroma_path=None, directory=INDEX_DIR):
+    """Measure each backend in a fresh process, so their memory doesn't mix."""
+    results = []
+    for backend in ("chroma", "numpy"):
+        command = [sys.executable, os.path.abspath(__file__), "--measure", backend,
+                   "--queries", str(queries), "--index-dir", directory]
+        if chroma_path:
+            command += ["--chroma-path", chroma_path]
+        completed = subprocess.run(command, capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            results.append({"backend": backend, "error": completed.stderr.strip().splitlines()[-1:]})
+        else:
+            results.append(json.loads(completed.stdout))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process vector index for the scholarships collection")
+    parser.add_argument("--export", action="store_true", help="Export the Chroma collection")
+    parser.add_argument("--benchmark", action="store_true", help="Compare query latency and RSS with Chroma")
+    parser.add_argument("--measure", choices=["chroma", "numpy"], help=argparse.SUPPRESS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chroma-path", help="Chroma directory to export or compare (default: the app's)")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--output", help="Also write benchmark results to this JSON file")
+    args = parser.parse_args()
+
+    if args.export:
+        import scholarship_matcher
+        if args.chroma_path:
+            scholarship_matcher.DB_PATH = args.chroma_path
+        export(scholarship_matcher.get_scholarships_collection(), args.index_dir)
+    elif args.measure:
+        print(json.dumps(measure(args.measure, args.queries, args.chroma_path, args.index_dir)))
+    elif args.benchmark:
+        results = run_benchmark(args.queries, args.chroma_path, args.index_dir)
+        for result in results:
+            print(json.dumps(result), file=sys.stderr)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    else:
+        parser.print_help()
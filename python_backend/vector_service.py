@@ -0,0 +1,470 @@
+import sys
+import os
+import json
+import time
+import fcntl
+import signal
+import socket
+import argparse
+import threading
+import subprocess
+import socketserver
+
+import tracing
+
+# Shared read-only vector store: one process per host holds the scholarship index and
+# answers searches over a Unix socket, so match workers don't each load their own copy.
+#
+#   python3 python_backend/vector_service.py --serve
+#   python3 python_backend/vector_service.py --load-test --concurrency 1,4,16
+#
+# With VECTOR_BACKEND=service the matcher searches through ServiceClient, which keeps
+# up to VECTOR_SERVICE_POOL_SIZE connections per process open. The first client to
+# find no service running starts one (logging to .cache/vector_service.log); a lock
+# file next to the socket makes sure only one of them binds it. The service searches
+# the exported numpy index (VECTOR_SERVICE_BACKEND=numpy, the default; reloaded when
+# it is re-exported) or the Chroma collection (=chroma; restart it after re-ingesting).
+#
+# Protocol, one JSON object per line each way:
+#   {"op": "search", "vectors", "structured", "top_k", "distance_threshold"}
+#       -> {"matches": [[...], ...], "annotations": {...}}
+#   {"op": "ping"} -> {"ok": true, "pid", "backend", "rows"}
+# A request that fails gets {"error": "..."}.
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache")
+SOCKET_PATH = os.environ.get("VECTOR_SERVICE_SOCKET", os.path.join(CACHE_DIR, "vector_service.sock"))
+SERVICE_BACKEND = os.environ.get("VECTOR_SERVICE_BACKEND", "numpy")
+POOL_SIZE = int(os.environ.get("VECTOR_SERVICE_POOL_SIZE", "4"))
+TIMEOUT_SECONDS = float(os.environ.get("VECTOR_SERVICE_TIMEOUT", "30"))
+AUTOSTART = os.environ.get("VECTOR_SERVICE_AUTOSTART", "1") != "0"
+START_TIMEOUT_SECONDS = float(os.environ.get("VECTOR_SERVICE_START_TIMEOUT", "60"))
+CHECK_SECONDS = float(os.environ.get("VECTOR_SERVICE_CHECK_SECONDS", "5"))
+LOG_PATH = os.path.join(CACHE_DIR, "vector_service.log")
+
+
+# --- Service -------------------------------------------------------------------------
+
+class VectorStore:
+    """The loaded backend, swapped for a fresh one when the exported index changes."""
+
+    def __init__(self, backend=SERVICE_BACKEND, index_dir=None, chroma_path=None):
+        self.backend = backend
+        self.index_dir = index_dir
+        self.chroma_path = chroma_path
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._version = self._current_version()
+        self._search, self.rows = self._load()
+
+    def _current_version(self):
+        if self.backend != "numpy":
+            return None
+        import vector_index
+        directory = self.index_dir or vector_index.INDEX_DIR
+        try:
+            return os.stat(os.path.join(directory, vector_index.METADATA_FILE)).st_mtime
+        except OSError:
+            return None
+
+    def _load(self):
+        """(search function, row count) for the configured backend."""
+        if self.backend == "numpy":
+            import vector_index
+            index = vector_index.VectorIndex(self.index_dir or vector_index.INDEX_DIR)
+            return index.search, len(index)
+
+        import scholarship_matcher
+        if self.chroma_path:
+            scholarship_matcher.DB_PATH = self.chroma_path
+        collection = scholarship_matcher.get_scholarships_collection()
+
+        def search(vectors, structured_list, top_k, distance_threshold):
+            return scholarship_matcher.search_by_vectors(collection, vectors, structured_list,
+                                                         top_k, distance_threshold)
+        return search, collection.count()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < CHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked < CHECK_SECONDS:
+                return
+            self._checked = now
+            version = self._current_version()
+            if version == self._version:
+                return
+            try:
+                self._search, self.rows = self._load()
+                self._version = version
+                print(f"Vector service reloaded the index ({self.rows} rows)", file=sys.stderr)
+            except Exception as e:
+                # Keep serving the index we have; export replaces files atomically, so
+                # this is usually a half-finished re-export that the next check will see
+                print(f"Vector service failed to reload the index: {e}", file=sys.stderr)
+
+    def search(self, vectors, structured_list, top_k, distance_threshold):
+        """(matches, span annotations) for one batch of query vectors."""
+        self._maybe_reload()
+        with tracing.trace(), tracing.span("search") as record:
+            matches = self._search(vectors, structured_list, top_k, distance_threshold)
+        annotations = {key: value for key, value in (record or {}).items() if key not in ("name", "ms")}
+        return matches, annotations
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "search":
+                    matches, annotations = store.search(
+                        request["vectors"], request["structured"],
+                        int(request.get("top_k", 5)), float(request.get("distance_threshold", 1.0))
+                    )
+                    response = {"matches": matches, "annotations": annotations}
+                elif op == "ping":
+                    response = {"ok": True, "pid": os.getpid(), "backend": store.backend, "rows": store.rows}
+                else:
+                    response = {"error": f"Unknown op: {op}"}
+            except Exception as e:
+                print(f"Vector service request failed: {e}", file=sys.stderr)
+                response = {"error": str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path=SOCKET_PATH, backend=SERVICE_BACKEND, index_dir=None, chroma_path=None):
+    """Load the index and answer searches on socket_path until killed.
+
+    Returns straight away if another service already holds the socket's lock.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    lock_file = open(socket_path + ".lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"A vector service is already running on {socket_path}", file=sys.stderr)
+        return
+
+    store = VectorStore(backend, index_dir, chroma_path)
+    # Left behind by a service that was killed; the lock says it isn't running
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = _Server(socket_path, _Handler)
+    os.chmod(socket_path, 0o600)
+    server.store = store
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Vector service ({backend}, {store.rows} rows) listening on {socket_path}, pid {os.getpid()}",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+# --- Client --------------------------------------------------------------------------
+
+class ServiceUnavailableError(RuntimeError):
+    pass
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class ServiceClient:
+    """Pooled connections to the vector service; safe to share between threads."""
+
+    def __init__(self, socket_path=SOCKET_PATH, pool_size=POOL_SIZE, timeout=TIMEOUT_SECONDS,
+                 autostart=AUTOSTART):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.autostart = autostart
+        self._slots = threading.BoundedSemaphore(max(pool_size, 1))
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return _Connection(sock)
+
+    def _open(self):
+        """A new connection, starting the service first if nothing is listening."""
+        try:
+            return self._connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not self.autostart:
+                raise ServiceUnavailableError(f"No vector service on {self.socket_path}")
+        with self._lock:
+            # Another thread may have started it while this one waited
+            try:
+                return self._connect()
+            except (FileNotFoundError, ConnectionRefusedError):
+                start_service(self.socket_path)
+            deadline = time.monotonic() + START_TIMEOUT_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    return self._connect()
+                except (FileNotFoundError, ConnectionRefusedError):
+                    time.sleep(0.1)
+        raise ServiceUnavailableError(f"Vector service did not start within {START_TIMEOUT_SECONDS:.0f}s "
+                                      f"(see {LOG_PATH})")
+
+    def request(self, message):
+        """Send one request and return the response; retried once on a dropped connection."""
+        line = (json.dumps(message) + "\n").encode("utf-8")
+        with self._slots:
+            for attempt in range(2):
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    connection = self._open()
+                try:
+                    connection.sock.sendall(line)
+                    reply = connection.reader.readline()
+                    if not reply:
+                        raise ConnectionResetError("Vector service closed the connection")
+                except OSError:
+                    # Pooled connections to a service that has since gone away; the
+                    # rest of the pool is just as stale
+                    connection.close()
+                    self.close()
+                    if attempt:
+                        raise
+                    continue
+                with self._lock:
+                    self._idle.append(connection)
+                break
+
+        response = json.loads(reply)
+        if "error" in response:
+            raise RuntimeError(f"Vector service: {response['error']}")
+        return response
+
+    def search(self, vectors, structured_list, top_k=5, distance_threshold=1.0):
+        """Same as VectorIndex.search, answered by the service."""
+        response = self.request({"op": "search", "vectors": [[float(x) for x in v] for v in vectors],
+                                 "structured": structured_list, "top_k": top_k,
+                                 "distance_threshold": distance_threshold})
+        tracing.annotate(**response.get("annotations", {}), service=True)
+        return response["matches"]
+
+    def ping(self):
+        return self.request({"op": "ping"})
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def start_service(socket_path=SOCKET_PATH):
+    """Start a detached service process; it outlives the worker that started it."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    print(f"Starting the vector service on {socket_path}", file=sys.stderr)
+    with open(LOG_PATH, "a") as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--socket", socket_path],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+_client = None
+
+
+def get_client():
+    """Return the process-wide ServiceClient."""
+    global _client
+    if _client is None:
+        _client = ServiceClient()
+    return _client
+
+
+# --- Load test -----------------------------------------------------------------------
+
+def _memory_mb(pid):
+    """(RSS, PSS) of a process in MB; PSS splits shared pages between the processes
+    mapping them, so it adds up across processes. PSS is None where /proc lacks it."""
+    rss = pss = None
+    for name in ("smaps_rollup", "status"):
+        try:
+            with open(f"/proc/{pid}/{name}") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        pss = int(line.split()[1]) / 1024
+                    elif line.startswith(("Rss:", "VmRSS:")) and rss is None:
+                        rss = int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return rss, pss
+
+
+def _load_worker(mode, queries, args):
+    """One match worker in the load test: search, report memory, wait to be released."""
+    from benchmark import percentiles
+    import vector_index
+
+    # Queries are generated with numpy, which every match worker imports anyway; take
+    # the baseline after that so the difference is what the index costs this process
+    vectors, profiles = vector_index._random_queries(queries, args.dimensions, seed=os.getpid())
+    baseline = _memory_mb(os.getpid())
+    if mode == "service":
+        client = ServiceClient(args.socket, autostart=False)
+        search = client.search
+    else:
+        store = VectorStore(args.backend, args.index_dir, args.chroma_path)
+
+        def search(vectors, structured_list, top_k, distance_threshold):
+            return store.search(vectors, structured_list, top_k, distance_threshold)[0]
+
+    latencies = []
+    for vector, profile in zip(vectors, profiles):
+        started = time.perf_counter()
+        search([vector], [profile], 15, 1.0)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(json.dumps({"latency_ms": percentiles(latencies), "baseline": baseline}), flush=True)
+    sys.stdin.readline()
+
+
+def _run_level(mode, concurrency, args):
+    """Run `concurrency` workers at once; memory is read while all of them are alive."""
+    script = os.path.abspath(__file__)
+    common = ["--queries", str(args.queries), "--socket", args.socket, "--backend", args.backend,
+              "--dimensions", str(args.dimensions)]
+    if args.index_dir:
+        common += ["--index-dir", args.index_dir]
+    if args.chroma_path:
+        common += ["--chroma-path", args.chroma_path]
+
+    service = None
+    if mode == "service":
+        service = subprocess.Popen([sys.executable, script, "--serve"] + common, stdin=subprocess.DEVNULL)
+        client = ServiceClient(args.socket, autostart=False)
+        deadline = time.monotonic() + START_TIMEOUT_SECONDS
+        while True:
+            try:
+                client.ping()
+                break
+            except (OSError, ServiceUnavailableError):
+                if time.monotonic() > deadline or service.poll() is not None:
+                    raise ServiceUnavailableError("Vector service did not start for the load test")
+                time.sleep(0.1)
+        client.close()
+
+    started = time.perf_counter()
+    workers = [subprocess.Popen([sys.executable, script, "--load-worker", mode] + common,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for _ in range(concurrency)]
+    try:
+        reports = [json.loads(worker.stdout.readline()) for worker in workers]
+        elapsed = time.perf_counter() - started
+        worker_memory = [_memory_mb(worker.pid) for worker in workers]
+        service_memory = _memory_mb(service.pid) if service else (0.0, 0.0)
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+        if service:
+            service.terminate()
+            service.wait()
+
+    def total(column):
+        values = [memory[column] for memory in worker_memory + [service_memory]]
+        return None if None in values else round(sum(values), 1)
+
+    rss_total, pss_total = total(0), total(1)
+    column = 1 if pss_total is not None else 0
+    # What the index costs across the host: each worker's growth past its baseline,
+    # plus the service. This is the number that should stay flat with concurrency.
+    index_mb = service_memory[column] + sum(
+        memory[column] - report["baseline"][column] for memory, report in zip(worker_memory, reports)
+    )
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "throughput_qps": round(concurrency * args.queries / elapsed, 1),
+        "latency_p50_ms": max(report["latency_ms"]["p50"] for report in reports),
+        "latency_p95_ms": max(report["latency_ms"]["p95"] for report in reports),
+        "rss_total_mb": rss_total,
+        "pss_total_mb": pss_total,
+        "service_mb": round(service_memory[column], 1),
+        "index_mb": round(index_mb, 1),
+        "index_mb_per_worker": round(index_mb / concurrency, 1),
+    }
+
+
+def load_test(args):
+    """In-process index per worker vs. one shared service, at each concurrency level."""
+    if args.synthetic:
+        from benchmark import build_synthetic_index
+        args.backend = "numpy"
+        args.index_dir = build_synthetic_index(args.synthetic)
+    if args.backend == "numpy":
+        import vector_index
+        index = vector_index.VectorIndex(args.index_dir or vector_index.INDEX_DIR)
+        args.dimensions = index.vectors.shape[1]
+        del index
+
+    results = []
+    for concurrency in args.concurrency:
+        for mode in ("in-process", "service"):
+            result = _run_level(mode, concurrency, args)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared read-only vector store for match workers")
+    parser.add_argument("--serve", action="store_true", help="Run the service")
+    parser.add_argument("--load-test", action="store_true",
+                        help="Compare memory of per-worker indexes with one shared service")
+    parser.add_argument("--load-worker", choices=["in-process", "service"], help=argparse.SUPPRESS)
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--backend", choices=["numpy", "chroma"], default=SERVICE_BACKEND)
+    parser.add_argument("--index-dir", help="Exported index to serve (default: VECTOR_INDEX_DIR)")
+    parser.add_argument("--chroma-path", help="Chroma directory to serve (default: the app's)")
+    parser.add_argument("--concurrency", type=lambda text: [int(n) for n in text.split(",")], default=[1, 4, 16])
+    parser.add_argument("--queries", type=int, default=100, help="Queries per worker")
+    parser.add_argument("--synthetic", type=int, help="Load test a synthetic index of this many rows")
+    parser.add_argument("--dimensions", type=int, default=768, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Also write load test results to this JSON file")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.socket, args.backend, args.index_dir, args.chroma_path)
+    elif args.load_worker:
+        _load_worker(args.load_worker, args.queries, args)
+    elif args.load_test:
+        if args.socket == SOCKET_PATH:
+            # Don't disturb a service the app is using
+            args.socket = os.path.join(CACHE_DIR, f"vector_service-load-{os.getpid()}.sock")
+        results = load_test(args)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    else:
+        parser.print_help()
@@ -0,0 +1,68 @@
+import sys
+import json
+import inspect
+import traceback
+
+# Newline-delimited JSON protocol spoken with server/pythonWorkers.ts:
+#   request:  {"id": 1, "payload": {...}}         -> {"id": 1, "result": {...}}
+#   health:   {"id": 2, "type": "ping"}           -> {"id": 2, "result": {"ok": true}}
+#   stream:   a handler may return a generator; each yielded event is sent as
+#             {"id": 1, "event": {...}} before the final {"id": 1, "result": ...}
+# On startup the worker writes {"type": "ready"} once its imports and warm-up are done.
+
+
+def drain_events(events, emit):
+    """Pass each event from a generator to emit and return the generator's return value."""
+    while True:
+        try:
+            emit(next(events))
+        except StopIteration as stop:
+            return stop.value
+
+
+def serve(handler, warm_up=None):
+    """Run a long-lived worker that answers NDJSON requests on stdin with handler(payload).
+
+    warm_up, if given, runs before the worker reports ready.
+    """
+    # Keep the real stdout for protocol messages only; anything else that gets
+    # printed (libraries, debug output) goes to stderr so it can't corrupt a reply.
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    def send(message):
+        protocol_out.write(json.dumps(message) + "\n")
+        protocol_out.flush()
+
+    if warm_up is not None:
+        warm_up()
+
+    send({"type": "ready"})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Worker received invalid JSON: {e}", file=sys.stderr)
+            continue
+
+        request_id = request.get("id")
+
+        if request.get("type") == "ping":
+            send({"id": request_id, "result": {"ok": True}})
+            continue
+
+        try:
+            result = handler(request.get("payload", {}))
+            if inspect.isgenerator(result):
+                result = drain_events(result, lambda event: send({"id": request_id, "event": event}))
+        except Exception as e:
+            print(f"Worker request {request_id} failed: {e}", file=sys.stderr)
+            traceback.print_exc()
+            result = {"error": str(e)}
+
+        send({"id": request_id, "result": result})
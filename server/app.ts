@@ -22,6 +22,15 @@ export function log(message: string, source = "express") {
 
 export const app = express();
 
+// How many reverse proxies sit in front of the server (Replit's deployment router is
+// one), so req.ip is the real client and not the proxy. TRUST_PROXY takes anything
+// Express's "trust proxy" accepts: a hop count, "true"/"false", or addresses/subnets.
+function trustProxySetting(value: string): boolean | number | string {
+  if (value === "true" || value === "false") return value === "true";
+  return /^\d+$/.test(value) ? parseInt(value, 10) : value;
+}
+app.set("trust proxy", trustProxySetting(process.env.TRUST_PROXY || "1"));
+
 declare module 'http' {
   interface IncomingMessage {
     rawBody: unknown
@@ -0,0 +1,128 @@
+// Compares the spawn-per-request model with the warm worker pool.
+//
+//   npx tsx server/benchmarks/pythonWorkers.ts [--script matcher|essay] [--requests 20]
+//       [--concurrency 4] [--pool-size 4] [--payload path/to/payload.json]
+//
+// Runs against whatever backends the environment points at, so set the same API keys
+// the server uses. Reports p50/p99 latency and requests/sec for each mode.
+
+import fs from "fs";
+import path from "path";
+import { executePythonScript } from "../routes";
+import { PythonWorkerPool } from "../pythonWorkers";
+
+const SAMPLE_PROFILE = {
+  name: "Jordan Lee",
+  gpa: 3.7,
+  degreeLevel: "undergraduate",
+  fieldOfStudy: "Computer Science",
+  citizenship: "Canada",
+  age: 20,
+  activities: "Founded a coding club for middle school students; volunteer at a food bank",
+  backgroundStory: "First-generation student who grew up helping run the family restaurant",
+  careerGoals: "Build accessible software for community organizations",
+  challenges: "Balanced part-time work with full course load",
+};
+
+function parseArgs() {
+  const args = process.argv.slice(2);
+  const get = (name: string, fallback: string) => {
+    const index = args.indexOf(`--${name}`);
+    return index !== -1 && args[index + 1] ? args[index + 1] : fallback;
+  };
+  return {
+    script: get("script", "matcher"),
+    requests: parseInt(get("requests", "20"), 10),
+    concurrency: parseInt(get("concurrency", "4"), 10),
+    poolSize: parseInt(get("pool-size", "4"), 10),
+    payloadPath: get("payload", ""),
+  };
+}
+
+function percentile(sorted: number[], p: number): number {
+  if (sorted.length === 0) return 0;
+  const index = Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1);
+  return sorted[Math.max(0, index)];
+}
+
+async function runLoad(
+  label: string,
+  requests: number,
+  concurrency: number,
+  call: () => Promise<any>,
+) {
+  const latencies: number[] = [];
+  let errors = 0;
+  let next = 0;
+
+  const start = Date.now();
+  const runners = Array.from({ length: concurrency }, async () => {
+    while (next < requests) {
+      next++;
+      const t0 = Date.now();
+      try {
+        await call();
+      } catch (e) {
+        errors++;
+      }
+      latencies.push(Date.now() - t0);
+    }
+  });
+  await Promise.all(runners);
+  const elapsed = (Date.now() - start) / 1000;
+
+  latencies.sort((a, b) => a - b);
+  return {
+    mode: label,
+    requests,
+    errors,
+    p50_ms: percentile(latencies, 50),
+    p99_ms: percentile(latencies, 99),
+    requests_per_sec: Number((requests / elapsed).toFixed(2)),
+  };
+}
+
+async function waitForPool(pool: PythonWorkerPool, size: number) {
+  while (pool.stats().ready < size) {
+    await new Promise((resolve) => setTimeout(resolve, 100));
+  }
+}
+
+async function main() {
+  const options = parseArgs();
+  const scriptName = options.script === "essay" ? "essay_generator.py" : "scholarship_matcher.py";
+  const scriptPath = path.join(process.cwd(), "python_backend", scriptName);
+
+  const payload = options.payloadPath
+    ? JSON.parse(fs.readFileSync(options.payloadPath, "utf-8"))
+    : options.script === "essay"
+      ? {
+          scholarshipDescription: "Community Leadership Award\nRecognizes students who have led service projects in their communities.",
+          studentProfile: SAMPLE_PROFILE,
+          scholarshipName: "Community Leadership Award",
+        }
+      : { studentProfile: SAMPLE_PROFILE };
+
+  const spawnResult = await runLoad("spawn", options.requests, options.concurrency, () =>
+    executePythonScript(scriptPath, payload),
+  );
+
+  const pool = new PythonWorkerPool({
+    scriptPath,
+    size: options.poolSize,
+    maxQueue: options.requests,
+  });
+  // Startup is paid once per worker, not per request; measure steady state
+  await waitForPool(pool, options.poolSize);
+  const poolResult = await runLoad("pool", options.requests, options.concurrency, () =>
+    pool.run(payload),
+  );
+  pool.close();
+
+  console.table([spawnResult, poolResult]);
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,124 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+import { EventEmitter } from "events";
+import readline from "readline";
+import { PoolOverloadedError } from "./pythonWorkers";
+
+// Client for the essay job runner (python_backend/essay_jobs.py --run): one long-lived
+// Python process that owns the SQLite job queue and generates essays on its own
+// bounded thread pool. Requests (submit, get, cancel, stats) are NDJSON over stdin;
+// job state changes arrive unprompted and are re-emitted as "job" events, which the
+// SSE endpoint and the metrics use. The process is restarted if it exits; jobs it was
+// running are requeued by the next one (see essay_jobs.py).
+
+export interface EssayJob {
+  id: string;
+  status: "queued" | "running" | "succeeded" | "failed" | "cancelled";
+  lane: string;
+  attempts: number;
+  createdAt: number;
+  startedAt: number | null;
+  finishedAt: number | null;
+  position?: number;
+  result?: any;
+  error?: string;
+}
+
+export const FINISHED_STATUSES = ["succeeded", "failed", "cancelled"];
+
+interface Pending {
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
+export class EssayJobRunner extends EventEmitter {
+  private process: ChildProcessWithoutNullStreams | null = null;
+  private pending = new Map<number, Pending>();
+  private nextId = 1;
+  private ready = false;
+  private closed = false;
+
+  constructor(
+    private scriptPath: string,
+    private requestTimeoutMs = 10_000,
+    private restartDelayMs = 1_000,
+  ) {
+    super();
+    // Subscribers come and go per request; don't warn about many listeners
+    this.setMaxListeners(0);
+    this.start();
+  }
+
+  private start() {
+    const child = spawn("python3", [this.scriptPath, "--run"], { env: process.env });
+    this.process = child;
+
+    readline.createInterface({ input: child.stdout }).on("line", (line) => this.handleLine(line));
+    child.stderr.on("data", (data) => process.stderr.write(data));
+
+    child.on("exit", (code, signal) => {
+      this.ready = false;
+      this.process = null;
+      for (const [id, request] of Array.from(this.pending)) {
+        clearTimeout(request.timer);
+        request.reject(new Error(`Essay job runner exited (code ${code}, signal ${signal})`));
+        this.pending.delete(id);
+      }
+      if (!this.closed) {
+        console.error(`Essay job runner exited (code ${code}, signal ${signal}); restarting`);
+        setTimeout(() => this.start(), this.restartDelayMs);
+      }
+    });
+  }
+
+  private handleLine(line: string) {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      console.error("Failed to parse essay job runner output:", line);
+      return;
+    }
+
+    if (message.type === "ready") {
+      this.ready = true;
+      return;
+    }
+    if (message.type === "job") {
+      this.emit("job", message.job as EssayJob);
+      return;
+    }
+
+    const request = this.pending.get(message.id);
+    if (request) {
+      clearTimeout(request.timer);
+      this.pending.delete(message.id);
+      if (message.result?.error) {
+        request.reject(new Error(message.result.error));
+      } else {
+        request.resolve(message.result);
+      }
+    }
+  }
+
+  request(op: string, fields: Record<string, unknown> = {}): Promise<any> {
+    if (!this.process || !this.ready) {
+      return Promise.reject(new PoolOverloadedError("The essay service is starting, please try again shortly"));
+    }
+
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Essay job runner did not respond within ${this.requestTimeoutMs}ms`));
+      }, this.requestTimeoutMs);
+      this.pending.set(id, { resolve, reject, timer });
+      this.process!.stdin.write(JSON.stringify({ ...fields, id, op }) + "\n");
+    });
+  }
+
+  close() {
+    this.closed = true;
+    this.process?.stdin.end();
+  }
+}
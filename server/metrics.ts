@@ -0,0 +1,194 @@
+// Prometheus-style metrics for the Python pipelines, served from GET /api/metrics.
+//
+// Request durations are measured here; per-stage timings, token usage, cache hits and
+// eligibility filter counts come from the "trace" the Python side attaches to each
+// result (see python_backend/tracing.py). Set METRICS_ENABLED=0 to turn this off.
+
+export const metricsEnabled = process.env.METRICS_ENABLED !== "0";
+
+const DURATION_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80];
+
+const TOKEN_FIELDS: Record<string, string> = {
+  input_tokens: "input",
+  output_tokens: "output",
+  cache_read_input_tokens: "cache_read",
+  cache_creation_input_tokens: "cache_write",
+};
+
+// Span counters set by the Python Claude client layer (claude_client.py, llm_cache.py)
+const RESILIENCE_FIELDS = ["retries", "hedged", "repairs"] as const;
+
+export interface TraceSpan {
+  name: string;
+  ms: number;
+  error?: string;
+  cache_hit?: boolean;
+  index_hit?: boolean;
+  filtered_out?: Record<string, number>;
+  [field: string]: unknown;
+}
+
+export interface PipelineTrace {
+  total_ms: number;
+  spans: TraceSpan[];
+}
+
+type Labels = Record<string, string>;
+
+function labelKey(labels: Labels): string {
+  const parts = Object.entries(labels).map(
+    ([name, value]) => `${name}="${value.replace(/\\/g, "\\\\").replace(/"/g, '\\"')}"`,
+  );
+  return parts.join(",");
+}
+
+class Counter {
+  private values = new Map<string, number>();
+
+  constructor(readonly name: string, readonly help: string) {}
+
+  inc(labels: Labels, amount = 1) {
+    const key = labelKey(labels);
+    this.values.set(key, (this.values.get(key) ?? 0) + amount);
+  }
+
+  render(): string[] {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} counter`];
+    for (const [key, value] of Array.from(this.values)) {
+      lines.push(`${this.name}{${key}} ${value}`);
+    }
+    return lines;
+  }
+}
+
+class Histogram {
+  private series = new Map<string, { counts: number[]; sum: number; count: number }>();
+
+  constructor(readonly name: string, readonly help: string, readonly buckets = DURATION_BUCKETS) {}
+
+  observe(labels: Labels, value: number) {
+    const key = labelKey(labels);
+    let series = this.series.get(key);
+    if (!series) {
+      series = { counts: this.buckets.map(() => 0), sum: 0, count: 0 };
+      this.series.set(key, series);
+    }
+    this.buckets.forEach((bound, i) => {
+      if (value <= bound) series!.counts[i]++;
+    });
+    series.sum += value;
+    series.count++;
+  }
+
+  render(): string[] {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} histogram`];
+    for (const [key, series] of Array.from(this.series)) {
+      const prefix = key ? `${key},` : "";
+      this.buckets.forEach((bound, i) => {
+        lines.push(`${this.name}_bucket{${prefix}le="${bound}"} ${series.counts[i]}`);
+      });
+      lines.push(`${this.name}_bucket{${prefix}le="+Inf"} ${series.count}`);
+      lines.push(`${this.name}_sum{${key}} ${series.sum}`);
+      lines.push(`${this.name}_count{${key}} ${series.count}`);
+    }
+    return lines;
+  }
+}
+
+const requests = new Counter("pipeline_requests_total", "Pipeline requests by outcome");
+const requestDuration = new Histogram(
+  "pipeline_request_duration_seconds",
+  "End-to-end request time as seen by the Node server",
+);
+const pythonOverhead = new Histogram(
+  "pipeline_python_overhead_seconds",
+  "Request time outside the traced Python stages (process startup, queueing, IPC)",
+);
+const stageDuration = new Histogram("pipeline_stage_duration_seconds", "Time spent in each pipeline stage");
+const stageErrors = new Counter("pipeline_stage_errors_total", "Stages that failed or fell back");
+const tokens = new Counter("pipeline_llm_tokens_total", "Anthropic tokens used, by stage and type");
+const cacheLookups = new Counter("pipeline_cache_lookups_total", "LLM cache and cluster index lookups");
+const filteredOut = new Counter(
+  "pipeline_filtered_out_total",
+  "Vector search candidates dropped, by reason",
+);
+const resultCache = new Counter(
+  "pipeline_result_cache_total",
+  "Requests answered from the result cache (hit), by joining an identical in-flight request (coalesced), or by running the pipeline (miss)",
+);
+const claudeCalls = new Counter(
+  "pipeline_claude_call_events_total",
+  "Claude calls retried, hedged or sent for JSON repair, by stage",
+);
+
+const registry: Array<Counter | Histogram> = [
+  requests,
+  requestDuration,
+  pythonOverhead,
+  stageDuration,
+  stageErrors,
+  tokens,
+  cacheLookups,
+  filteredOut,
+  claudeCalls,
+  resultCache,
+];
+
+export function observePipeline(
+  pipeline: string,
+  wallMs: number,
+  outcome: "ok" | "error",
+  trace?: PipelineTrace,
+) {
+  if (!metricsEnabled) return;
+
+  requests.inc({ pipeline, outcome });
+  requestDuration.observe({ pipeline }, wallMs / 1000);
+  if (!trace) return;
+
+  pythonOverhead.observe({ pipeline }, Math.max(0, wallMs - trace.total_ms) / 1000);
+
+  for (const span of trace.spans) {
+    const stage = span.name;
+    stageDuration.observe({ pipeline, stage }, span.ms / 1000);
+    if (span.error) {
+      stageErrors.inc({ pipeline, stage });
+    }
+    for (const [field, type] of Object.entries(TOKEN_FIELDS)) {
+      const count = span[field];
+      if (typeof count === "number") {
+        tokens.inc({ pipeline, stage, type }, count);
+      }
+    }
+    const hit = span.cache_hit ?? span.index_hit;
+    if (typeof hit === "boolean") {
+      cacheLookups.inc({ pipeline, stage, result: hit ? "hit" : "miss" });
+    }
+    for (const [reason, count] of Object.entries(span.filtered_out ?? {})) {
+      filteredOut.inc({ pipeline, reason }, count);
+    }
+    for (const event of RESILIENCE_FIELDS) {
+      const count = span[event];
+      if (typeof count === "number") {
+        claudeCalls.inc({ pipeline, stage, event }, count);
+      }
+    }
+  }
+}
+
+export function observeResultCache(pipeline: string, source: "hit" | "coalesced" | "miss") {
+  if (!metricsEnabled) return;
+  resultCache.inc({ pipeline, source });
+}
+
+// Extra gauge lines (e.g. worker pool state) are appended by the caller
+export function renderMetrics(gauges: Array<{ name: string; help: string; values: Array<[Labels, number]> }> = []): string {
+  const lines = registry.flatMap((metric) => metric.render());
+  for (const gauge of gauges) {
+    lines.push(`# HELP ${gauge.name} ${gauge.help}`, `# TYPE ${gauge.name} gauge`);
+    for (const [labels, value] of gauge.values) {
+      lines.push(`${gauge.name}{${labelKey(labels)}} ${value}`);
+    }
+  }
+  return lines.join("\n") + "\n";
+}
@@ -0,0 +1,297 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+import readline from "readline";
+
+// Pool of warm Python processes started with `--worker` (see python_backend/worker.py).
+// Each process keeps chromadb/anthropic imported and its clients open, and answers
+// one newline-delimited JSON request at a time.
+
+export interface PythonWorkerPoolOptions {
+  scriptPath: string;
+  size?: number;
+  maxQueue?: number;
+  requestTimeoutMs?: number;
+  healthCheckIntervalMs?: number;
+  healthCheckTimeoutMs?: number;
+  restartDelayMs?: number;
+}
+
+export class PoolOverloadedError extends Error {
+  status = 503;
+
+  constructor(message: string) {
+    super(message);
+    this.name = "PoolOverloadedError";
+  }
+}
+
+export type PythonEventHandler = (event: any) => void;
+
+interface QueuedTask {
+  payload: any;
+  onEvent?: PythonEventHandler;
+  signal?: AbortSignal;
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+}
+
+interface InFlight {
+  id: number;
+  onEvent?: PythonEventHandler;
+  resolve: (message: any) => void;
+  reject: (error: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
+const STDERR_TAIL_LIMIT = 4000;
+
+class PythonWorker {
+  private process: ChildProcessWithoutNullStreams;
+  private inFlight: InFlight | null = null;
+  private nextId = 1;
+  stderrTail = "";
+  everReady = false;
+  ready = false;
+  busy = false;
+  exited = false;
+
+  constructor(
+    scriptPath: string,
+    private onReady: (worker: PythonWorker) => void,
+    private onExit: (worker: PythonWorker) => void,
+  ) {
+    this.process = spawn("python3", [scriptPath, "--worker"], {
+      env: process.env,
+    });
+
+    const lines = readline.createInterface({ input: this.process.stdout });
+    lines.on("line", (line) => this.handleLine(line));
+
+    this.process.stderr.on("data", (data) => {
+      const text = data.toString();
+      process.stderr.write(text);
+      this.stderrTail = (this.stderrTail + text).slice(-STDERR_TAIL_LIMIT);
+    });
+
+    this.process.on("exit", (code, signal) => {
+      this.exited = true;
+      this.ready = false;
+      if (this.inFlight) {
+        clearTimeout(this.inFlight.timer);
+        this.inFlight.reject(
+          new Error(`Python worker exited (code ${code}, signal ${signal}): ${this.stderrTail}`),
+        );
+        this.inFlight = null;
+      }
+      this.onExit(this);
+    });
+  }
+
+  private handleLine(line: string) {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      console.error("Failed to parse Python worker output:", line);
+      return;
+    }
+
+    if (message.type === "ready") {
+      this.ready = true;
+      this.everReady = true;
+      this.onReady(this);
+      return;
+    }
+
+    if (this.inFlight && message.id === this.inFlight.id && "event" in message) {
+      this.inFlight.onEvent?.(message.event);
+      return;
+    }
+
+    if (this.inFlight && message.id === this.inFlight.id) {
+      const { resolve, timer } = this.inFlight;
+      clearTimeout(timer);
+      this.inFlight = null;
+      resolve(message.result);
+    }
+  }
+
+  send(message: any, timeoutMs: number, onEvent?: PythonEventHandler): Promise<any> {
+    return new Promise((resolve, reject) => {
+      const id = this.nextId++;
+      const timer = setTimeout(() => {
+        this.inFlight = null;
+        reject(new Error(`Python worker did not respond within ${timeoutMs}ms`));
+        // A worker that stops answering is stuck; replace it
+        this.kill();
+      }, timeoutMs);
+
+      this.inFlight = { id, onEvent, resolve, reject, timer };
+      this.process.stdin.write(JSON.stringify({ ...message, id }) + "\n");
+    });
+  }
+
+  kill() {
+    if (!this.exited) {
+      this.process.kill("SIGKILL");
+    }
+  }
+}
+
+export class PythonWorkerPool {
+  private workers: PythonWorker[] = [];
+  private queue: QueuedTask[] = [];
+  private healthTimer: NodeJS.Timeout;
+  private closed = false;
+  private failedStarts = 0;
+  private readonly size: number;
+  private readonly maxQueue: number;
+  private readonly requestTimeoutMs: number;
+  private readonly healthCheckTimeoutMs: number;
+  private readonly restartDelayMs: number;
+
+  constructor(private options: PythonWorkerPoolOptions) {
+    this.size = options.size ?? 2;
+    this.maxQueue = options.maxQueue ?? 32;
+    this.requestTimeoutMs = options.requestTimeoutMs ?? 180_000;
+    this.healthCheckTimeoutMs = options.healthCheckTimeoutMs ?? 5_000;
+    this.restartDelayMs = options.restartDelayMs ?? 1_000;
+
+    for (let i = 0; i < this.size; i++) {
+      this.workers.push(this.startWorker());
+    }
+
+    this.healthTimer = setInterval(
+      () => this.checkHealth(),
+      options.healthCheckIntervalMs ?? 30_000,
+    );
+    this.healthTimer.unref();
+  }
+
+  // onEvent receives streamed events (see worker.py) before the promise resolves.
+  // Aborting `signal` drops a queued request, or kills the worker running it (the pool
+  // starts a new one), so an abandoned request stops using Claude.
+  run(payload: any, onEvent?: PythonEventHandler, signal?: AbortSignal): Promise<any> {
+    if (this.closed) {
+      return Promise.reject(new Error("Python worker pool is closed"));
+    }
+    if (signal?.aborted) {
+      return Promise.reject(new Error("Request was cancelled"));
+    }
+    if (this.queue.length >= this.maxQueue) {
+      return Promise.reject(
+        new PoolOverloadedError("Server is busy, please try again shortly"),
+      );
+    }
+
+    return new Promise((resolve, reject) => {
+      const task = { payload, onEvent, signal, resolve, reject };
+      this.queue.push(task);
+      signal?.addEventListener("abort", () => {
+        const index = this.queue.indexOf(task);
+        if (index !== -1) {
+          this.queue.splice(index, 1);
+          reject(new Error("Request was cancelled"));
+        }
+      }, { once: true });
+      this.dispatch();
+    });
+  }
+
+  stats() {
+    return {
+      size: this.size,
+      ready: this.workers.filter((w) => w.ready).length,
+      busy: this.workers.filter((w) => w.busy).length,
+      queued: this.queue.length,
+    };
+  }
+
+  close() {
+    this.closed = true;
+    clearInterval(this.healthTimer);
+    for (const task of this.queue.splice(0)) {
+      task.reject(new Error("Python worker pool is closed"));
+    }
+    for (const worker of this.workers) {
+      worker.kill();
+    }
+  }
+
+  private startWorker(): PythonWorker {
+    return new PythonWorker(
+      this.options.scriptPath,
+      () => this.dispatch(),
+      (worker) => this.handleExit(worker),
+    );
+  }
+
+  private handleExit(worker: PythonWorker) {
+    if (this.closed) return;
+
+    if (worker.everReady) {
+      this.failedStarts = 0;
+    } else {
+      // The worker died during startup (bad env, import error). Don't leave callers
+      // waiting on a pool that can't come up, and back off so we don't spin.
+      this.failedStarts++;
+      if (!this.workers.some((w) => w.ready)) {
+        for (const task of this.queue.splice(0)) {
+          task.reject(new Error(`Python worker failed to start: ${worker.stderrTail}`));
+        }
+      }
+    }
+
+    const delay = Math.min(this.restartDelayMs * 2 ** this.failedStarts, 60_000);
+    console.error(`Python worker for ${this.options.scriptPath} exited, restarting in ${delay}ms`);
+    setTimeout(() => {
+      if (this.closed) return;
+      const index = this.workers.indexOf(worker);
+      if (index !== -1) {
+        this.workers[index] = this.startWorker();
+      }
+    }, delay);
+  }
+
+  private dispatch() {
+    for (const worker of this.workers) {
+      if (this.queue.length === 0) return;
+      if (!worker.ready || worker.busy) continue;
+
+      const task = this.queue.shift()!;
+      const cancel = () => worker.kill();
+      task.signal?.addEventListener("abort", cancel, { once: true });
+      worker.busy = true;
+      worker
+        .send({ payload: task.payload }, this.requestTimeoutMs, task.onEvent)
+        .then((result) => {
+          if (result && result.error) {
+            task.reject(new Error(result.error));
+          } else {
+            task.resolve(result);
+          }
+        })
+        .catch((error) => task.reject(error))
+        .finally(() => {
+          task.signal?.removeEventListener("abort", cancel);
+          worker.busy = false;
+          this.dispatch();
+        });
+    }
+  }
+
+  private checkHealth() {
+    // Busy workers are covered by the request timeout; only ping idle ones
+    for (const worker of this.workers) {
+      if (!worker.ready || worker.busy) continue;
+
+      worker.busy = true;
+      worker
+        .send({ type: "ping" }, this.healthCheckTimeoutMs)
+        .catch((error) => console.error("Python worker failed health check:", error.message))
+        .finally(() => {
+          worker.busy = false;
+          this.dispatch();
+        });
+    }
+  }
+}
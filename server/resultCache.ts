@@ -0,0 +1,114 @@
+import { createHash } from "crypto";
+import fs from "fs";
+
+// Request coalescing and a bounded TTL cache for pipeline results.
+//
+// Identical requests (same canonical key) that arrive while one is running share its
+// promise instead of starting their own pipeline (single-flight). Completed results
+// are kept for ttlMs, evicting the least recently used past maxEntries. Keys should
+// include a data version (see fileVersion) so results computed against an older
+// corpus are never served after a re-ingest.
+
+export type CacheSource = "hit" | "coalesced" | "miss";
+
+export interface ResultCacheOptions<T> {
+  ttlMs: number;
+  maxEntries: number;
+  // Results that fail this check (fallbacks, partial failures) are shared with
+  // coalesced callers but not kept
+  cacheable?: (value: T) => boolean;
+}
+
+export class ResultCache<T> {
+  private entries = new Map<string, { value: T; expires: number }>();
+  private inFlight = new Map<string, Promise<T>>();
+
+  constructor(private options: ResultCacheOptions<T>) {}
+
+  async get(
+    key: string,
+    compute: () => Promise<T>,
+    { bypass = false }: { bypass?: boolean } = {},
+  ): Promise<{ value: T; source: CacheSource }> {
+    if (!bypass) {
+      const entry = this.entries.get(key);
+      if (entry && entry.expires > Date.now()) {
+        // Re-insert to mark it most recently used
+        this.entries.delete(key);
+        this.entries.set(key, entry);
+        return { value: entry.value, source: "hit" };
+      }
+      if (entry) this.entries.delete(key);
+
+      const pending = this.inFlight.get(key);
+      if (pending) {
+        return { value: await pending, source: "coalesced" };
+      }
+    }
+
+    const promise = compute();
+    if (!bypass) this.inFlight.set(key, promise);
+    try {
+      const value = await promise;
+      this.store(key, value);
+      return { value, source: "miss" };
+    } finally {
+      if (this.inFlight.get(key) === promise) this.inFlight.delete(key);
+    }
+  }
+
+  get size(): number {
+    return this.entries.size;
+  }
+
+  get pending(): number {
+    return this.inFlight.size;
+  }
+
+  private store(key: string, value: T) {
+    const { ttlMs, maxEntries, cacheable } = this.options;
+    if (ttlMs <= 0 || maxEntries <= 0 || (cacheable && !cacheable(value))) return;
+
+    this.entries.delete(key);
+    this.entries.set(key, { value, expires: Date.now() + ttlMs });
+    while (this.entries.size > maxEntries) {
+      const oldest = this.entries.keys().next().value as string;
+      this.entries.delete(oldest);
+    }
+  }
+}
+
+// Sorted keys, trimmed strings, empty fields dropped: cosmetic differences in a form
+// submission don't change the key
+function normalize(value: unknown): unknown {
+  if (typeof value === "string") return value.trim();
+  if (Array.isArray(value)) return value.map(normalize);
+  if (value && typeof value === "object") {
+    const result: Record<string, unknown> = {};
+    for (const key of Object.keys(value).sort()) {
+      const field = normalize((value as Record<string, unknown>)[key]);
+      if (field !== undefined && field !== null && field !== "") result[key] = field;
+    }
+    return result;
+  }
+  return value;
+}
+
+export function canonicalHash(value: unknown): string {
+  return createHash("sha256").update(JSON.stringify(normalize(value) ?? null)).digest("hex");
+}
+
+// Modification times and sizes of the files a result was derived from; changes when
+// any of them is rewritten (re-ingest, index export, new strategy map)
+export function fileVersion(paths: string[]): string {
+  return paths
+    .map((file) => {
+      try {
+        const stat = fs.statSync(file);
+        return `${stat.mtimeMs.toString(36)}~${stat.size.toString(36)}`;
+      } catch {
+        return "-";
+      }
+    })
+    .join(".");
+}
@@ -1,9 +1,14 @@
-import type { Express } from "express";
+import type { Express, Request } from "express";
 import { createServer, type Server } from "http";
 import { spawn } from "child_process";
 import path from "path";
+import readline from "readline";
+import { PythonWorkerPool, PoolOverloadedError, type PythonEventHandler } from "./pythonWorkers";
+import { metricsEnabled, observePipeline, observeResultCache, renderMetrics } from "./metrics";
+import { ResultCache, canonicalHash, fileVersion } from "./resultCache";
+import { EssayJobRunner, FINISHED_STATUSES, type EssayJob } from "./essayJobs";
 
-function executePythonScript(scriptPath: string, inputData: any): Promise<any> {
+export function executePythonScript(scriptPath: string, inputData: any): Promise<any> {
   return new Promise((resolve, reject) => {
     const python = spawn("python3", [scriptPath], {
       env: process.env  // ✅ FIXED: Pass environment variables
@@ -44,52 +49,530 @@ function executePythonScript(scriptPath: string, inputData: any): Promise<any> {
   });
 }
 
+// Spawn-per-request variant for streaming scripts: NDJSON events on stdout, ending
+// with {"type": "result", "result": ...}
+function streamPythonScript(
+  scriptPath: string,
+  inputData: any,
+  onEvent: PythonEventHandler,
+  signal?: AbortSignal,
+): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const python = spawn("python3", [scriptPath], {
+      env: process.env
+    });
+    signal?.addEventListener("abort", () => python.kill(), { once: true });
+
+    let result: any = undefined;
+    let stderr = "";
+
+    readline.createInterface({ input: python.stdout }).on("line", (line) => {
+      let message: any;
+      try {
+        message = JSON.parse(line);
+      } catch (e) {
+        console.error("Failed to parse Python output:", line);
+        return;
+      }
+      if (message.type === "result") {
+        result = message.result;
+      } else {
+        onEvent(message);
+      }
+    });
+
+    python.stderr.on("data", (data) => {
+      stderr += data.toString();
+    });
+
+    python.on("close", (code) => {
+      if (result === undefined) {
+        console.error("Python script error:", stderr);
+        reject(new Error(`Python script failed (code ${code}): ${stderr}`));
+      } else if (result.error) {
+        reject(new Error(result.error));
+      } else {
+        resolve(result);
+      }
+    });
+
+    python.stdin.write(JSON.stringify(inputData));
+    python.stdin.end();
+  });
+}
+
+// Warm worker pools are the default; set PYTHON_WORKERS=0 to spawn a process per request
+const useWorkerPool = process.env.PYTHON_WORKERS !== "0";
+const workerPoolSize = parseInt(process.env.PYTHON_WORKER_POOL_SIZE || "2", 10);
+const workerMaxQueue = parseInt(process.env.PYTHON_WORKER_MAX_QUEUE || "32", 10);
+
+const pythonPools = new Map<string, PythonWorkerPool>();
+
+function getPythonPool(scriptPath: string): PythonWorkerPool {
+  let pool = pythonPools.get(scriptPath);
+  if (!pool) {
+    pool = new PythonWorkerPool({
+      scriptPath,
+      size: workerPoolSize,
+      maxQueue: workerMaxQueue,
+    });
+    pythonPools.set(scriptPath, pool);
+  }
+  return pool;
+}
+
+function runPythonScript(
+  scriptPath: string,
+  inputData: any,
+  onEvent?: PythonEventHandler,
+  signal?: AbortSignal,
+): Promise<any> {
+  if (!useWorkerPool) {
+    return onEvent
+      ? streamPythonScript(scriptPath, inputData, onEvent, signal)
+      : executePythonScript(scriptPath, inputData);
+  }
+  return getPythonPool(scriptPath).run(inputData, onEvent, signal);
+}
+
+// runPythonScript plus request metrics, including the stage trace on the result
+async function runPipeline(
+  pipeline: string,
+  scriptPath: string,
+  inputData: any,
+  onEvent?: PythonEventHandler,
+  signal?: AbortSignal,
+): Promise<any> {
+  const started = performance.now();
+  try {
+    const result = await runPythonScript(scriptPath, inputData, onEvent, signal);
+    observePipeline(pipeline, performance.now() - started, "ok", result?.trace);
+    return result;
+  } catch (error) {
+    observePipeline(pipeline, performance.now() - started, "error");
+    throw error;
+  }
+}
+
+// Final ranking of match results; see MATCH_RANKING in scholarship_matcher.py
+const RANKING_MODES = ["llm", "hybrid", "local"];
+
+// Drafts per essay; essay_generator.py clamps to ESSAY_MAX_DRAFTS as well
+const MAX_DRAFTS = parseInt(process.env.ESSAY_MAX_DRAFTS || "6", 10);
+
+function validDrafts(drafts: unknown): boolean {
+  return drafts === undefined || drafts === null ||
+    (Number.isInteger(drafts) && (drafts as number) >= 1 && (drafts as number) <= MAX_DRAFTS);
+}
+
+// Each batch run is its own Python process making up to BATCH_MATCH_CONCURRENCY Claude
+// calls, so only a few run at once; more are turned away with 503. NDJSON bodies are
+// streamed to the matcher and capped at BATCH_MATCH_MAX_BYTES (JSON bodies are capped
+// by express.json).
+const BATCH_MAX_RUNS = parseInt(process.env.BATCH_MATCH_MAX_RUNS || "2", 10);
+const BATCH_MAX_BYTES = parseInt(process.env.BATCH_MATCH_MAX_BYTES || String(5 * 1024 * 1024), 10);
+let batchRuns = 0;
+
+// Match results, shared by identical concurrent requests and kept for a while. Results
+// the matcher marks "degraded" (a stage failed or fell back) or that found nothing are
+// not kept, so a transient failure isn't served to later requests.
+const matchResults = new ResultCache<any>({
+  ttlMs: parseFloat(process.env.MATCH_RESULT_CACHE_TTL || "600") * 1000,
+  maxEntries: parseInt(process.env.MATCH_RESULT_CACHE_MAX_ENTRIES || "500", 10),
+  cacheable: (result) => (result?.matches?.length ?? 0) > 0 && !result?.degraded,
+});
+
+// The corpus files a match depends on; rewriting any of them (ingest, index export)
+// changes the cache key. Chroma's SQLite runs in WAL mode, so a write may only touch
+// the -wal file until the next checkpoint.
+const chromaDb = path.join(process.cwd(), "attached_assets", "chroma_scholarship_db", "chroma.sqlite3");
+const corpusFiles = [
+  chromaDb,
+  `${chromaDb}-wal`,
+  path.join(process.env.VECTOR_INDEX_DIR || path.join(process.cwd(), "python_backend", "vector_index"), "metadata.json"),
+];
+
+async function runMatch(
+  matcherPath: string,
+  input: { studentProfile: any; bypassCache?: boolean; ranking?: string },
+): Promise<{ result: any; source: "hit" | "coalesced" | "miss" }> {
+  const key = [canonicalHash(input.studentProfile), input.ranking ?? "default", fileVersion(corpusFiles)].join(":");
+  const { value, source } = await matchResults.get(
+    key,
+    () => runPipeline("match", matcherPath, input),
+    { bypass: Boolean(input.bypassCache) },
+  );
+  observeResultCache("match", source);
+  return { result: value, source };
+}
+
+// Who a job belongs to, for the per-user caps in essay_jobs.py. Only identities the
+// client can't pick for itself count; a header or body field would let any caller
+// skip the caps by sending a new value each time. req.ip honours the "trust proxy"
+// setting in app.ts.
+function requesterId(req: Request): string {
+  return req.ip || req.socket.remoteAddress || "anonymous";
+}
+
+function errorStatus(error: unknown): number {
+  return error instanceof PoolOverloadedError ? error.status : 500;
+}
+
 export async function registerRoutes(app: Express): Promise<Server> {
+  const matcherPath = path.join(process.cwd(), "python_backend", "scholarship_matcher.py");
+  const essayGeneratorPath = path.join(process.cwd(), "python_backend", "essay_generator.py");
+
+  // Essays are generated as queued jobs (see server/essayJobs.ts)
+  const essayJobs = new EssayJobRunner(path.join(process.cwd(), "python_backend", "essay_jobs.py"));
+  essayJobs.on("job", (job: EssayJob) => {
+    if (FINISHED_STATUSES.includes(job.status) && job.status !== "cancelled" && job.startedAt && job.finishedAt) {
+      observePipeline("essay_job", (job.finishedAt - job.startedAt) * 1000,
+        job.status === "succeeded" ? "ok" : "error", job.result?.trace);
+    }
+  });
+
+  if (useWorkerPool) {
+    // Start the workers now so the first request doesn't pay for the imports
+    getPythonPool(matcherPath);
+    getPythonPool(essayGeneratorPath);
+  }
+
   // Match scholarships endpoint
   app.post("/api/match-scholarships", async (req, res) => {
     try {
-      const { studentProfile } = req.body;
+      const { studentProfile, bypassCache, ranking } = req.body;
       
       if (!studentProfile) {
         return res.status(400).json({ error: "Student profile is required" });
       }
+      if (ranking !== undefined && !RANKING_MODES.includes(ranking)) {
+        return res.status(400).json({ error: `ranking must be one of ${RANKING_MODES.join(", ")}` });
+      }
 
-      const scriptPath = path.join(process.cwd(), "python_backend", "scholarship_matcher.py");
-      const result = await executePythonScript(scriptPath, { studentProfile });
+      const { result, source } = await runMatch(matcherPath, { studentProfile, bypassCache, ranking });
       
+      res.setHeader("X-Result-Cache", source);
       res.json(result);
     } catch (error) {
       console.error("Error matching scholarships:", error);
-      res.status(500).json({ error: error instanceof Error ? error.message : "Failed to match scholarships" });
+      res.status(errorStatus(error)).json({ error: error instanceof Error ? error.message : "Failed to match scholarships" });
     }
   });
 
-  // Generate essay endpoint
+  // Batch matching: JSONL profiles in (application/x-ndjson body, or a JSON array /
+  // {"profiles": [...]}), JSONL results streamed back, ending with a summary line
+  app.post("/api/match-scholarships/batch", (req, res) => {
+    if (!process.env.ANTHROPIC_API_KEY) {
+      return res.status(500).json({ error: "ANTHROPIC_API_KEY environment variable is required" });
+    }
+    if (parseInt(req.headers["content-length"] || "0", 10) > BATCH_MAX_BYTES) {
+      return res.status(413).json({ error: `Batch bodies are limited to ${BATCH_MAX_BYTES} bytes` });
+    }
+    if (batchRuns >= BATCH_MAX_RUNS) {
+      return res.status(503).json({ error: "Too many batch runs in progress, please try again shortly" });
+    }
+
+    batchRuns++;
+    const batchMatcherPath = path.join(process.cwd(), "python_backend", "batch_matcher.py");
+    const python = spawn("python3", [batchMatcherPath], {
+      env: process.env
+    });
+    let finished = false;
+    let tooLarge = false;
+
+    res.writeHead(200, { "Content-Type": "application/x-ndjson" });
+    python.stdout.pipe(res, { end: false });
+    python.stderr.on("data", (data) => {
+      process.stderr.write(data);
+    });
+
+    python.on("close", (code) => {
+      finished = true;
+      batchRuns--;
+      if (tooLarge) {
+        res.write(JSON.stringify({ type: "error", error: `Batch bodies are limited to ${BATCH_MAX_BYTES} bytes` }) + "\n");
+      } else if (code !== 0) {
+        res.write(JSON.stringify({ type: "error", error: `Batch matcher exited with code ${code}` }) + "\n");
+      }
+      res.end();
+    });
+
+    // Stop spending on a run nobody is listening to anymore
+    res.on("close", () => {
+      if (!finished) {
+        python.kill();
+      }
+    });
+
+    if (req.is("application/json")) {
+      const profiles = Array.isArray(req.body) ? req.body : req.body?.profiles ?? [];
+      for (const profile of profiles) {
+        python.stdin.write(JSON.stringify(profile) + "\n");
+      }
+      python.stdin.end();
+    } else {
+      // Without a Content-Length the size is only known as the body arrives
+      let received = 0;
+      req.on("data", (chunk: Buffer) => {
+        received += chunk.length;
+        if (received > BATCH_MAX_BYTES && !tooLarge && !finished) {
+          tooLarge = true;
+          req.unpipe(python.stdin);
+          python.kill();
+        }
+      });
+      req.pipe(python.stdin);
+    }
+  });
+
+  // Generate essay endpoint. A profileId from a match result can stand in for the
+  // student profile; either way the profile's analysis is reused from the match.
   app.post("/api/generate-essay", async (req, res) => {
     try {
-      const { scholarshipDescription, studentProfile } = req.body;
+      const { scholarshipDescription, studentProfile, profileId, bypassCache, drafts, lane } = req.body;
       
-      if (!scholarshipDescription || !studentProfile) {
+      if (!scholarshipDescription || !(studentProfile || profileId)) {
         return res.status(400).json({ error: "Scholarship description and student profile are required" });
       }
+      if (!validDrafts(drafts)) {
+        return res.status(400).json({ error: `drafts must be an integer from 1 to ${MAX_DRAFTS}` });
+      }
 
       // Extract scholarship name from description (first line or first 50 chars)
       const scholarshipName = scholarshipDescription.split("\n")[0].substring(0, 100);
       
-      const scriptPath = path.join(process.cwd(), "python_backend", "essay_generator.py");
-      const result = await executePythonScript(scriptPath, {
-        scholarshipDescription,
+      const job = await essayJobs.request("submit", {
+        payload: { scholarshipDescription, studentProfile, profileId, scholarshipName, bypassCache, drafts },
+        userId: requesterId(req),
+        lane,
+      });
+      if (job.rejected) {
+        return res.status(job.status).json({ error: job.rejected });
+      }
+
+      res.status(202).location(`/api/jobs/${job.id}`).json(job);
+    } catch (error) {
+      console.error("Error queueing essay:", error);
+      res.status(errorStatus(error)).json({ error: error instanceof Error ? error.message : "Failed to queue essay" });
+    }
+  });
+
+  // Essay job status; the result (or error) is included once the job has finished
+  app.get("/api/jobs/:id", async (req, res) => {
+    try {
+      const { job } = await essayJobs.request("get", { jobId: req.params.id });
+      if (!job) {
+        return res.status(404).json({ error: "Unknown or expired job" });
+      }
+      res.json(job);
+    } catch (error) {
+      res.status(errorStatus(error)).json({ error: error instanceof Error ? error.message : "Failed to read job" });
+    }
+  });
+
+  // Cancel a job that hasn't started yet
+  app.delete("/api/jobs/:id", async (req, res) => {
+    try {
+      const { job } = await essayJobs.request("cancel", { jobId: req.params.id });
+      if (!job) {
+        return res.status(404).json({ error: "Unknown or expired job" });
+      }
+      res.status(job.status === "cancelled" ? 200 : 409).json(job);
+    } catch (error) {
+      res.status(errorStatus(error)).json({ error: error instanceof Error ? error.message : "Failed to cancel job" });
+    }
+  });
+
+  // Job status as Server-Sent Events: the current state, then one "job" event per
+  // change until it finishes
+  app.get("/api/jobs/:id/events", async (req, res) => {
+    const jobId = req.params.id;
+    // Subscribe before reading the current state, so a change in between isn't lost
+    let missed: EssayJob[] | null = [];
+    let finished = false;
+    const send = (update: EssayJob) => {
+      if (finished) return;
+      res.write(`event: job\ndata: ${JSON.stringify(update)}\n\n`);
+      if (FINISHED_STATUSES.includes(update.status)) {
+        stop();
+        res.end();
+      }
+    };
+    const onJob = (update: EssayJob) => {
+      if (update.id !== jobId) return;
+      if (missed) missed.push(update);
+      else send(update);
+    };
+    const stop = () => {
+      finished = true;
+      essayJobs.off("job", onJob);
+    };
+    essayJobs.on("job", onJob);
+    req.on("close", stop);
+
+    let job: EssayJob | null;
+    try {
+      ({ job } = await essayJobs.request("get", { jobId }));
+    } catch (error) {
+      stop();
+      return res.status(errorStatus(error)).json({ error: error instanceof Error ? error.message : "Failed to read job" });
+    }
+    if (!job) {
+      stop();
+      return res.status(404).json({ error: "Unknown or expired job" });
+    }
+
+    res.writeHead(200, {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache",
+      Connection: "keep-alive",
+    });
+    res.flushHeaders();
+
+    send(job);
+    for (const update of missed.splice(0)) send(update);
+    missed = null;
+  });
+
+  // Streaming essay endpoint: relays stage and token events as Server-Sent Events,
+  // finishing with a "result" (or "error") event carrying the full essay result
+  app.post("/api/generate-essay/stream", async (req, res) => {
+    const { scholarshipDescription, studentProfile, profileId, bypassCache, drafts } = req.body;
+
+    if (!scholarshipDescription || !(studentProfile || profileId)) {
+      return res.status(400).json({ error: "Scholarship description and student profile are required" });
+    }
+    // One draft is streamed as it is written; multi-draft review only works on whole drafts
+    if (drafts !== undefined && drafts !== null && drafts !== 1) {
+      return res.status(400).json({ error: "drafts must be 1 when streaming; use /api/generate-essay for more" });
+    }
+
+    const scholarshipName = scholarshipDescription.split("\n")[0].substring(0, 100);
+
+    res.writeHead(200, {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache",
+      Connection: "keep-alive",
+    });
+    res.flushHeaders();
+
+    // The request body has already been read, so only the response reports the client
+    // going away. Cancel the generation then rather than keep paying for it.
+    let clientGone = false;
+    const abort = new AbortController();
+    res.on("close", () => {
+      if (!res.writableEnded) {
+        clientGone = true;
+        abort.abort();
+      }
+    });
+
+    const sendEvent = (event: string, data: any) => {
+      if (!clientGone) {
+        res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+      }
+    };
+
+    try {
+      const result = await runPipeline(
+        "essay_stream",
+        essayGeneratorPath,
+        { scholarshipDescription, studentProfile, profileId, scholarshipName, bypassCache, stream: true },
+        (event) => sendEvent(event.type, event),
+        abort.signal,
+      );
+      sendEvent("result", result);
+    } catch (error) {
+      if (clientGone) {
+        console.error("Essay stream cancelled: the client disconnected");
+        return;
+      }
+      console.error("Error streaming essay:", error);
+      sendEvent("error", { error: error instanceof Error ? error.message : "Failed to generate essay" });
+    }
+    res.end();
+  });
+
+  // Match, then draft an essay for each of the top N matches concurrently. The essays
+  // reuse the profile analysis from the match (see python_backend/profile_artifacts.py).
+  app.post("/api/match-and-draft", async (req, res) => {
+    try {
+      const { studentProfile, bypassCache, drafts, ranking } = req.body;
+      const topN = Math.min(Math.max(parseInt(req.body.topN ?? "3", 10) || 3, 1), 5);
+
+      if (!studentProfile) {
+        return res.status(400).json({ error: "Student profile is required" });
+      }
+      if (ranking !== undefined && !RANKING_MODES.includes(ranking)) {
+        return res.status(400).json({ error: `ranking must be one of ${RANKING_MODES.join(", ")}` });
+      }
+      if (!validDrafts(drafts)) {
+        return res.status(400).json({ error: `drafts must be an integer from 1 to ${MAX_DRAFTS}` });
+      }
+
+      const { result: match } = await runMatch(matcherPath, { studentProfile, bypassCache, ranking });
+      const top = (match.matches ?? []).slice(0, topN);
+      if (top.length === 0) {
+        return res.json({ ...match, essays: [] });
+      }
+
+      const scholarships = top.map((m: any) => ({ name: m.scholarship, description: m.full_text ?? "" }));
+      const drafted = await runPipeline("match_draft", essayGeneratorPath, {
+        scholarships,
         studentProfile,
-        scholarshipName
+        bypassCache,
+        drafts,
+      });
+
+      res.json({
+        profileId: match.profileId,
+        matches: match.matches,
+        essays: drafted.essays,
+        strategy_map_version: drafted.strategy_map_version,
+        trace: { match: match.trace, essays: drafted.trace },
       });
-      
-      res.json(result);
     } catch (error) {
-      console.error("Error generating essay:", error);
-      res.status(500).json({ error: error instanceof Error ? error.message : "Failed to generate essay" });
+      console.error("Error in match and draft:", error);
+      res.status(errorStatus(error)).json({ error: error instanceof Error ? error.message : "Failed to match and draft" });
     }
   });
 
+  // Prometheus scrape endpoint
+  app.get("/api/metrics", async (_req, res) => {
+    if (!metricsEnabled) {
+      return res.status(404).json({ error: "Metrics are disabled" });
+    }
+
+    const poolStats = Array.from(pythonPools).map(
+      ([scriptPath, pool]) => [path.basename(scriptPath, ".py"), pool.stats()] as const,
+    );
+    const poolGauge = (name: string, help: string, field: "ready" | "busy" | "queued") => ({
+      name,
+      help,
+      values: poolStats.map(([script, stats]) => [{ script }, stats[field]] as [Record<string, string>, number]),
+    });
+
+    // Job counts by lane; left out if the runner isn't up
+    const jobStats = await essayJobs.request("stats").catch(() => null);
+    const jobGauge = (name: string, help: string, status: "queued" | "running") => ({
+      name,
+      help,
+      values: Object.entries(jobStats?.[status] ?? {}).map(
+        ([lane, count]) => [{ lane }, count] as [Record<string, string>, number],
+      ),
+    });
+
+    res.type("text/plain; version=0.0.4").send(renderMetrics([
+      poolGauge("python_workers_ready", "Warm Python workers ready for requests", "ready"),
+      poolGauge("python_workers_busy", "Python workers currently handling a request", "busy"),
+      poolGauge("python_worker_queue_depth", "Requests waiting for a Python worker", "queued"),
+      { name: "match_result_cache_entries", help: "Match results held in the result cache", values: [[{}, matchResults.size]] },
+      { name: "match_requests_in_flight", help: "Distinct match computations running (identical requests share one)", values: [[{}, matchResults.pending]] },
+      jobGauge("essay_jobs_queued", "Essay jobs waiting to run, by lane", "queued"),
+      jobGauge("essay_jobs_running", "Essay jobs being generated, by lane", "running"),
+    ]));
+  });
+
   const httpServer = createServer(app);
   return httpServer;
 }
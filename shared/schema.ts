@@ -70,4 +70,13 @@ export type GenerateEssayRequest = {
   studentProfile: StudentProfile;
 };
 
-export type GenerateEssayResponse = EssayResult;
+// POST /api/generate-essay queues a job; poll GET /api/jobs/:id until it finishes
+export type EssayJobStatus = "queued" | "running" | "succeeded" | "failed" | "cancelled";
+
+export type GenerateEssayResponse = {
+  id: string;
+  status: EssayJobStatus;
+  position?: number;
+  result?: EssayResult;
+  error?: string;
+};